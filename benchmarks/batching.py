@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import random
+from mock import patch
+
+import cloud4rpi
+from benchmarks.common import TOKEN, timed, report
+from benchmarks.fake_mqtt import FakeClient
+
+SAMPLES = 6000
+
+
+def create_device():
+    client = FakeClient()
+    with patch('cloud4rpi.mqtt_api.mqtt.Client', return_value=client):
+        api = cloud4rpi.MqttApi(TOKEN)
+    api.connect()
+    device = cloud4rpi.Device(api)
+    device.declare({
+        'Temp {0}'.format(i): {
+            'type': 'numeric',
+            'bind': lambda: round(random.uniform(20, 30), 2)
+        } for i in range(8)
+    })
+    return device, client
+
+
+def run(batch_size):
+    device, client = create_device()
+    if batch_size:
+        device.set_batching(size=batch_size)
+
+    def publish():
+        for _ in range(SAMPLES):
+            device.publish_data()
+        device.flush()
+
+    elapsed = timed(publish)
+    report('publish_data',
+           batch_size=batch_size or 1,
+           samples_per_sec=SAMPLES / elapsed,
+           messages=client.messages,
+           bytes_per_sample=float(client.bytes) / SAMPLES)
+
+
+def main():
+    for batch_size in (None, 10, 60):
+        run(batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+import socket
+import struct
+import selectors
+import threading
+from collections import deque
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+CONNACK_ACCEPTED = 0
+CONNACK_NOT_AUTHORIZED = 5
+
+
+def encode_length(length):
+    out = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def packet(kind, body=b'', flags=0):
+    return bytes(bytearray([kind << 4 | flags])) + \
+        encode_length(len(body)) + body
+
+
+def read_string(data, offset):
+    (length,) = struct.unpack_from('>H', data, offset)
+    offset += 2
+    return data[offset:offset + length].decode('utf-8'), offset + length
+
+
+class Connection(object):
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbox = bytearray()
+        self.outbox = bytearray()
+        self.client_id = None
+        self.subscriptions = set()
+
+
+class Broker(object):
+    # A minimal MQTT 3.1.1 broker for offline benchmarks and tests: accepts
+    # CONNECT, SUBSCRIBE and QoS 0/1 PUBLISH from many clients on one thread
+    # and routes messages to subscribers of the exact topic.
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.__selector = selectors.DefaultSelector()
+        self.__server = socket.socket()
+        self.__server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__server.bind((host, port))
+        self.__server.listen(1024)
+        self.__server.setblocking(False)
+        self.__selector.register(self.__server, selectors.EVENT_READ)
+        self.__wakeup_r, self.__wakeup_w = socket.socketpair()
+        self.__wakeup_r.setblocking(False)
+        self.__wakeup_w.setblocking(False)
+        self.__selector.register(self.__wakeup_r, selectors.EVENT_READ)
+        self.__calls = deque()
+        self.__connections = {}
+        self.__stopped = threading.Event()
+        self.__thread = None
+        self.host, self.port = self.__server.getsockname()
+        self.connects = 0
+        self.messages = 0
+        self.bytes = 0
+        self.refuse = False
+        self.puback = True
+        self.connack_delay = 0  # sec
+        self.on_connect = None
+        self.on_message = None
+
+    @property
+    def clients(self):
+        return len(self.__connections)
+
+    def subscribers(self, topic):
+        return sum(1 for conn in list(self.__connections.values())
+                   if topic in conn.subscriptions)
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__stopped.set()
+        self.__wake()
+        if self.__thread is not None:
+            self.__thread.join()
+        for conn in list(self.__connections.values()):
+            self.__close(conn)
+        self.__server.close()
+
+    def publish(self, topic, payload):
+        self.__call(self.__route, topic, payload)
+
+    def drop_connections(self):
+        def drop():
+            for conn in list(self.__connections.values()):
+                self.__close(conn)
+        self.__call(drop)
+
+    def __call(self, fn, *args):
+        self.__calls.append((fn, args))
+        self.__wake()
+
+    def __wake(self):
+        try:
+            self.__wakeup_w.send(b'x')
+        except (BlockingIOError, OSError):
+            pass
+
+    def serve_forever(self):
+        while not self.__stopped.is_set():
+            for key, mask in self.__selector.select(1):
+                if key.fileobj is self.__server:
+                    self.__accept()
+                elif key.fileobj is self.__wakeup_r:
+                    self.__drain_calls()
+                else:
+                    self.__handle(key.data, mask)
+
+    def __drain_calls(self):
+        try:
+            self.__wakeup_r.recv(4096)
+        except (BlockingIOError, OSError):
+            pass
+        while self.__calls:
+            fn, args = self.__calls.popleft()
+            fn(*args)
+
+    def __accept(self):
+        try:
+            sock, _ = self.__server.accept()
+        except (BlockingIOError, OSError):
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = Connection(sock)
+        self.__connections[sock.fileno()] = conn
+        self.__selector.register(sock, selectors.EVENT_READ, conn)
+
+    def __close(self, conn):
+        if self.__connections.pop(conn.sock.fileno(), None) is None:
+            return
+        self.__selector.unregister(conn.sock)
+        conn.sock.close()
+
+    def __handle(self, conn, mask):
+        if mask & selectors.EVENT_WRITE:
+            self.__flush(conn)
+        if mask & selectors.EVENT_READ:
+            try:
+                data = conn.sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                data = b''
+            if not data:
+                self.__close(conn)
+                return
+            conn.inbox += data
+            self.__parse(conn)
+
+    def __parse(self, conn):
+        while conn.sock.fileno() in self.__connections:
+            data = conn.inbox
+            if len(data) < 2:
+                return
+            length, multiplier, offset = 0, 1, 1
+            while True:
+                if offset >= len(data):
+                    return
+                byte = data[offset]
+                length += (byte & 0x7f) * multiplier
+                multiplier *= 128
+                offset += 1
+                if not byte & 0x80:
+                    break
+            if len(data) < offset + length:
+                return
+            header = data[0]
+            body = bytes(data[offset:offset + length])
+            del data[:offset + length]
+            self.__dispatch(conn, header >> 4, header & 0x0f, body)
+
+    def __refuses(self, client_id):
+        # refuse is either a flag for every client or a set of client ids
+        if isinstance(self.refuse, bool):
+            return self.refuse
+        return client_id in (self.refuse or ())
+
+    def __dispatch(self, conn, kind, flags, body):
+        if kind == CONNECT:
+            self.connects += 1
+            _, offset = read_string(body, 0)  # protocol name
+            conn.client_id, _ = read_string(body, offset + 4)
+            rc = CONNACK_NOT_AUTHORIZED if self.__refuses(conn.client_id) \
+                else CONNACK_ACCEPTED
+            connack = packet(CONNACK, bytes(bytearray([0, rc])))
+            if self.connack_delay:
+                timer = threading.Timer(self.connack_delay, self.__call,
+                                        (self.__send, conn, connack))
+                timer.daemon = True
+                timer.start()
+            else:
+                self.__send(conn, connack)
+            if self.on_connect is not None:
+                self.on_connect(conn.client_id)
+        elif kind == PUBLISH:
+            qos = (flags >> 1) & 3
+            topic, offset = read_string(body, 0)
+            if qos:
+                if self.puback:
+                    self.__send(conn, packet(PUBACK,
+                                             body[offset:offset + 2]))
+                offset += 2
+            payload = body[offset:]
+            self.messages += 1
+            self.bytes += len(body)
+            self.__route(topic, payload)
+            if self.on_message is not None:
+                self.on_message(conn.client_id, topic, payload)
+        elif kind == SUBSCRIBE:
+            offset, granted = 2, bytearray()
+            while offset < len(body):
+                topic, offset = read_string(body, offset)
+                conn.subscriptions.add(topic)
+                granted.append(min(body[offset], 1))
+                offset += 1
+            self.__send(conn, packet(SUBACK, body[:2] + bytes(granted)))
+        elif kind == PINGREQ:
+            self.__send(conn, packet(PINGRESP))
+        elif kind == DISCONNECT:
+            self.__close(conn)
+
+    def __route(self, topic, payload):
+        message = None
+        for conn in list(self.__connections.values()):
+            if topic in conn.subscriptions:
+                if message is None:
+                    body = struct.pack('>H', len(topic)) + \
+                        topic.encode('utf-8') + payload
+                    message = packet(PUBLISH, body)
+                self.__send(conn, message)
+
+    def __send(self, conn, data):
+        pending = bool(conn.outbox)
+        conn.outbox += data
+        if not pending:
+            self.__flush(conn)
+
+    def __flush(self, conn):
+        try:
+            sent = conn.sock.send(conn.outbox)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self.__close(conn)
+            return
+        del conn.outbox[:sent]
+        events = selectors.EVENT_READ
+        if conn.outbox:
+            events |= selectors.EVENT_WRITE
+        self.__selector.modify(conn.sock, events, conn)
+
+
+def serve(pipe):
+    # Entry point for running the broker in a separate process: sends the
+    # port back, serves until the pipe is closed and reports the counters.
+    broker = Broker().start()
+    pipe.send(broker.port)
+    try:
+        pipe.recv()
+    except EOFError:
+        pass
+    pipe.send({'connects': broker.connects, 'messages': broker.messages,
+               'bytes': broker.bytes})
+    broker.stop()
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+import logging
+import platform
+from timeit import default_timer
+
+import cloud4rpi
+
+TOKEN = '4GPZFMVuacadesU21dBw47zJi'
+
+cloud4rpi.set_logging_level(logging.WARNING)
+
+
+def timed(fn, number=1):
+    start = default_timer()
+    for _ in range(number):
+        fn()
+    return default_timer() - start
+
+
+def report(benchmark, **results):
+    results['benchmark'] = benchmark
+    results['python'] = platform.python_version()
+    sys.stdout.write(json.dumps(results, sort_keys=True) + '\n')
+
+
+BASE58 = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+
+def device_token(i):
+    # A valid, distinct token per simulated device
+    digits = []
+    for _ in range(5):
+        i, digit = divmod(i, len(BASE58))
+        digits.append(BASE58[digit])
+    return TOKEN[:20] + ''.join(digits)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import random
+from mock import patch
+
+import cloud4rpi
+from benchmarks.common import TOKEN, timed, report
+from benchmarks.fake_mqtt import FakeClient
+
+SAMPLES = 3600  # an hour at 1 Hz
+
+
+class Trace(object):
+    # Slow drifting climate readings with sensor noise, a door that opens
+    # a few times an hour and a mostly idle status string.
+    def __init__(self, seed=1):
+        self.random = random.Random(seed)
+        self.temp = 21.0
+        self.humidity = 45.0
+        self.door = False
+        self.status = 'idle'
+
+    def step(self):
+        r = self.random
+        self.temp += r.gauss(0, 0.02)
+        self.humidity += r.gauss(0, 0.05)
+        if r.random() < 0.002:
+            self.door = not self.door
+        if r.random() < 0.001:
+            self.status = r.choice(['idle', 'heating', 'cooling'])
+
+
+def variables(trace, filtered):
+    def option(**kwargs):
+        return kwargs if filtered else {}
+
+    return {
+        'Temperature': dict(type='numeric',
+                            bind=lambda: round(trace.temp, 2),
+                            **option(deadband=0.1)),
+        'Humidity': dict(type='numeric',
+                         bind=lambda: round(trace.humidity, 1),
+                         **option(deadband_percent=2)),
+        'Door': dict(type='bool',
+                     bind=lambda: trace.door,
+                     **option(on_change=True)),
+        'Status': dict(type='string',
+                       bind=lambda: trace.status,
+                       **option(on_change=True)),
+    }
+
+
+def run(filtered):
+    client = FakeClient()
+    with patch('cloud4rpi.mqtt_api.mqtt.Client', return_value=client):
+        api = cloud4rpi.MqttApi(TOKEN)
+    api.connect()
+    device = cloud4rpi.Device(api)
+    trace = Trace()
+    device.declare(variables(trace, filtered))
+    if filtered:
+        device.set_keyframe_interval(600)
+
+    def publish():
+        for _ in range(SAMPLES):
+            trace.step()
+            device.publish_data()
+
+    elapsed = timed(publish)
+    report('publish_data_changes',
+           filtered=filtered,
+           samples_per_sec=SAMPLES / elapsed,
+           messages=client.messages,
+           bytes=client.bytes)
+
+
+def main():
+    run(False)
+    run(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import json
+import random
+import threading
+from mock import patch
+
+import cloud4rpi
+from benchmarks.common import TOKEN, timed, report
+from benchmarks.fake_mqtt import FakeClient
+
+SIZES = (1, 10, 100, 1000)
+TYPES = ('numeric', 'bool', 'string', 'location', 'mixed')
+VALUE_TYPES = ('numeric', 'bool', 'string', 'location')
+CONNECTS = 20
+CONNACK_DELAY = .001  # sec
+
+
+def value_type(kind, i):
+    return VALUE_TYPES[i % len(VALUE_TYPES)] if kind == 'mixed' else kind
+
+
+def make_value(var_type, rnd):
+    if var_type == 'numeric':
+        return rnd.random() * 100
+    if var_type == 'bool':
+        return rnd.random() > .5
+    if var_type == 'string':
+        return 'state {0}'.format(rnd.randint(0, 9))
+    return {'lat': rnd.random() * 90, 'lng': rnd.random() * 180}
+
+
+def variables(count, kind):
+    rnd = random.Random(count)
+
+    def binding(var_type):
+        def bind(value=None):
+            return make_value(var_type, rnd) if value is None else value
+        return bind
+
+    result = {}
+    for i in range(count):
+        var_type = value_type(kind, i)
+        result['Var {0}'.format(i)] = {
+            'type': var_type,
+            'bind': binding(var_type),
+        }
+    return result
+
+
+def diag(count):
+    return {'Diag {0}'.format(i): (lambda: 'ok') if i % 2 else i
+            for i in range(count)}
+
+
+def command(count, kind):
+    rnd = random.Random(-count)
+    cmd = {'Var {0}'.format(i): make_value(value_type(kind, i), rnd)
+           for i in range(count)}
+    return json.dumps(cmd).encode('utf-8')
+
+
+def create_api():
+    client = FakeClient()
+    with patch('cloud4rpi.mqtt_api.mqtt.Client', return_value=client):
+        api = cloud4rpi.MqttApi(TOKEN)
+    return api, client
+
+
+def run_device(count, kind, number):
+    api, client = create_api()
+    api.connect()
+    device = cloud4rpi.Device(api)
+    declared = variables(count, kind)
+    payload = command(count, kind)
+
+    declare = timed(lambda: device.declare(declared), number) / number
+    device.declare_diag(diag(count))
+    read_data = timed(device.read_data, number) / number
+    read_diag = timed(device.read_diag, number) / number
+    publish_data = timed(device.publish_data, number) / number
+    on_command = timed(lambda: client.deliver(api.commands_topic, payload),
+                       number) / number
+
+    report('device',
+           variables=count,
+           types=kind,
+           declare_us=declare * 1e6,
+           read_data_us=read_data * 1e6,
+           read_diag_us=read_diag * 1e6,
+           publish_data_us=publish_data * 1e6,
+           on_command_us=on_command * 1e6)
+
+
+def connect_latency(api, client):
+    connected = threading.Event()
+    api.on_connected = lambda rc: connected.set()
+
+    def reconnect():
+        connected.clear()
+        client.on_disconnect(client, None, 1)
+        connected.wait()
+
+    return timed(api.connect, CONNECTS) / CONNECTS, \
+        timed(reconnect, CONNECTS) / CONNECTS
+
+
+def run_connect():
+    # CONNACK comes from another thread, as from paho's network loop
+    with patch.object(FakeClient, 'connack_delay', CONNACK_DELAY):
+        connect, reconnect = connect_latency(*create_api())
+
+    report('connect',
+           connack_delay_ms=CONNACK_DELAY * 1e3,
+           connect_ms=connect * 1e3,
+           reconnect_ms=reconnect * 1e3)
+
+
+def main():
+    for count in SIZES:
+        for kind in TYPES:
+            run_device(count, kind, max(10, 5000 // count))
+    run_connect()
+
+
+if __name__ == '__main__':
+    main()
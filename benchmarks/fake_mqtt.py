@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+# MQTT v3.1.1: fixed header, topic length, packet identifier
+PUBLISH_OVERHEAD = 2 + 2 + 2
+PUBACK_SIZE = 4
+
+
+def ignore(*args):
+    pass
+
+
+class Message(object):
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class FakeClient(object):
+    # Stands in for paho.mqtt.client.Client: accepts every packet and
+    # acknowledges it on the next call, as a broker on localhost would.
+    # With connack_delay set, CONNACK arrives on another thread after that
+    # many seconds, as it does from paho's network thread.
+    connack_delay = None
+
+    def __init__(self, *args, **kwargs):
+        self.on_connect = ignore
+        self.on_message = ignore
+        self.on_disconnect = ignore
+        self.on_publish = ignore
+        self.messages = 0
+        self.bytes = 0
+        self.__mid = 0
+        self.__unacked = []
+
+    def tls_set(self, **kwargs):
+        pass
+
+    def connect(self, host, port=1883, keepalive=60):
+        self.__connack()
+
+    def socket(self):
+        return None
+
+    def __connack(self):
+        if self.connack_delay is None:
+            self.on_connect(self, None, {}, 0)
+            return
+        timer = threading.Timer(self.connack_delay, self.on_connect,
+                                (self, None, {}, 0))
+        timer.daemon = True
+        timer.start()
+
+    def reconnect(self):
+        self.__connack()
+
+    def disconnect(self):
+        pass
+
+    def subscribe(self, topic, qos=0):
+        return 0, 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.ack()
+        self.__mid += 1
+        self.messages += 1
+        self.bytes += PUBLISH_OVERHEAD + PUBACK_SIZE + \
+            len(topic) + len(payload)
+        self.__unacked.append(self.__mid)
+        return 0, self.__mid
+
+    def ack(self):
+        unacked, self.__unacked = self.__unacked, []
+        for mid in unacked:
+            self.on_publish(self, None, mid)
+
+    def deliver(self, topic, payload):
+        self.on_message(self, None, Message(topic, payload))
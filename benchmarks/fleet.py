@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+import multiprocessing
+
+import cloud4rpi
+from cloud4rpi.fleet import DeviceFleet
+from cloud4rpi.scheduler import Scheduler
+from benchmarks import broker
+from benchmarks.common import device_token, report
+
+SIZES = (10, 100, 1000)
+MODES = ('fleet', 'threads')
+DURATION = 5  # sec
+DATA_INTERVAL = 1  # sec
+CONNECT_TIMEOUT = 30  # sec
+
+VARIABLES = {
+    'Temperature': {'type': 'numeric', 'bind': lambda: 21.37},
+    'Pump': {'type': 'bool', 'bind': lambda value: value},
+    'Status': {'type': 'string', 'bind': lambda: 'running'},
+}
+
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def wait_for(condition, timeout=CONNECT_TIMEOUT):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(.05)
+
+
+def fleet_devices(port, count):
+    fleet = DeviceFleet('127.0.0.1', port)
+    for i in range(count):
+        fleet.add(device_token(i)).declare(VARIABLES)
+    fleet.connect(CONNECT_TIMEOUT)
+    return fleet.devices, fleet.connected
+
+
+def threaded_devices(port, count):
+    # One MqttApi per device, each with its own paho network thread
+    apis = [cloud4rpi.MqttApi(device_token(i), '127.0.0.1', port)
+            for i in range(count)]
+    devices = []
+    for api in apis:
+        api.begin_connect()
+        device = cloud4rpi.Device(api)
+        device.declare(VARIABLES)
+        devices.append(device)
+    wait_for(lambda: all(api.connected for api in apis))
+    # paho's network threads select() on their sockets, so clients whose
+    # descriptors are past FD_SETSIZE never see their CONNACK.
+    return devices, sum(1 for api in apis if api.connected)
+
+
+def measure(mode, count, port, results):
+    rss_before = rss_kb()
+    create = fleet_devices if mode == 'fleet' else threaded_devices
+    devices, connected = create(port, count)
+
+    scheduler = Scheduler()
+    for i, device in enumerate(devices):
+        scheduler.add(device.publish_data, DATA_INTERVAL,
+                      delay=DATA_INTERVAL * float(i) / count)
+    timer = threading.Timer(DURATION, scheduler.stop)
+    timer.start()
+
+    start = time.process_time()
+    scheduler.run()
+    cpu = time.process_time() - start
+
+    results.send({
+        'connected': connected,
+        'rss_kb': rss_kb(),
+        'rss_kb_per_device': float(rss_kb() - rss_before) / count,
+        'threads': threading.active_count(),
+        'cpu_percent': cpu * 100 / DURATION,
+    })
+
+
+def run(mode, count, port):
+    context = multiprocessing.get_context('spawn')
+    parent, child = context.Pipe()
+    process = context.Process(target=measure,
+                              args=(mode, count, port, child))
+    process.start()
+    results = parent.recv()
+    process.join()
+    report('fleet', mode=mode, devices=count, **results)
+
+
+def main():
+    context = multiprocessing.get_context('spawn')
+    parent, child = context.Pipe()
+    server = context.Process(target=broker.serve, args=(child,))
+    server.start()
+    port = parent.recv()
+    try:
+        for count in SIZES:
+            for mode in MODES:
+                run(mode, count, port)
+    finally:
+        parent.send('stop')
+        parent.recv()
+        server.join()
+
+
+if __name__ == '__main__':
+    main()
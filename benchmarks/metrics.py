@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+from mock import patch
+
+import cloud4rpi
+from cloud4rpi import prometheus
+from benchmarks.common import TOKEN, timed, report
+from benchmarks.device import variables
+from benchmarks.fake_mqtt import FakeClient
+
+SIZES = (1, 10, 100)
+
+
+def create_device(count, enabled):
+    with patch('cloud4rpi.mqtt_api.mqtt.Client', FakeClient):
+        api = cloud4rpi.MqttApi(TOKEN)
+        api.connect()
+    device = cloud4rpi.Device(api)
+    device.metrics.enabled = enabled
+    device.declare(variables(count, 'numeric'))
+    return device
+
+
+def run(count, enabled, number):
+    device = create_device(count, enabled)
+    read_data = timed(device.read_data, number) / number
+    publish_data = timed(device.publish_data, number) / number
+    results = {
+        'variables': count,
+        'metrics': enabled,
+        'read_data_us': read_data * 1e6,
+        'publish_data_us': publish_data * 1e6,
+    }
+    if enabled:
+        export = timed(lambda: prometheus.format_metrics(device.metrics),
+                       100) / 100
+        results['export_us'] = export * 1e6
+    report('metrics', **results)
+
+
+def main():
+    for count in SIZES:
+        for enabled in (False, True):
+            run(count, enabled, max(100, 20000 // count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import time
+from mock import patch
+
+import cloud4rpi
+from cloud4rpi.payload_codecs import CODECS, get_codec
+from benchmarks.common import TOKEN, report
+from benchmarks.fake_mqtt import FakeClient
+
+PUBLISHES = 5000
+
+VARIABLES = {
+    'Room Temperature': {'type': 'numeric', 'bind': lambda: 21.37},
+    'Outside Temperature': {'type': 'numeric', 'bind': lambda: -3.5},
+    'Relative Humidity': {'type': 'numeric', 'bind': lambda: 45.2},
+    'Atmospheric Pressure': {'type': 'numeric', 'bind': lambda: 1013.25},
+    'Heater': {'type': 'bool', 'bind': lambda: True},
+    'Front Door Open': {'type': 'bool', 'bind': lambda: False},
+    'Boiler Status': {'type': 'string', 'bind': lambda: 'heating'},
+    'Location': {'type': 'location',
+                 'bind': lambda: {'lat': 37.89, 'lng': 75.43}},
+}
+
+
+def create_device(codec, batch_size):
+    client = FakeClient()
+    with patch('cloud4rpi.mqtt_api.mqtt.Client', return_value=client):
+        api = cloud4rpi.MqttApi(TOKEN, codec=codec)
+    api.connect()
+    device = cloud4rpi.Device(api)
+    device.declare(VARIABLES)
+    device.publish_config()
+    if batch_size:
+        device.set_batching(size=batch_size)
+    return device, client
+
+
+def run(name, names, batch_size=None):
+    device, client = create_device(get_codec(name, names=names), batch_size)
+    messages, sent = client.messages, client.bytes
+
+    start = time.process_time()
+    for _ in range(PUBLISHES):
+        device.publish_data()
+    cpu = time.process_time() - start
+
+    messages = client.messages - messages
+    report('payload_codecs',
+           codec=name,
+           names=names,
+           batch_size=batch_size or 1,
+           wire_bytes_per_sample=float(client.bytes - sent) / PUBLISHES,
+           wire_bytes_per_message=float(client.bytes - sent) / messages,
+           cpu_us_per_sample=cpu * 1e6 / PUBLISHES)
+
+
+def main():
+    for batch_size in (None, 10):
+        for name in CODECS:
+            for names in (False, True):
+                run(name, names, batch_size)
+
+
+if __name__ == '__main__':
+    main()
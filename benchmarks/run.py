@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+# Runs the benchmarks and prints their results as JSON lines:
+#
+#   python -m benchmarks.run > results.jsonl
+#   python -m benchmarks.run device schema
+#   python -m benchmarks.run --compare baseline.jsonl results.jsonl
+
+import sys
+import json
+import argparse
+import importlib
+
+BENCHMARKS = [
+    'device',
+    'schema',
+    'serializer',
+    'payload_codecs',
+    'batching',
+    'deadband',
+    'scheduler',
+    'fleet',
+    'sharding',
+    'metrics',
+    'startup',
+]
+
+# Integer results that identify a case rather than measure it
+PARAMETERS = ('variables', 'batch_size', 'devices', 'workers')
+
+# Metrics where more is worse
+COSTS = ('_us', '_ms', '_bytes', 'bytes_per_sample', 'bytes_per_message')
+
+THRESHOLD = .1
+
+
+def run(names):
+    for name in names:
+        module = importlib.import_module('benchmarks.' + name)
+        module.main()
+        sys.stdout.flush()
+
+
+def load(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def is_parameter(key, value):
+    if key == 'python':
+        return False
+    return isinstance(value, (bool, str)) or key in PARAMETERS
+
+
+def case(result):
+    return tuple(sorted((key, value) for key, value in result.items()
+                        if is_parameter(key, value)))
+
+
+def describe(result):
+    return ' '.join('{0}={1}'.format(key, value)
+                    for key, value in case(result))
+
+
+def compare(baseline, current, threshold=THRESHOLD):
+    previous = {case(result): result for result in baseline}
+    regressions = 0
+    for result in current:
+        before = previous.get(case(result), None)
+        if before is None:
+            continue
+        for key, value in sorted(result.items()):
+            old = before.get(key, None)
+            if not isinstance(value, float) or not old or \
+                    not key.endswith(COSTS):
+                continue
+            change = (value - old) / old
+            if change > threshold:
+                regressions += 1
+                sys.stdout.write('{0} {1}: {2:.4g} -> {3:.4g} ({4:+.0%})\n'
+                                 .format(describe(result), key, old, value,
+                                         change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run')
+    parser.add_argument('benchmarks', nargs='*', metavar='name',
+                        help='benchmarks to run: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='report costs that grew by more than the '
+                             'threshold between two result files')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(load(args.compare[0]), load(args.compare[1]),
+                              args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: ' + ', '.join(sorted(unknown)))
+    run(args.benchmarks or BENCHMARKS)
+
+
+if __name__ == '__main__':
+    main()
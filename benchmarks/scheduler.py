@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+
+from cloud4rpi.scheduler import Scheduler
+from benchmarks.common import report
+
+DURATION = 5  # sec
+DATA_INTERVAL = 0.2  # sec
+DIAG_INTERVAL = 1.3  # sec
+WORK = 0.03  # sec, time spent inside publish_data
+POLL_INTERVAL = 0.05  # sec, the polling loop from examples/minimal.py
+
+
+def polling_loop(publish_data, publish_diag, stopped):
+    # The hand-rolled loop the scheduler replaces
+    wakeups = 0
+    diag_timer = 0
+    data_timer = 0
+    while not stopped.is_set():
+        if data_timer <= 0:
+            publish_data()
+            data_timer = DATA_INTERVAL
+        if diag_timer <= 0:
+            publish_diag()
+            diag_timer = DIAG_INTERVAL
+        diag_timer -= POLL_INTERVAL
+        data_timer -= POLL_INTERVAL
+        time.sleep(POLL_INTERVAL)
+        wakeups += 1
+    return wakeups
+
+
+def run(name, loop):
+    runs = []
+
+    def publish_data():
+        runs.append(time.time())
+        time.sleep(WORK)
+
+    def publish_diag():
+        pass
+
+    started = time.time()
+    wakeups = loop(publish_data, publish_diag)
+    elapsed = time.time() - started
+
+    drift = [t - (runs[0] + i * DATA_INTERVAL) for i, t in enumerate(runs)]
+    report('scheduler',
+           loop=name,
+           runs=len(runs),
+           expected_runs=int(elapsed / DATA_INTERVAL),
+           final_drift=drift[-1],
+           max_abs_drift=max(abs(d) for d in drift),
+           wakeups_per_minute=wakeups * 60.0 / elapsed)
+
+
+def scheduled(publish_data, publish_diag):
+    scheduler = Scheduler()
+    scheduler.add(publish_data, DATA_INTERVAL)
+    scheduler.add(publish_diag, DIAG_INTERVAL)
+    threading.Timer(DURATION, scheduler.stop).start()
+    scheduler.run()
+    return scheduler.wakeups
+
+
+def polled(publish_data, publish_diag):
+    stopped = threading.Event()
+    threading.Timer(DURATION, stopped.set).start()
+    return polling_loop(publish_data, publish_diag, stopped)
+
+
+def main():
+    run('polling', polled)
+    run('scheduler', scheduled)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+from cloud4rpi import utils
+from cloud4rpi.device import Device
+from benchmarks.common import timed, report
+
+SIZES = (10, 100, 1000)
+TYPES = ('numeric', 'bool', 'string')
+
+
+class Sensor(object):
+    def __init__(self, value):
+        self.value = value
+
+    def read(self):
+        return self.value
+
+
+class NullApi(object):
+    on_command = None
+
+
+def variables(count):
+    rnd = random.Random(count)
+
+    def binding(i):
+        kind = i % 3
+        if kind == 0:
+            return Sensor(rnd.random())
+        if kind == 1:
+            return lambda: rnd.random() > 0.5
+        return lambda current: current
+
+    return {
+        'Var {0}'.format(i): {
+            'type': TYPES[i % len(TYPES)],
+            'value': 0,
+            'bind': binding(i)
+        } for i in range(count)
+    }
+
+
+def legacy_read_data(declared):
+    # read_data() as it was before declare() compiled the variables
+    for name, var in declared.items():
+        bind = var.get('bind', None)
+        if bind:
+            curr = var.get('value')
+            if hasattr(bind, 'read'):
+                result = bind.read()
+            else:
+                result = utils.resolve_callable(bind, curr)
+            var['value'] = utils.validate_variable_value(
+                name, var.get('type'), result)
+    return {name: var.get('value') for name, var in declared.items()}
+
+
+def run(count, number):
+    declared = variables(count)
+    device = Device(NullApi())
+
+    declare = timed(lambda: device.declare(declared), number) / number
+    read = timed(device.read_data, number) / number
+    legacy = timed(lambda: legacy_read_data(declared), number) / number
+
+    report('schema',
+           variables=count,
+           declare_us=declare * 1e6,
+           read_data_us=read * 1e6,
+           legacy_read_data_us=legacy * 1e6,
+           speedup=legacy / read)
+
+
+def main():
+    for count in SIZES:
+        run(count, max(10, 20000 // count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import json
+import tracemalloc
+from datetime import datetime
+from mock import patch
+
+import cloud4rpi
+from cloud4rpi import utils
+from cloud4rpi.serializer import SERIALIZERS, get_serializer
+from benchmarks.common import TOKEN, timed, report
+from benchmarks.fake_mqtt import FakeClient
+
+PUBLISHES = 20000
+
+PAYLOAD = {
+    'Temperature': 21.37,
+    'Humidity': 45.2,
+    'Pressure': 1013.25,
+    'Door': False,
+    'Status': 'heating',
+    'Location': {'lat': 37.89, 'lng': 75.43},
+}
+
+
+def create_api(serializer):
+    client = FakeClient()
+    with patch('cloud4rpi.mqtt_api.mqtt.Client', return_value=client):
+        api = cloud4rpi.MqttApi(TOKEN, serializer=serializer)
+    api.connect()
+    return api, client
+
+
+def legacy_publisher():
+    # MqttApi.__publish before the envelope was precomputed
+    _, client = create_api(None)
+
+    def publish():
+        msg = {
+            'ts': datetime.utcnow().replace(
+                tzinfo=utils.UtcTzInfo()).isoformat(),
+            'payload': PAYLOAD,
+        }
+        client.publish('devices/{0}/{1}'.format(TOKEN, 'data'),
+                       qos=1,
+                       payload=json.dumps(msg))
+
+    return publish
+
+
+def publisher(name):
+    api, _ = create_api(get_serializer(name))
+    return lambda: api.publish_data(PAYLOAD)
+
+
+def run(name, publish):
+    elapsed = timed(publish, PUBLISHES)
+
+    tracemalloc.start()
+    publish()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    report('serializer',
+           serializer=name,
+           publishes_per_sec=PUBLISHES / elapsed,
+           peak_bytes_per_publish=peak)
+
+
+def main():
+    run('legacy', legacy_publisher())
+    for name in SERIALIZERS:
+        try:
+            run(name, publisher(name))
+        except ImportError:
+            continue
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+import multiprocessing
+
+from cloud4rpi.sharding import ShardedFleet
+from benchmarks import broker
+from benchmarks.common import device_token, report
+
+DEVICES = 200
+DURATION = 5  # sec
+DATA_INTERVAL = .01  # sec
+CONNECT_TIMEOUT = 60  # sec
+
+VARIABLES = {
+    'Temperature': {'type': 'numeric', 'bind': lambda: 21.37},
+    'Pump': {'type': 'bool', 'bind': lambda value: value},
+    'Status': {'type': 'string', 'bind': lambda: 'running'},
+}
+
+
+def setup_device(device, token):
+    device.declare(VARIABLES)
+
+
+def worker_counts():
+    counts, count = [], 1
+    while count < multiprocessing.cpu_count():
+        counts.append(count)
+        count *= 2
+    return counts + [multiprocessing.cpu_count()]
+
+
+def measure(workers, port):
+    fleet = ShardedFleet('127.0.0.1', port, workers=workers,
+                         setup=setup_device)
+    for i in range(DEVICES):
+        fleet.add(device_token(i))
+    connected = fleet.start(CONNECT_TIMEOUT)
+
+    thread = threading.Thread(target=fleet.run,
+                              kwargs={'data_interval': DATA_INTERVAL,
+                                      'diag_interval': None})
+    thread.daemon = True
+    thread.start()
+    # Skip the ramp-up while the workers' schedulers start
+    time.sleep(1)
+    before, start = fleet.stats()['published'], time.time()
+    time.sleep(DURATION)
+    published = fleet.stats()['published'] - before
+    elapsed = time.time() - start
+    fleet.stop()
+
+    report('sharding', workers=workers, devices=DEVICES,
+           connected=connected,
+           messages_per_sec=published / elapsed)
+
+
+def main():
+    context = multiprocessing.get_context('spawn')
+    parent, child = context.Pipe()
+    server = context.Process(target=broker.serve, args=(child,))
+    server.start()
+    port = parent.recv()
+    try:
+        for workers in worker_counts():
+            measure(workers, port)
+    finally:
+        parent.send('stop')
+        parent.recv()
+        server.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import subprocess
+
+from benchmarks.broker import Broker
+from benchmarks.common import TOKEN, report
+
+RUNS = 10
+
+# Each case runs in a fresh interpreter and prints its own timing in ms
+IMPORT = '''
+import time
+start = time.time()
+import cloud4rpi
+print((time.time() - start) * 1e3)
+'''
+
+IMPORT_TRANSPORT = '''
+import time
+start = time.time()
+import cloud4rpi
+cloud4rpi.MqttApi
+print((time.time() - start) * 1e3)
+'''
+
+PUBLISH_ONCE = '''
+import time
+import logging
+start = time.time()
+import cloud4rpi
+cloud4rpi.set_logging_level(logging.WARNING)
+acked = cloud4rpi.publish_once({token!r}, {{'Temperature': 21.37}},
+                               host='127.0.0.1', port={port}, timeout=10)
+assert acked
+print((time.time() - start) * 1e3)
+'''
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def measure(script):
+    timings = []
+    for _ in range(RUNS):
+        out = subprocess.check_output([sys.executable, '-c', script])
+        timings.append(float(out.decode('utf-8').split()[-1]))
+    return median(timings)
+
+
+def main():
+    report('startup', case='import', time_ms=measure(IMPORT))
+    report('startup', case='import_transport',
+           time_ms=measure(IMPORT_TRANSPORT))
+
+    broker = Broker().start()
+    try:
+        script = PUBLISH_ONCE.format(token=TOKEN, port=broker.port)
+        report('startup', case='publish_once', time_ms=measure(script))
+    finally:
+        broker.stop()
+
+
+if __name__ == '__main__':
+    main()
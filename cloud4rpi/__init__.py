@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import sys
 import time
 import logging
+import threading
+import importlib
+from functools import partial
+from concurrent import futures
 from logging import StreamHandler, Formatter
-from logging.handlers import RotatingFileHandler
 
 from cloud4rpi.version import __version__
 from cloud4rpi.config import mqqtBrokerHost
@@ -11,43 +15,175 @@ from cloud4rpi.config import mqttBrokerPort, mqttsBrokerPort
 from cloud4rpi.config import loggerName
 
 from cloud4rpi.device import Device
-from cloud4rpi.mqtt_api import MqttApi
+from cloud4rpi.scheduler import Scheduler, OVERRUN_SKIP
+from cloud4rpi.aggregate import SAMPLE_INTERVAL
 from cloud4rpi.errors import get_error_message
 
+PUBLISH_ONCE_TIMEOUT = 30  # sec
+
+# Imported on first use: the MQTT transport alone (paho, ssl, urllib) takes
+# longer to import than the rest of the package
+LAZY_ATTRIBUTES = {
+    'MqttApi': 'cloud4rpi.mqtt_api',
+    'CONNECT_TIMEOUT': 'cloud4rpi.mqtt_api',
+    'Outbox': 'cloud4rpi.outbox',
+    'RETRY_INTERVAL': 'cloud4rpi.network',
+    'backoff': 'cloud4rpi.network',
+}
+
 log = logging.getLogger(loggerName)
 log.setLevel(logging.INFO)
-log.addHandler(StreamHandler())
+
+
+def __getattr__(name):
+    module = LAZY_ATTRIBUTES.get(name, None)
+    if module is None:
+        raise AttributeError('module {0!r} has no attribute {1!r}'
+                             .format(__name__, name))
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+if sys.version_info < (3, 7):
+    # No module __getattr__ (PEP 562) to load them lazily. Spelled out so
+    # that linters see these names on every version.
+    from cloud4rpi.mqtt_api import MqttApi, CONNECT_TIMEOUT
+    from cloud4rpi.outbox import Outbox
+    from cloud4rpi.network import RETRY_INTERVAL, backoff
+
+
+def __init_logging():
+    # The console handler is attached on first connect rather than on
+    # import, unless the application has set up logging by then
+    if not log.handlers and not logging.getLogger().handlers:
+        log.addHandler(StreamHandler())
 
 
 def connect(device_token,
             host=mqqtBrokerHost,
             port=None,
-            tls_config=None):
+            tls_config=None,
+            outbox=None,
+            codec=None,
+            window=None):
+    __init_logging()
+    api = __create_api(device_token, host, port, tls_config, outbox, codec,
+                       window)
+    __attempt_to_connect_with_retries(api)
+    return Device(api)
+
+
+def connect_async(device_token,
+                  host=mqqtBrokerHost,
+                  port=None,
+                  tls_config=None,
+                  outbox=None,
+                  codec=None,
+                  window=None):
+    # Returns the device at once, together with a future resolved when it
+    # is connected. Data published meanwhile is sent after the CONNACK.
+    __init_logging()
+    api = __create_api(device_token, host, port, tls_config, outbox, codec,
+                       window)
+    future = futures.Future()
+
+    def attempt():
+        try:
+            future.set_result(__attempt_to_connect_with_retries(api))
+        except Exception as e:
+            future.set_exception(e)
+
+    thread = threading.Thread(target=attempt, name='cloud4rpi-connect')
+    thread.daemon = True
+    thread.start()
+    return Device(api), future
+
+
+def publish_once(device_token,
+                 data,
+                 diag=None,
+                 config=None,
+                 host=mqqtBrokerHost,
+                 port=None,
+                 tls_config=None,
+                 timeout=PUBLISH_ONCE_TIMEOUT):
+    # For devices that wake up, report and go back to sleep: connects,
+    # publishes the messages given, waits until the broker acknowledges
+    # them and disconnects, all within `timeout` seconds. Returns whether
+    # every message was acknowledged.
+    __init_logging()
+    deadline = time.time() + timeout
+    api = __create_api(device_token, host, port, tls_config, None, None,
+                       None)
+    api.connect(timeout)
+    try:
+        handles = [api.publish_config(config),
+                   api.publish_data(data),
+                   api.publish_diag(diag)]
+        handles = [handle for handle in handles if handle is not None]
+        for handle in handles:
+            handle.wait(max(0, deadline - time.time()))
+    finally:
+        api.disconnect()
+    return all(handle.acked for handle in handles)
+
+
+def __create_api(device_token, host, port, tls_config, outbox, codec,
+                 window):
+    from cloud4rpi.mqtt_api import MqttApi
     if port is None:
         port = mqttsBrokerPort if isinstance(tls_config, dict) \
             else mqttBrokerPort
-    api = MqttApi(device_token, host, port, tls_config)
-    __attempt_to_connect_with_retries(api)
-    return Device(api)
+    return MqttApi(device_token, host, port, tls_config, outbox,
+                   codec=codec, window=window)
 
 
 def __attempt_to_connect_with_retries(api, attempts=10):
-    retry_interval = 5
+    from cloud4rpi.mqtt_api import CONNECT_TIMEOUT
+    from cloud4rpi.network import RETRY_INTERVAL, backoff
     for attempt in range(attempts):
         try:
-            api.connect()
+            return api.connect(CONNECT_TIMEOUT)
         except Exception as e:
             log.debug('MQTT connection error %s. Attempt %s', e, attempt)
-            time.sleep(retry_interval)
-            continue
-        else:
-            break
-    else:
+            time.sleep(backoff(attempt, RETRY_INTERVAL))
+
+    raise Exception('Impossible to connect to MQTT broker. Quiting.')
+
 
-        raise Exception('Impossible to connect to MQTT broker. Quiting.')
+def run(device,
+        data_interval=60,
+        diag_interval=650,
+        overrun=OVERRUN_SKIP,
+        scheduler=None,
+        sample_interval=SAMPLE_INTERVAL,
+        publish_scheduled=True):
+    # Variables declared with an interval are read on their own schedule
+    # and either published at once or sent with the next data message.
+    __init_logging()
+    if scheduler is None:
+        scheduler = Scheduler()
+    if device.sampling:
+        scheduler.add(device.sample, sample_interval, 'sample', overrun)
+    device.set_scheduled_publishing(publish_scheduled)
+    read = device.publish_scheduled if publish_scheduled \
+        else device.read_scheduled
+    for interval, phase in device.intervals:
+        scheduler.add(partial(read, interval, phase), interval,
+                      'variables every {0} sec at {1}'.format(interval, phase),
+                      overrun,
+                      delay=phase)
+    scheduler.add(device.publish_data, data_interval, 'data', overrun)
+    if diag_interval:
+        scheduler.add(device.publish_diag, diag_interval, 'diag', overrun)
+    scheduler.run()
+    return scheduler
 
 
 def set_logging_to_file(log_file_path):
+    from logging.handlers import RotatingFileHandler
+    __init_logging()
     log_file = RotatingFileHandler(
         log_file_path,
         maxBytes=1024 * 1024,
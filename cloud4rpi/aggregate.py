@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+from cloud4rpi import utils
+
+AGGREGATE_WINDOW = 60  # sec
+SAMPLE_INTERVAL = 1  # sec
+
+AGGREGATES = ['min', 'max', 'mean', 'sum', 'count', 'last']
+# What can be aggregated for variables that are not numbers
+LAST_ONLY = ['count', 'last']
+NUMBER_TYPES = (utils.NUMERIC_TYPE, utils.BOOL_TYPE)
+
+
+def derived_name(name, aggregate):
+    return '{0}.{1}'.format(name, aggregate)
+
+
+class Aggregator(object):
+    # Streaming min/max/mean/sum/count/last of the samples taken in tumbling
+    # windows of `window` seconds. A window starts with its first sample and
+    # is closed by the first sample or read after it ends. Only the running
+    # totals are kept, whatever the sampling rate.
+
+    __slots__ = ('name', 'type', 'aggregates', 'window', 'started',
+                 'count', 'total', 'low', 'high', 'last', 'results', 'fresh')
+
+    def __init__(self, name, var_type, aggregates, window=AGGREGATE_WINDOW):
+        allowed = AGGREGATES if var_type in NUMBER_TYPES else LAST_ONLY
+        for aggregate in aggregates:
+            if aggregate not in allowed:
+                raise ValueError('Cannot aggregate {0} by {1}'
+                                 .format(name, aggregate))
+        self.name = name
+        self.type = var_type
+        self.aggregates = list(aggregates)
+        self.window = window
+        self.results = dict.fromkeys(self.names)
+        self.fresh = False
+        self.__reset()
+
+    @staticmethod
+    def create(name, var_config):
+        aggregates = var_config.get('aggregate', None)
+        if not aggregates:
+            return None
+        return Aggregator(name, var_config.get('type', None), aggregates,
+                          var_config.get('window', AGGREGATE_WINDOW))
+
+    @property
+    def names(self):
+        return [derived_name(self.name, a) for a in self.aggregates]
+
+    def config(self):
+        # Only `last` keeps the variable's own type, the rest are numbers
+        return [{'name': derived_name(self.name, a),
+                 'type': self.type if a == 'last' else utils.NUMERIC_TYPE}
+                for a in self.aggregates]
+
+    def __reset(self):
+        self.started = None
+        self.count = 0
+        self.total = 0.0
+        self.low = None
+        self.high = None
+        self.last = None
+
+    def add(self, value, now=None):
+        now = utils.monotonic() if now is None else now
+        self.roll(now)
+        if value is None:
+            return
+        if self.started is None:
+            self.started = now
+        self.count += 1
+        self.last = value
+        if self.type not in NUMBER_TYPES:
+            return
+        self.total += value
+        if self.low is None or value < self.low:
+            self.low = value
+        if self.high is None or value > self.high:
+            self.high = value
+
+    def roll(self, now=None):
+        now = utils.monotonic() if now is None else now
+        if self.started is None or now - self.started < self.window:
+            return False
+        values = {
+            'min': self.low,
+            'max': self.high,
+            'mean': self.total / self.count,
+            'sum': self.total,
+            'count': self.count,
+            'last': self.last,
+        }
+        if self.type == utils.BOOL_TYPE:
+            for aggregate in ('min', 'max'):
+                values[aggregate] = float(values[aggregate])
+        self.results = {derived_name(self.name, a): values[a]
+                        for a in self.aggregates}
+        self.fresh = True
+        self.__reset()
+        return True
+
+    def peek(self, now=None):
+        # The aggregates of the last closed window
+        self.roll(now)
+        return self.results
+
+    def read(self, now=None):
+        # Same, and marks the window as published
+        self.roll(now)
+        self.fresh = False
+        return self.results
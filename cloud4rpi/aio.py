@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import inspect
+import logging
+
+from cloud4rpi import config
+from cloud4rpi import utils
+from cloud4rpi import schema
+from cloud4rpi.device import Device
+from cloud4rpi.errors import MqttConnectionError
+from cloud4rpi.mqtt_api import MqttApi, is_success, CONNECT_TIMEOUT
+from cloud4rpi.network import RETRY_INTERVAL, backoff
+
+MISC_INTERVAL = 1  # sec
+
+log = logging.getLogger(config.loggerName)
+
+
+class AsyncioLoop(object):
+    # Drives paho clients from an asyncio event loop: socket readiness is
+    # watched by the loop itself, so no network threads are started.
+
+    def __init__(self, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.__timers = {}
+        self.__retries = {}
+
+    def attach(self, client):
+        def on_socket_open(c, userdata, sock):
+            self.loop.add_reader(sock, c.loop_read)
+
+        def on_socket_close(c, userdata, sock):
+            self.loop.remove_reader(sock)
+            self.loop.remove_writer(sock)
+
+        def on_socket_register_write(c, userdata, sock):
+            self.loop.add_writer(sock, c.loop_write)
+
+        def on_socket_unregister_write(c, userdata, sock):
+            self.loop.remove_writer(sock)
+
+        client.on_socket_open = on_socket_open
+        client.on_socket_close = on_socket_close
+        client.on_socket_register_write = on_socket_register_write
+        client.on_socket_unregister_write = on_socket_unregister_write
+
+    def start(self, client):
+        if client in self.__timers:
+            return
+
+        def misc():
+            client.loop_misc()
+            self.__timers[client] = self.loop.call_later(MISC_INTERVAL, misc)
+
+        self.__timers[client] = self.loop.call_later(MISC_INTERVAL, misc)
+
+    def stop(self, client):
+        for timers in (self.__timers, self.__retries):
+            timer = timers.pop(client, None)
+            if timer is not None:
+                timer.cancel()
+
+    def in_loop(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def call_later(self, delay, fn, client=None):
+        self.__retries[client] = self.loop.call_later(delay, fn)
+
+
+class AsyncMqttApi(object):
+    def __init__(self,
+                 device_token,
+                 host=config.mqqtBrokerHost,
+                 port=config.mqttBrokerPort,
+                 tls_config=None,
+                 loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.__api = MqttApi(device_token, host, port, tls_config,
+                             network=AsyncioLoop(self.loop))
+        self.__api.on_connected = self.__on_connected
+        self.__connecting = None
+
+    @property
+    def on_command(self):
+        return self.__api.on_command
+
+    @on_command.setter
+    def on_command(self, handler):
+        self.__api.on_command = handler
+
+    @property
+    def connected(self):
+        return self.__api.connected
+
+    def __on_connected(self, rc):
+        future, self.__connecting = self.__connecting, None
+        if future is None or future.done():
+            return
+        if is_success(rc):
+            future.set_result(rc)
+        else:
+            future.set_exception(MqttConnectionError(rc))
+
+    def __track(self, handle):
+        return wrap_handle(handle, self.loop)
+
+    async def connect(self, timeout=None):
+        future = self.__connecting = self.loop.create_future()
+        self.__api.begin_connect()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, MqttConnectionError):
+            # Stops the attempt, so a retry starts from scratch
+            self.__connecting = None
+            self.__api.disconnect()
+            raise
+
+    def disconnect(self):
+        self.__api.disconnect()
+
+    def publish_config(self, msg, **kwargs):
+        return self.__track(self.__api.publish_config(msg, **kwargs))
+
+    def publish_data(self, msg, **kwargs):
+        return self.__track(self.__api.publish_data(msg, **kwargs))
+
+    def publish_data_batch(self, samples, **kwargs):
+        return self.__track(self.__api.publish_data_batch(samples, **kwargs))
+
+    def publish_diag(self, msg, **kwargs):
+        return self.__track(self.__api.publish_diag(msg, **kwargs))
+
+
+class AsyncBinding(object):
+    # Holds the result of an 'async def' binding awaited by AsyncDevice,
+    # so Device can resolve it like an ordinary sensor object.
+
+    def __init__(self, function):
+        self.function = function
+        self.value = None
+        self.__takes_value = utils.has_args(function)
+
+    async def refresh(self, current=None):
+        if self.__takes_value:
+            self.value = await self.function(current)
+        else:
+            self.value = await self.function()
+
+    def read(self):
+        return self.value
+
+    def __call__(self, value):
+        return self.value
+
+
+def wrap_async_binding(binding):
+    if inspect.iscoroutinefunction(binding):
+        return AsyncBinding(binding)
+    return None
+
+
+def wrap_handle(handle, loop=None):
+    # An asyncio future resolved with the publish handle once it is done
+    loop = loop or asyncio.get_event_loop()
+    future = loop.create_future()
+    if handle is None:
+        future.set_result(None)
+        return future
+
+    def resolve(h):
+        if not future.done():
+            future.set_result(h)
+
+    handle.add_done_callback(
+        lambda h: loop.call_soon_threadsafe(resolve, h))
+    return future
+
+
+async def wait_published(result):
+    if result is not None:
+        await result
+
+
+class AsyncDevice(object):
+    def __init__(self, api):
+        self.__device = Device(api)
+        self.__device_on_command = api.on_command
+        api.on_command = self.__on_command
+        self.__variables = {}
+        self.__bindings = {}
+        self.__diag_bindings = {}
+
+    def __on_command(self, cmd):
+        asyncio.ensure_future(self.__apply_commands(cmd))
+
+    async def __apply_commands(self, cmd):
+        await asyncio.gather(*[
+            binding.refresh(cmd[name])
+            for name, binding in self.__bindings.items()
+            if name in cmd and not self.__variables[name].get('aggregate')
+        ])
+        self.__device_on_command(cmd)
+
+    async def __refresh_variables(self):
+        await asyncio.gather(*[
+            binding.refresh(self.__variables[name].get('value'))
+            for name, binding in self.__bindings.items()
+        ])
+
+    async def __refresh_diag(self):
+        # Static and ttl diags are only awaited when read_diag() needs them
+        due = self.__device.due_diag()
+        await asyncio.gather(*[
+            binding.refresh()
+            for name, binding in self.__diag_bindings.items() if name in due
+        ])
+
+    def declare(self, variables):
+        declared = {}
+        bindings = {}
+        for name, value in variables.items():
+            binding = wrap_async_binding(value.get('bind', None))
+            if binding is not None:
+                value = dict(value, bind=binding)
+                bindings[name] = binding
+            declared[name] = value
+
+        self.__device.declare(declared)
+        self.__variables = declared
+        self.__bindings = bindings
+
+    def declare_diag(self, diag):
+        declared = {}
+        bindings = {}
+        for name, value in diag.items():
+            if schema.is_diag_config(value):
+                binding = wrap_async_binding(value['bind'])
+                if binding is not None:
+                    value = dict(value, bind=binding)
+                    bindings[name] = binding
+            else:
+                binding = wrap_async_binding(value)
+                if binding is not None:
+                    value = bindings[name] = binding
+            declared[name] = value
+
+        self.__device.declare_diag(declared)
+        self.__diag_bindings = bindings
+
+    def set_batching(self, size=None, window=None):
+        self.__device.set_batching(size, window)
+
+    def set_keyframe_interval(self, interval=None):
+        self.__device.set_keyframe_interval(interval)
+
+    def read_config(self):
+        return self.__device.read_config()
+
+    async def read_data(self):
+        await self.__refresh_variables()
+        return self.__device.read_data()
+
+    async def read_diag(self):
+        await self.__refresh_diag()
+        return self.__device.read_diag()
+
+    async def publish_config(self, cfg=None):
+        await wait_published(self.__device.publish_config(cfg))
+
+    async def publish_data(self, data=None):
+        if data is None:
+            await self.__refresh_variables()
+        await wait_published(self.__device.publish_data(data))
+
+    async def publish_diag(self, diag=None):
+        if diag is None:
+            await self.__refresh_diag()
+        await wait_published(self.__device.publish_diag(diag))
+
+    async def flush(self):
+        await wait_published(self.__device.flush())
+
+
+async def connect(device_token,
+                  host=config.mqqtBrokerHost,
+                  port=None,
+                  tls_config=None,
+                  loop=None,
+                  attempts=10):
+    if port is None:
+        port = config.mqttsBrokerPort if isinstance(tls_config, dict) \
+            else config.mqttBrokerPort
+    api = AsyncMqttApi(device_token, host, port, tls_config, loop)
+
+    for attempt in range(attempts):
+        try:
+            await api.connect(timeout=CONNECT_TIMEOUT)
+        except Exception as e:
+            log.debug('MQTT connection error %s. Attempt %s', e, attempt)
+            await asyncio.sleep(backoff(attempt, RETRY_INTERVAL))
+        else:
+            return AsyncDevice(api)
+
+    raise Exception('Impossible to connect to MQTT broker. Quiting.')
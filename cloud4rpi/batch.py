@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+from cloud4rpi import utils
+
+
+class DataBatch(object):
+    def __init__(self, size=None, window=None):
+        self.size = size
+        self.window = window
+        self.__samples = []
+        self.__started = None
+
+    def __len__(self):
+        return len(self.__samples)
+
+    def add(self, payload, ts=None):
+        if not self.__samples:
+            self.__started = utils.monotonic()
+        self.__samples.append((ts or utils.utcnow(), payload))
+
+    def is_due(self):
+        if not self.__samples:
+            return False
+        if self.size and len(self.__samples) >= self.size:
+            return True
+        return bool(self.window) and \
+            utils.monotonic() - self.__started >= self.window
+
+    def drain(self):
+        samples, self.__samples = self.__samples, []
+        self.__started = None
+        return samples
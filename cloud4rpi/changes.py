@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+import numbers
+
+UNSET = object()
+
+
+class ChangeFilter(object):
+    def __init__(self, deadband=None, deadband_percent=None):
+        self.deadband = deadband
+        self.deadband_percent = deadband_percent
+        self.last = UNSET
+
+    @staticmethod
+    def create(var_config):
+        deadband = var_config.get('deadband', None)
+        deadband_percent = var_config.get('deadband_percent', None)
+        if deadband is None and deadband_percent is None and \
+                not var_config.get('on_change', False):
+            return None
+        return ChangeFilter(deadband, deadband_percent)
+
+    def is_changed(self, value):
+        last = self.last
+        if last is UNSET:
+            return True
+        if not isinstance(value, numbers.Number) or \
+                not isinstance(last, numbers.Number) or \
+                isinstance(value, bool):
+            return value != last
+
+        delta = abs(value - last)
+        if self.deadband is not None and delta > self.deadband:
+            return True
+        if self.deadband_percent is not None and \
+                delta > abs(last) * self.deadband_percent / 100.0:
+            return True
+        if self.deadband is None and self.deadband_percent is None:
+            return value != last
+        return False
+
+    def update(self, value):
+        self.last = value
+
+    def reset(self):
+        self.last = UNSET
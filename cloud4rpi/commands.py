@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+from collections import deque
+from concurrent import futures
+
+from cloud4rpi import config
+from cloud4rpi import utils
+
+COMMAND_WORKERS = 4
+MAX_PENDING_COMMANDS = 256
+
+log = logging.getLogger(config.loggerName)
+
+
+class CommandExecutor(object):
+    # Runs command handlers on worker threads instead of the network
+    # thread. Commands with the same key (variable name) run one at a time
+    # in arrival order; different keys run in parallel. Commands arriving
+    # while max_pending are queued are dropped.
+    #
+    # With coalesce, a command replaces the one still waiting for its key,
+    # so a burst runs the handler for its first and latest values only.
+    # min_interval(key) returns the seconds to leave between two runs for
+    # the key; commands arriving meanwhile wait (and coalesce).
+
+    def __init__(self,
+                 workers=COMMAND_WORKERS,
+                 max_pending=MAX_PENDING_COMMANDS,
+                 metrics=None,
+                 coalesce=False,
+                 min_interval=None):
+        self.max_pending = max_pending
+        self.coalesce = coalesce
+        self.__metrics = metrics
+        self.__min_interval = min_interval
+        self.__pool = futures.ThreadPoolExecutor(workers)
+        self.__lock = threading.Lock()
+        self.__idle = threading.Condition(self.__lock)
+        self.__queues = {}
+        self.__last_runs = {}
+        self.__pending = 0
+        self.executed = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    @property
+    def pending(self):
+        return self.__pending
+
+    def submit(self, key, fn, *args):
+        item = (utils.monotonic(), fn, args)
+        with self.__lock:
+            queue = self.__queues.get(key, None)
+            coalesced = self.coalesce and bool(queue)
+            if coalesced:
+                queue[-1] = item
+                self.coalesced += 1
+            elif self.__pending >= self.max_pending:
+                self.dropped += 1
+                log.warning('Command queue full, dropped command for %s',
+                            key)
+                return False
+            else:
+                self.__pending += 1
+                if queue is None:
+                    self.__queues[key] = deque([item])
+                else:
+                    # Picked up by the run already going for this key
+                    queue.append(item)
+
+        if coalesced and self.__metrics is not None:
+            self.__metrics.inc('commands_coalesced', key)
+        if queue is None:
+            self.__start(key)
+        return True
+
+    def __start(self, key):
+        try:
+            self.__pool.submit(self.__run, key)
+        except RuntimeError:
+            # shut down meanwhile
+            pass
+
+    def __delay(self, key):
+        if self.__min_interval is None or key not in self.__last_runs:
+            return 0
+        interval = self.__min_interval(key) or 0
+        return self.__last_runs[key] + interval - utils.monotonic()
+
+    def __run(self, key):
+        while True:
+            with self.__lock:
+                queue = self.__queues[key]
+                if not queue:
+                    del self.__queues[key]
+                    return
+                delay = self.__delay(key)
+                if delay > 0:
+                    timer = threading.Timer(delay, self.__start, (key,))
+                    timer.daemon = True
+                    timer.start()
+                    return
+                enqueued, fn, args = queue.popleft()
+
+            if self.__metrics is not None:
+                self.__metrics.observe('command_queue_seconds',
+                                       utils.monotonic() - enqueued, key)
+            try:
+                fn(*args)
+            except Exception as e:
+                log.exception('Command for %s failed: %s', key, str(e))
+            with self.__lock:
+                self.__last_runs[key] = utils.monotonic()
+                self.__pending -= 1
+                self.executed += 1
+                if not self.__pending:
+                    self.__idle.notify_all()
+
+    def join(self, timeout=None):
+        # Waits until every queued command has run
+        deadline = None if timeout is None else utils.monotonic() + timeout
+        with self.__idle:
+            while self.__pending:
+                remaining = None if deadline is None \
+                    else deadline - utils.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.__idle.wait(remaining)
+            return True
+
+    def shutdown(self, wait=True):
+        self.__pool.shutdown(wait)
+
+    def stats(self):
+        with self.__lock:
+            return {
+                'pending': self.__pending,
+                'executed': self.executed,
+                'dropped': self.dropped,
+                'coalesced': self.coalesced,
+            }
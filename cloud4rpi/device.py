@@ -1,96 +1,471 @@
 # -*- coding: utf-8 -*-
 
+import time
+import logging
+from collections import OrderedDict
+from concurrent import futures
+
+from cloud4rpi import config
 from cloud4rpi import utils
+from cloud4rpi import schema
+from cloud4rpi.batch import DataBatch
+from cloud4rpi.metrics import Metrics
+from cloud4rpi.profiling import BindingProfiler, ROLLING_WINDOW
+from cloud4rpi.history import History, HISTORY_CAPACITY, HISTORY_TYPES
+from cloud4rpi.commands import CommandExecutor, \
+    COMMAND_WORKERS, MAX_PENDING_COMMANDS
+from cloud4rpi.errors import UnexpectedVariableValueTypeError
+
+log = logging.getLogger(config.loggerName)
 
 
 class Device(object):
-    def __init__(self, api):
+    def __init__(self, api, metrics=None):
         def on_command(cmd):
             self.__on_command(cmd)
 
         self.__api = api
         self.__api.on_command = on_command
-        self.__variables = {}
-        self.__diag = {}
+        self.__schema = []
+        self.__records = {}
+        self.__bound = []
+        self.__plain = []
+        self.__aggregated = []
+        self.__sampled = []
+        self.__groups = OrderedDict()
+        self.__due = {}
+        self.__ungrouped = []
+        self.__groups_published = False
+        self.__filtered = False
+        self.__diag = []
+        self.__diag_filtered = False
+        self.__batch = None
+        self.__keyframe_interval = None
+        self.__last_keyframe = None
+        self.__executor = None
+        self.__binding_timeout = None
+        self.__pending_reads = {}
+        self.__commands = None
+        self.__profiler = None
+        self.__history = None
+        self.__tracked = []
+        self.timed_out_bindings = []
+        if metrics is None:
+            metrics = getattr(api, 'metrics', None)
+        # Shared with the API, so stats() covers both
+        self.__metrics = metrics if isinstance(metrics, Metrics) \
+            else Metrics()
 
-    @staticmethod
-    def __resolve_binding(binding, current=None, default=None):
-        if hasattr(binding, 'read'):
-            return binding.read()
-        elif callable(binding):
-            return utils.resolve_callable(binding, current)
-        else:
-            return default
+    @property
+    def metrics(self):
+        return self.__metrics
+
+    def stats(self):
+        return self.__metrics.stats()
+
+    @property
+    def profiler(self):
+        return self.__profiler
+
+    def set_profiling(self, enabled=True, budget=None, window=ROLLING_WINDOW):
+        # Times every binding call in read_data, read_diag and command
+        # handlers; budget (sec) flags the bindings that take longer.
+        self.__profiler = BindingProfiler(budget, window) if enabled \
+            else None
+        return self.__profiler
 
     def __validate_payload(self, payload):
         result = {}
         for name, value in payload.items():
-            variable = self.__variables.get(name, None)
+            variable = self.__records.get(name, None)
             if not variable:
                 continue
-            t = variable.get('type', None)
-            result[name] = utils.validate_variable_value(name, t, value)
+            try:
+                result[name] = utils.convert_variable_value(name,
+                                                            variable.convert,
+                                                            value)
+            except UnexpectedVariableValueTypeError:
+                self.__metrics.inc('validation_errors', name)
+                raise
 
         return result
 
     def __on_command(self, cmd):
+        if self.__commands is not None:
+            self.__dispatch_commands(cmd)
+            return
         update = self.__apply_commands(cmd)
         if bool(update):
             self.__api.publish_data(update, data_type='cr')
 
+    def __command_target(self, name):
+        variable = self.__records.get(name, None)
+        if variable is not None and variable.aggregator is not None:
+            # Only its aggregates are declared, and those are read-only
+            log.warning('Ignoring command for aggregated variable %s', name)
+            return None
+        return variable
+
     def __apply_commands(self, cmd):
         update = {}
         for varName, value in cmd.items():
-            variable = self.__variables.get(varName, None)
+            variable = self.__command_target(varName)
             if not variable:
                 continue
-            # consider to use resolve binding here
-            new_value = value
-            handler = variable.get('bind', None)
-            if callable(handler):
-                new_value = handler(new_value)
+            update[varName] = self.__apply_command(variable, value)
+
+        return update
 
-            t = variable.get('type', None)
-            new_value = utils.validate_variable_value(varName, t, new_value)
-            variable['value'] = new_value
+    def __apply_command(self, variable, value):
+        # consider to use resolve binding here
+        new_value = value
+        handler = variable.binding
+        if callable(handler):
+            new_value = self.__handle_command(variable.name, handler,
+                                              new_value)
 
-            update[varName] = new_value
+        new_value = self.__store(variable, new_value)
+        self.__metrics.inc('commands', variable.name)
+        self.__sent(variable.name, new_value)
+        if self.__history is not None and \
+                variable.type in HISTORY_TYPES:
+            self.__history.record(variable.name, new_value)
+        return new_value
 
-        return update
+    def __dispatch_commands(self, cmd):
+        for varName, value in cmd.items():
+            variable = self.__command_target(varName)
+            if variable:
+                self.__commands.submit(varName, self.__run_command,
+                                       variable, value)
+
+    def __run_command(self, variable, value):
+        # The result goes out as soon as its own handler is done
+        new_value = self.__apply_command(variable, value)
+        self.__api.publish_data({variable.name: new_value}, data_type='cr')
+
+    @property
+    def commands(self):
+        return self.__commands
+
+    def set_command_concurrency(self, workers=None,
+                                max_pending=MAX_PENDING_COMMANDS,
+                                coalesce=False):
+        # Runs command handlers on `workers` threads, off the network
+        # thread, in order per variable; None runs them inline again.
+        # With coalesce, a burst of commands for a variable is applied
+        # as its latest value. A variable's 'min_interval' (sec) spaces
+        # out its handler runs either way.
+        if self.__commands is not None:
+            self.__commands.shutdown(wait=False)
+        self.__commands = None
+        if workers or coalesce:
+            self.__commands = CommandExecutor(workers or COMMAND_WORKERS,
+                                              max_pending,
+                                              self.__metrics,
+                                              coalesce,
+                                              self.__command_interval)
+        return self.__commands
+
+    def __command_interval(self, name):
+        variable = self.__records.get(name, None)
+        return variable.config.get('min_interval', 0) if variable else 0
+
+    def __handle_command(self, name, handler, value):
+        started = utils.monotonic()
+        error = None
+        try:
+            return handler(value)
+        except Exception as e:
+            error = e
+            self.__metrics.inc('binding_errors', name)
+            raise
+        finally:
+            if self.__profiler is not None:
+                self.__profiler.record(name, utils.monotonic() - started,
+                                       error)
 
     def declare(self, variables):
-        for name, value in variables.items():
-            utils.guard_against_invalid_variable_type(name,
-                                                      value.get('type', None))
-        self.__variables = variables
+        self.__schema = schema.compile_variables(variables)
+        self.__records = {v.name: v for v in self.__schema}
+        # Aggregated variables are read by sample() instead of read_data()
+        self.__plain = [v for v in self.__schema if v.aggregator is None]
+        self.__aggregated = [v for v in self.__schema if v.aggregator]
+        # and variables with an interval on their group's schedule
+        self.__bound = []
+        self.__groups = OrderedDict()
+        for v in self.__plain:
+            if v.call == schema.CALL_NONE:
+                continue
+            interval = v.config.get('interval', None)
+            if interval:
+                key = (interval, v.config.get('phase', 0))
+                self.__groups.setdefault(key, []).append(v)
+            else:
+                self.__bound.append(v)
+        now = utils.monotonic()
+        self.__due = {key: now + key[1] for key in self.__groups}
+        grouped = set(v.name for group in self.__groups.values()
+                      for v in group)
+        self.__ungrouped = [v for v in self.__plain if v.name not in grouped]
+        self.__sampled = [v for v in self.__aggregated
+                          if v.call != schema.CALL_NONE]
+        self.__filtered = bool(self.__aggregated) or \
+            any(v.change_filter for v in self.__schema)
+        self.__tracked = [v for v in self.__schema
+                          if v.type in HISTORY_TYPES]
+
+    @property
+    def history(self):
+        return self.__history
+
+    def set_history(self, capacity=HISTORY_CAPACITY):
+        # Keeps the last `capacity` readings of every numeric and bool
+        # variable; None turns the history off.
+        self.__history = History(capacity) if capacity else None
+        return self.__history
+
+    def __record_history(self):
+        if self.__history is None:
+            return
+        now = time.time()
+        for variable in self.__tracked:
+            self.__history.record(variable.name, variable.config.get('value'),
+                                  now)
+
+    def set_keyframe_interval(self, interval=None):
+        self.__keyframe_interval = interval
+        self.__last_keyframe = None
 
     def declare_diag(self, diag):
-        self.__diag = diag
+        self.__diag = schema.compile_diag(diag)
+        self.__diag_filtered = any(d.change_filter for d in self.__diag)
 
     def read_config(self):
-        return [{'name': name, 'type': value['type']}
-                for name, value in self.__variables.items()]
+        cfg = []
+        for variable in self.__schema:
+            if variable.aggregator is None:
+                cfg.append({'name': variable.name, 'type': variable.type})
+            else:
+                cfg.extend(variable.aggregator.config())
+        return cfg
+
+    @property
+    def sampling(self):
+        return bool(self.__sampled)
+
+    @property
+    def intervals(self):
+        # (interval, phase) of every group of variables read on a schedule
+        # of their own
+        return list(self.__groups)
+
+    def read_scheduled(self, interval, phase=0):
+        key = (interval, phase)
+        variables = self.__groups.get(key, [])
+        self.__read_variables(variables)
+        if key in self.__due:
+            self.__due[key] = utils.monotonic() + interval
+        return {v.name: v.config.get('value') for v in variables}
+
+    def __read_due_groups(self):
+        # run() reads each group on its schedule. Without it (a plain
+        # publish_data() loop) groups past due are read with the rest.
+        if not self.__due:
+            return
+        now = utils.monotonic()
+        for key, due in list(self.__due.items()):
+            if now >= due:
+                self.read_scheduled(*key)
+
+    def set_scheduled_publishing(self, enabled=True):
+        # Groups publish themselves with publish_scheduled(), so data
+        # messages leave their variables out instead of resending them
+        self.__groups_published = enabled
+
+    def publish_scheduled(self, interval, phase=0):
+        # Reads and publishes only the variables of one group that changed
+        self.read_scheduled(interval, phase)
+        data = self.__changes(self.__groups.get((interval, phase), []))
+        if not data:
+            return None
+        return self.__publish(data)
+
+    def sample(self):
+        # Adds a reading of every aggregated variable to its window
+        now = utils.monotonic()
+        timed = self.__metrics.enabled or self.__profiler is not None
+        for variable in self.__sampled:
+            value = self.__store(variable, self.__resolve(variable)) \
+                if timed else variable.read()
+            variable.aggregator.add(value, now)
+
+    def set_concurrency(self, workers=None, timeout=None):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+        self.__executor = None
+        if workers:
+            self.__executor = futures.ThreadPoolExecutor(workers)
+        self.__binding_timeout = timeout
+        self.__pending_reads = {}
+
+    def __read_variables(self, variables):
+        if not variables:
+            return
+        # The snapshot is timed as a whole: a clock read per binding would
+        # double the cost of the sequential loop. Bindings are timed one by
+        # one when profiled or read concurrently.
+        started = utils.monotonic()
+        if self.__executor is not None:
+            self.__read_variables_concurrently(variables)
+        elif self.__profiler is None:
+            self.__read_sequentially(variables)
+        else:
+            for variable in variables:
+                self.__store(variable, self.__resolve(variable))
+        self.__metrics.observe('read_seconds', utils.monotonic() - started)
+
+    def __read_sequentially(self, variables):
+        for variable in variables:
+            try:
+                variable.read()
+            except UnexpectedVariableValueTypeError:
+                self.__metrics.inc('validation_errors', variable.name)
+                raise
+            except Exception:
+                self.__metrics.inc('binding_errors', variable.name)
+                raise
+
+    def __resolve(self, variable):
+        started = utils.monotonic()
+        error = None
+        try:
+            return variable.resolve()
+        except Exception as e:
+            error = e
+            self.__metrics.inc('binding_errors', variable.name)
+            raise
+        finally:
+            duration = utils.monotonic() - started
+            self.__metrics.observe('binding_read_seconds', duration,
+                                   variable.name)
+            if self.__profiler is not None:
+                self.__profiler.record(variable.name, duration, error)
+
+    def __store(self, variable, value):
+        try:
+            return variable.store(value)
+        except UnexpectedVariableValueTypeError:
+            self.__metrics.inc('validation_errors', variable.name)
+            raise
+
+    def __read_variables_concurrently(self, variables):
+        reads = []
+        for variable in variables:
+            # A read still hanging from the previous snapshot keeps its
+            # worker busy, so it is waited for again instead of resubmitted
+            future = self.__pending_reads.get(variable.name, None)
+            if future is None or future.done():
+                future = self.__executor.submit(self.__resolve, variable)
+                self.__pending_reads[variable.name] = future
+            reads.append((variable, future))
+
+        started = utils.monotonic()
+        timed_out = []
+        for variable, future in reads:
+            timeout = variable.config.get('timeout', self.__binding_timeout)
+            if timeout is not None:
+                timeout = max(0, started + timeout - utils.monotonic())
+            try:
+                result = future.result(timeout)
+            except futures.TimeoutError:
+                timed_out.append(variable.name)
+                continue
+            self.__store(variable, result)
+
+        if timed_out:
+            log.warning('Binding read timed out: %s', ', '.join(timed_out))
+        self.timed_out_bindings = timed_out
+
+    def __read_snapshot(self):
+        # The variables a data message carries, read where due
+        if self.__groups_published:
+            variables = self.__ungrouped
+        else:
+            self.__read_due_groups()
+            variables = self.__plain
+        self.__read_variables(self.__bound)
+        self.__record_history()
+        return variables
 
     def read_data(self):
-        for name, varConfig in self.__variables.items():
-            bind = varConfig.get('bind', None)
-            if bind:
-                curr = varConfig.get('value')
-                result = self.__resolve_binding(bind, curr, curr)
-                t = varConfig.get('type')
-                new_val = utils.validate_variable_value(name, t, result)
-                varConfig['value'] = new_val
-
-        readings = {varName: varConfig.get('value')
-                    for varName, varConfig in self.__variables.items()}
+        readings = {variable.name: variable.config.get('value')
+                    for variable in self.__read_snapshot()}
+        for variable in self.__aggregated:
+            readings.update(variable.aggregator.peek())
 
         return readings
 
+    def __is_keyframe_due(self):
+        if self.__keyframe_interval is None:
+            return False
+        now = utils.monotonic()
+        if self.__last_keyframe is None or \
+                now - self.__last_keyframe >= self.__keyframe_interval:
+            self.__last_keyframe = now
+            return True
+        return False
+
+    def __read_changes(self):
+        keyframe = self.__is_keyframe_due()
+        changes = self.__changes(self.__read_snapshot(), keyframe)
+        # Aggregates are sent once per closed window
+        for variable in self.__aggregated:
+            aggregator = variable.aggregator
+            aggregator.roll()
+            if keyframe or aggregator.fresh:
+                changes.update(aggregator.read())
+        return changes
+
+    @staticmethod
+    def __changes(variables, keyframe=False):
+        changes = {}
+        for variable in variables:
+            value = variable.config.get('value')
+            change_filter = variable.change_filter
+            if change_filter is None:
+                changes[variable.name] = value
+            elif keyframe or change_filter.is_changed(value):
+                change_filter.update(value)
+                changes[variable.name] = value
+        return changes
+
+    def __sent(self, name, value):
+        variable = self.__records.get(name, None)
+        if variable is not None and variable.change_filter is not None:
+            variable.change_filter.update(value)
+
+    def due_diag(self):
+        # Names of the diags whose bindings the next read_diag() calls
+        now = utils.monotonic()
+        return [diag.name for diag in self.__diag if diag.is_due(now)]
+
     def read_diag(self):
-        readings = {}
-        for name, value in self.__diag.items():
-            readings[name] = self.__resolve_binding(value, None, value)
-        return readings
+        if self.__profiler is None:
+            return {diag.name: diag.read() for diag in self.__diag}
+        return {diag.name: self.__read_diag(diag) for diag in self.__diag}
+
+    def __read_diag(self, diag):
+        started = utils.monotonic()
+        error = None
+        try:
+            return diag.read()
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.__profiler.record(diag.name, utils.monotonic() - started,
+                                   error)
 
     def publish_config(self, cfg=None):
         if cfg is None:
@@ -100,15 +475,60 @@ class Device(object):
 
         return self.__api.publish_config(cfg)
 
+    def set_batching(self, size=None, window=None):
+        # The window is checked whenever publish_data() runs, changes or
+        # not, so a batch goes out at most one publish interval late
+        self.flush()
+        self.__batch = DataBatch(size, window) if size or window else None
+
     def publish_data(self, data=None):
-        if data is None:
+        if data is None and self.__filtered:
+            data = self.__read_changes()
+            if not data:
+                return self.__flush_due()
+        elif data is None:
             data = self.read_data()
         else:
             data = self.__validate_payload(data)
+            for name, value in data.items():
+                self.__sent(name, value)
+
+        return self.__publish(data)
+
+    def __publish(self, data):
+        if self.__batch is None:
+            return self.__api.publish_data(data)
+
+        self.__batch.add(data)
+        return self.__flush_due()
+
+    def __flush_due(self):
+        if self.__batch is not None and self.__batch.is_due():
+            return self.flush()
+        return None
+
+    def flush(self):
+        if not self.__batch:
+            return None
+        return self.__api.publish_data_batch(self.__batch.drain())
 
-        return self.__api.publish_data(data)
+    def __diag_changes(self, readings):
+        changes = {}
+        for diag in self.__diag:
+            value = readings[diag.name]
+            change_filter = diag.change_filter
+            if change_filter is None:
+                changes[diag.name] = value
+            elif change_filter.is_changed(value):
+                change_filter.update(value)
+                changes[diag.name] = value
+        return changes
 
     def publish_diag(self, diag=None):
         if diag is None:
             diag = self.read_diag()
+            if self.__diag_filtered:
+                diag = self.__diag_changes(diag)
+                if not diag:
+                    return None
         return self.__api.publish_diag(diag)
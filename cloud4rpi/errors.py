@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-import subprocess
+import sys
 
 TYPE_WARN_MSG = 'WARNING! A string "%s" passed to a numeric variable. ' \
                 'Change the variable type or the passed value.' \
@@ -35,7 +35,6 @@ class NotSupportedError(Exception):
 
 __messages = {
     KeyboardInterrupt: 'Interrupted',
-    subprocess.CalledProcessError: 'Try run with sudo',
     InvalidTokenError:
         'Device token {0} is invalid. Please verify it.',
     InvalidConfigError:
@@ -50,4 +49,14 @@ __messages = {
 
 def get_error_message(e):
     msg = getattr(e, 'message', repr(e))
-    return __messages.get(type(e), 'Unexpected error: {0}').format(msg)
+    template = __messages.get(type(e), None)
+    if template is None:
+        # subprocess is not imported here to keep start-up fast: only code
+        # that imported it can raise a CalledProcessError
+        subprocess = sys.modules.get('subprocess', None)
+        if subprocess is not None and \
+                isinstance(e, subprocess.CalledProcessError):
+            template = 'Try run with sudo'
+        else:
+            template = 'Unexpected error: {0}'
+    return template.format(msg)
@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import socket
+import logging
+import selectors
+import threading
+from collections import OrderedDict
+from concurrent import futures
+from itertools import count
+
+from cloud4rpi import config
+from cloud4rpi import utils
+from cloud4rpi.device import Device
+from cloud4rpi.mqtt_api import MqttApi, is_success
+from cloud4rpi.network import RETRY_INTERVAL, backoff
+from cloud4rpi.scheduler import Scheduler, OVERRUN_SKIP
+from cloud4rpi.serializer import get_serializer
+
+MISC_INTERVAL = 1  # sec
+CLOSE_TIMEOUT = 1  # sec
+
+log = logging.getLogger(config.loggerName)
+
+
+class SelectorLoop(object):
+    # Drives many paho clients from a single thread: their sockets are
+    # multiplexed with one selector instead of a network thread per client.
+
+    def __init__(self):
+        self.__selector = selectors.DefaultSelector()
+        self.__lock = threading.Lock()
+        self.__clients = set()
+        self.__timers = []
+        self.__sequence = count()
+        self.__wakeup_r, self.__wakeup_w = socket.socketpair()
+        self.__wakeup_r.setblocking(False)
+        self.__wakeup_w.setblocking(False)
+        self.__selector.register(self.__wakeup_r, selectors.EVENT_READ)
+        self.__stopped = threading.Event()
+        self.__deadline = None
+        self.__thread = None
+
+    def attach(self, client):
+        def on_socket_open(c, userdata, sock):
+            self.__watch(sock, c, selectors.EVENT_READ)
+
+        def on_socket_close(c, userdata, sock):
+            self.__watch(sock, c, 0)
+
+        def on_socket_register_write(c, userdata, sock):
+            self.__watch(sock, c, selectors.EVENT_READ | selectors.EVENT_WRITE)
+
+        def on_socket_unregister_write(c, userdata, sock):
+            self.__watch(sock, c, selectors.EVENT_READ)
+
+        client.on_socket_open = on_socket_open
+        client.on_socket_close = on_socket_close
+        client.on_socket_register_write = on_socket_register_write
+        client.on_socket_unregister_write = on_socket_unregister_write
+
+    def start(self, client):
+        with self.__lock:
+            self.__clients.add(client)
+            if self.__thread is None:
+                self.__stopped.clear()
+                self.__thread = threading.Thread(target=self.__run,
+                                                 name='cloud4rpi-fleet')
+                self.__thread.daemon = True
+                self.__thread.start()
+
+    def stop(self, client):
+        with self.__lock:
+            self.__clients.discard(client)
+            for timer in self.__timers:
+                if timer[2] is client:
+                    timer[3] = None
+
+    def in_loop(self):
+        return threading.current_thread() is self.__thread
+
+    def call_later(self, delay, fn, client=None):
+        with self.__lock:
+            heapq.heappush(self.__timers, [utils.monotonic() + delay,
+                                           next(self.__sequence), client, fn])
+        self.__wake()
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        # Lets queued packets, such as DISCONNECT, go out before stopping
+        thread = self.__thread
+        if thread is None:
+            return
+        self.__deadline = utils.monotonic() + timeout
+        self.__stopped.set()
+        self.__wake()
+        thread.join(timeout)
+        self.__thread = None
+
+    def __watch(self, sock, client, events):
+        with self.__lock:
+            registered = sock in self.__selector.get_map()
+            if not events:
+                if registered:
+                    self.__selector.unregister(sock)
+            elif registered:
+                self.__selector.modify(sock, events, client)
+            else:
+                self.__selector.register(sock, events, client)
+        if threading.current_thread() is not self.__thread:
+            self.__wake()
+
+    def __wake(self):
+        try:
+            self.__wakeup_w.send(b'x')
+        except (BlockingIOError, OSError):
+            pass
+
+    def __timeout(self, next_misc):
+        with self.__lock:
+            due = self.__timers[0][0] if self.__timers else next_misc
+        return max(0, min(due, next_misc) - utils.monotonic())
+
+    def __run(self):
+        next_misc = utils.monotonic() + MISC_INTERVAL
+        while not self.__stopped.is_set() or self.__is_closing():
+            for key, mask in self.__selector.select(self.__timeout(next_misc)):
+                client = key.data
+                if client is None:
+                    self.__drain_wakeups()
+                    continue
+                if mask & selectors.EVENT_READ:
+                    self.__call(client.loop_read)
+                if mask & selectors.EVENT_WRITE:
+                    self.__call(client.loop_write)
+
+            self.__run_timers()
+            if utils.monotonic() >= next_misc:
+                with self.__lock:
+                    clients = list(self.__clients)
+                for client in clients:
+                    self.__call(client.loop_misc)
+                next_misc = utils.monotonic() + MISC_INTERVAL
+
+    def __is_closing(self):
+        if utils.monotonic() >= self.__deadline:
+            return False
+        with self.__lock:
+            return len(self.__selector.get_map()) > 1
+
+    def __drain_wakeups(self):
+        try:
+            self.__wakeup_r.recv(4096)
+        except (BlockingIOError, OSError):
+            pass
+
+    def __run_timers(self):
+        now = utils.monotonic()
+        while True:
+            with self.__lock:
+                if not self.__timers or self.__timers[0][0] > now:
+                    return
+                _, _, _, fn = heapq.heappop(self.__timers)
+            if fn is not None:
+                self.__call(fn)
+
+    @staticmethod
+    def __call(fn):
+        # An error in one client's callbacks must not stop the others
+        try:
+            fn()
+        except Exception as e:
+            log.exception('Fleet network loop error: %s', str(e))
+
+
+class DeviceFleet(object):
+    # Many devices, each with its own token and MQTT session, sharing one
+    # network thread, one serializer and one scheduler. The number of
+    # messages awaiting PUBACK across the fleet is bounded by max_in_flight.
+
+    def __init__(self,
+                 host=config.mqqtBrokerHost,
+                 port=None,
+                 tls_config=None,
+                 max_in_flight=None,
+                 backpressure_timeout=0,
+                 network=None,
+                 serializer=None):
+        if port is None:
+            port = config.mqttsBrokerPort if isinstance(tls_config, dict) \
+                else config.mqttBrokerPort
+        self.__host = host
+        self.__port = port
+        self.__tls_config = tls_config
+        self.network = network or SelectorLoop()
+        self.__serializer = serializer or get_serializer()
+        self.__apis = OrderedDict()
+        self.__devices = OrderedDict()
+        self.__accepted = set()
+        self.__refused = {}
+        self.__started = set()
+        self.__waiting = []
+        self.__state = threading.Condition()
+        self.__in_flight = 0
+        self.max_in_flight = max_in_flight
+        self.backpressure_timeout = backpressure_timeout
+        self.throttled = 0
+        self.published = 0
+
+        def noop_on_connected(device_token, rc):
+            pass
+
+        self.on_connected = noop_on_connected
+
+    def __len__(self):
+        return len(self.__devices)
+
+    @property
+    def devices(self):
+        return list(self.__devices.values())
+
+    @property
+    def connected(self):
+        return sum(1 for api in self.__apis.values() if api.connected)
+
+    @property
+    def refused(self):
+        # Tokens whose last CONNACK was a refusal, with its return code
+        with self.__state:
+            return dict(self.__refused)
+
+    @property
+    def in_flight(self):
+        return self.__in_flight
+
+    @property
+    def saturated(self):
+        return self.max_in_flight is not None and \
+            self.__in_flight >= self.max_in_flight
+
+    def add(self, device_token):
+        api = MqttApi(device_token, self.__host, self.__port,
+                      self.__tls_config,
+                      network=self.network,
+                      serializer=self.__serializer)
+        api.on_connected = lambda rc: self.__on_connected(device_token, rc)
+        api.on_published = self.__on_published
+        api.on_sent = self.__on_sent
+        self.__apis[device_token] = api
+        self.__devices[device_token] = device = Device(api)
+        return device
+
+    def __getitem__(self, device_token):
+        return self.__devices[device_token]
+
+    def api(self, device_token):
+        return self.__apis[device_token]
+
+    def __on_connected(self, device_token, rc):
+        with self.__state:
+            if is_success(rc):
+                self.__accepted.add(device_token)
+                self.__refused.pop(device_token, None)
+            else:
+                self.__accepted.discard(device_token)
+                self.__refused[device_token] = rc
+            self.__state.notify_all()
+        self.__resolve_waiting()
+        self.on_connected(device_token, rc)
+
+    def __answered(self, tokens):
+        return all(token in self.__accepted or token in self.__refused
+                   for token in tokens)
+
+    def __resolve_waiting(self):
+        with self.__state:
+            done = [(tokens, future) for tokens, future in self.__waiting
+                    if self.__answered(tokens)]
+            for waiting in done:
+                self.__waiting.remove(waiting)
+            results = [len(tokens & self.__accepted) for tokens, _ in done]
+        # Outside the lock: callbacks run right away, on this thread
+        for (_, future), accepted in zip(done, results):
+            future.set_result(accepted)
+
+    def __on_sent(self, mid):
+        with self.__state:
+            self.__in_flight += 1
+
+    def __on_published(self, mid):
+        with self.__state:
+            self.__in_flight -= 1
+            self.published += 1
+            self.__state.notify_all()
+
+    def connect(self, timeout=None):
+        # Waits for every device to be accepted or refused. Refused ones
+        # keep retrying in the background; see refused.
+        self.__start(self.__apis)
+        with self.__state:
+            self.__state.wait_for(lambda: self.__answered(self.__apis),
+                                  timeout)
+            accepted, refused = len(self.__accepted), dict(self.__refused)
+        for token, rc in refused.items():
+            log.error('Connection of %s refused: %s', token, rc)
+        return accepted
+
+    def connect_async(self, tokens=None):
+        # Returns a future resolved with the number of devices connected
+        # once all of the given ones (every device by default) have been
+        # accepted or refused
+        tokens = list(self.__apis) if tokens is None else list(tokens)
+        future = futures.Future()
+        with self.__state:
+            self.__waiting.append((set(tokens), future))
+        self.__start(tokens)
+        self.__resolve_waiting()
+        return future
+
+    def __start(self, tokens):
+        for token in tokens:
+            if token not in self.__started:
+                self.__started.add(token)
+                self.__begin_connect(token, self.__apis[token])
+
+    def __begin_connect(self, token, api, attempt=0):
+        try:
+            api.begin_connect()
+        except Exception as e:
+            log.info('Connection of %s failed: %s', token, str(e))
+            self.network.call_later(
+                backoff(attempt, RETRY_INTERVAL),
+                lambda: self.__begin_connect(token, api, attempt + 1))
+
+    def disconnect(self):
+        for api in self.__apis.values():
+            if api.connected:
+                api.disconnect()
+        self.network.close()
+        with self.__state:
+            self.__accepted.clear()
+            self.__refused.clear()
+            self.__started.clear()
+
+    def acquire(self, timeout=None):
+        if self.max_in_flight is None:
+            return True
+        with self.__state:
+            if self.__state.wait_for(lambda: not self.saturated, timeout):
+                return True
+            self.throttled += 1
+            return False
+
+    def __throttled(self, publish):
+        def throttled():
+            if self.acquire(self.backpressure_timeout):
+                publish()
+        return throttled
+
+    def schedule(self,
+                 data_interval=60,
+                 diag_interval=650,
+                 overrun=OVERRUN_SKIP,
+                 scheduler=None,
+                 tokens=None):
+        # Devices are spread evenly over each interval
+        scheduler = scheduler or Scheduler()
+        tokens = list(self.__devices) if tokens is None else tokens
+        for i, token in enumerate(tokens):
+            device = self.__devices[token]
+            phase = float(i) / len(tokens)
+            scheduler.add(self.__throttled(device.publish_data),
+                          data_interval, 'data ' + token, overrun,
+                          delay=phase * data_interval)
+            if diag_interval:
+                scheduler.add(self.__throttled(device.publish_diag),
+                              diag_interval, 'diag ' + token, overrun,
+                              delay=phase * diag_interval)
+        return scheduler
+
+    def run(self,
+            data_interval=60,
+            diag_interval=650,
+            overrun=OVERRUN_SKIP,
+            scheduler=None):
+        scheduler = self.schedule(data_interval, diag_interval, overrun,
+                                  scheduler)
+        scheduler.run()
+        return scheduler
+
+    def stats(self):
+        return {
+            'devices': len(self.__devices),
+            'connected': self.connected,
+            'in_flight': self.__in_flight,
+            'throttled': self.throttled,
+            'published': self.published,
+        }
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from cloud4rpi import utils
+
+# Outcomes of a publish
+PENDING = 'pending'  # waiting for the PUBACK or for room in the window
+ACKED = 'acked'
+DROPPED = 'dropped'  # dropped by the in-flight window
+STORED = 'stored'  # written to the outbox while disconnected
+
+
+class PublishHandle(object):
+    # Returned by the publish calls of MqttApi and Device. Kept small, as
+    # one exists for every message awaiting its PUBACK.
+
+    __slots__ = ('kind', 'topic', 'mid', 'state', 'sent_at', 'latency',
+                 '__event', '__callbacks')
+
+    # Guards the lazily created events and callback lists of all handles
+    __lock = threading.Lock()
+
+    def __init__(self, kind, topic):
+        self.kind = kind
+        self.topic = topic
+        self.mid = None
+        self.state = PENDING
+        self.sent_at = None
+        self.latency = None
+        self.__event = None
+        self.__callbacks = None
+
+    def __repr__(self):
+        return '<PublishHandle {0} mid={1} {2}>'.format(
+            self.kind, self.mid, self.state)
+
+    def done(self):
+        return self.state != PENDING
+
+    @property
+    def acked(self):
+        return self.state == ACKED
+
+    def wait(self, timeout=None):
+        with self.__lock:
+            if self.done():
+                return True
+            if self.__event is None:
+                self.__event = threading.Event()
+            event = self.__event
+        event.wait(timeout)
+        return self.done()
+
+    def add_done_callback(self, fn):
+        with self.__lock:
+            if not self.done():
+                if self.__callbacks is None:
+                    self.__callbacks = []
+                self.__callbacks.append(fn)
+                return
+        fn(self)
+
+    def sent(self, mid, now=None):
+        self.mid = mid
+        self.sent_at = utils.monotonic() if now is None else now
+
+    def resolve(self, state, now=None):
+        with self.__lock:
+            if self.done():
+                return
+            if state == ACKED and self.sent_at is not None:
+                now = utils.monotonic() if now is None else now
+                self.latency = now - self.sent_at
+            self.state = state
+            event, self.__event = self.__event, None
+            callbacks, self.__callbacks = self.__callbacks, None
+        if event is not None:
+            event.set()
+        for fn in callbacks or ():
+            fn(self)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from bisect import bisect_left
+
+# Upper bounds of the publish-to-ack latency buckets
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5,
+                   1, 2.5, 5, 10)  # sec
+
+
+class Histogram(object):
+    # Counts observations in fixed buckets: recording one is a bisect and
+    # an increment, cheap enough to do for every PUBACK. Percentiles are
+    # reported as the upper bound of the bucket they fall into.
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0
+
+    def record(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0
+
+    def percentile(self, q):
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def stats(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'max': self.max,
+            'p50': self.percentile(.5),
+            'p90': self.percentile(.9),
+            'p99': self.percentile(.99),
+        }
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+from cloud4rpi import utils
+
+HISTORY_CAPACITY = 3600  # samples per variable
+HISTORY_TYPES = (utils.NUMERIC_TYPE, utils.BOOL_TYPE)
+SAMPLE_SIZE = 2 * array('d').itemsize  # bytes: timestamp and value
+
+
+def get_numpy():
+    try:
+        import numpy  # pylint: disable=E0401
+    except ImportError:
+        return None
+    return numpy
+
+
+class RingBuffer(object):
+    # The last `capacity` (timestamp, value) samples in two preallocated
+    # arrays of doubles, so a sample takes SAMPLE_SIZE bytes whatever the
+    # history length. Timestamps never go backwards: one earlier than the
+    # last (the wall clock was set back) is taken as the last.
+
+    __slots__ = ('capacity', 'timestamps', 'values', 'next', 'length')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = array('d', [0.0]) * capacity
+        self.values = array('d', [0.0]) * capacity
+        self.next = 0
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def nbytes(self):
+        return self.capacity * SAMPLE_SIZE
+
+    def append(self, ts, value):
+        if self.length:
+            ts = max(ts, self.timestamps[self.next - 1])
+        self.timestamps[self.next] = ts
+        self.values[self.next] = value
+        self.next = (self.next + 1) % self.capacity
+        if self.length < self.capacity:
+            self.length += 1
+
+    def __ordered(self, data):
+        if self.length < self.capacity:
+            return data[:self.length]
+        return data[self.next:] + data[:self.next]
+
+    def range(self, start=None, end=None):
+        # Timestamps and values in [start, end], oldest first, as arrays
+        timestamps = self.__ordered(self.timestamps)
+        first = 0 if start is None else bisect_left(timestamps, start)
+        last = len(timestamps) if end is None \
+            else bisect_right(timestamps, end)
+        return timestamps[first:last], self.__ordered(self.values)[first:last]
+
+
+def downsample(timestamps, values, bucket):
+    # (bucket start, min, max, mean) per `bucket` seconds that has samples
+    if not timestamps:
+        return []
+    numpy = get_numpy()
+    if numpy is not None:
+        return __downsample_vectorized(numpy, timestamps, values, bucket)
+
+    buckets = []
+    origin = timestamps[0]
+    current = None
+    for ts, value in zip(timestamps, values):
+        index = int((ts - origin) // bucket)
+        if index != current:
+            current = index
+            buckets.append([origin + index * bucket, value, value, 0.0, 0])
+        acc = buckets[-1]
+        if value < acc[1]:
+            acc[1] = value
+        if value > acc[2]:
+            acc[2] = value
+        acc[3] += value
+        acc[4] += 1
+    return [(start, low, high, total / count)
+            for start, low, high, total, count in buckets]
+
+
+def __downsample_vectorized(numpy, timestamps, values, bucket):
+    ts = numpy.frombuffer(timestamps, dtype=numpy.float64)
+    vs = numpy.frombuffer(values, dtype=numpy.float64)
+    indices = ((ts - ts[0]) // bucket).astype(numpy.int64)
+    starts = numpy.flatnonzero(numpy.r_[True, indices[1:] != indices[:-1]])
+    counts = numpy.diff(numpy.r_[starts, len(vs)])
+    lows = numpy.minimum.reduceat(vs, starts)
+    highs = numpy.maximum.reduceat(vs, starts)
+    means = numpy.add.reduceat(vs, starts) / counts
+    origins = ts[0] + indices[starts] * bucket
+    return list(zip(origins.tolist(), lows.tolist(), highs.tolist(),
+                    means.tolist()))
+
+
+class History(object):
+    # Ring buffers of the numeric and bool variables of a device, filled by
+    # read_data() and by commands, possibly on other threads. Bools are kept
+    # as 0.0 and 1.0.
+
+    def __init__(self, capacity=HISTORY_CAPACITY):
+        self.capacity = capacity
+        self.__lock = threading.Lock()
+        self.__buffers = {}
+
+    def __contains__(self, name):
+        return name in self.__buffers
+
+    @property
+    def names(self):
+        with self.__lock:
+            return sorted(self.__buffers)
+
+    @property
+    def nbytes(self):
+        with self.__lock:
+            return sum(buf.nbytes for buf in self.__buffers.values())
+
+    def record(self, name, value, ts=None):
+        if value is None:
+            return
+        with self.__lock:
+            buf = self.__buffers.get(name, None)
+            if buf is None:
+                buf = self.__buffers[name] = RingBuffer(self.capacity)
+            buf.append(time.time() if ts is None else ts, value)
+
+    def __range(self, name, start, end):
+        with self.__lock:
+            buf = self.__buffers.get(name, None)
+            if buf is None:
+                return None
+            return buf.range(start, end)
+
+    def query(self, name, start=None, end=None):
+        # [(timestamp, value)] in [start, end], oldest first
+        samples = self.__range(name, start, end)
+        if samples is None:
+            return []
+        return list(zip(*samples))
+
+    def downsample(self, name, bucket, start=None, end=None):
+        samples = self.__range(name, start, end)
+        if samples is None:
+            return []
+        return downsample(*samples, bucket=bucket)
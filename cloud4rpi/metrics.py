@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from cloud4rpi.histogram import Histogram, LATENCY_BUCKETS
+
+# Durations of in-process work: binding reads, serialization
+TIMING_BUCKETS = (.00001, .000025, .00005, .0001, .00025, .0005,
+                  .001, .0025, .005, .01, .025, .05, .1, .25, 1)  # sec
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+# name: (type, label, help)
+METRICS = {
+    'published_messages': (COUNTER, 'topic', 'Messages published'),
+    'published_bytes': (COUNTER, 'topic', 'Payload bytes published'),
+    'acks': (COUNTER, 'kind', 'PUBACKs received'),
+    'reconnects': (COUNTER, None, 'Reconnection attempts'),
+    'commands': (COUNTER, 'variable', 'Commands applied'),
+    'commands_coalesced': (COUNTER, 'variable',
+                           'Commands replaced by a later one before running'),
+    'validation_errors': (COUNTER, 'variable',
+                          'Values rejected by the variable type'),
+    'binding_errors': (COUNTER, 'variable', 'Exceptions raised by bindings'),
+    'read_seconds': (HISTOGRAM, None, 'Time to read all bindings'),
+    'binding_read_seconds': (HISTOGRAM, 'variable',
+                             'Binding read time, when profiled or read '
+                             'concurrently'),
+    'serialize_seconds': (HISTOGRAM, 'kind', 'Message serialization time'),
+    'ack_latency_seconds': (HISTOGRAM, 'kind', 'Publish to PUBACK latency'),
+    'command_queue_seconds': (HISTOGRAM, 'variable',
+                              'Time commands wait for a worker'),
+}
+
+BUCKETS = {
+    'read_seconds': TIMING_BUCKETS,
+    'binding_read_seconds': TIMING_BUCKETS,
+    'serialize_seconds': TIMING_BUCKETS,
+    'ack_latency_seconds': LATENCY_BUCKETS,
+    'command_queue_seconds': LATENCY_BUCKETS,
+}
+
+
+class Metrics(object):
+    # Counters and histograms keyed by metric name and a single label value
+    # (topic, kind or variable name, see METRICS). A disabled registry
+    # records nothing, and callers on hot paths check enabled before
+    # timing anything.
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.__lock = threading.Lock()
+        self.__counters = {}
+        self.__histograms = {}
+
+    def inc(self, name, label=None, value=1):
+        if not self.enabled:
+            return
+        with self.__lock:
+            counter = self.__counters.get(name, None)
+            if counter is None:
+                counter = self.__counters[name] = {}
+            counter[label] = counter.get(label, 0) + value
+
+    def observe(self, name, value, label=None):
+        if not self.enabled:
+            return
+        with self.__lock:
+            histograms = self.__histograms.get(name, None)
+            if histograms is None:
+                histograms = self.__histograms[name] = {}
+            histogram = histograms.get(label, None)
+            if histogram is None:
+                histogram = histograms[label] = \
+                    Histogram(BUCKETS.get(name, LATENCY_BUCKETS))
+            histogram.record(value)
+
+    def counters(self, name):
+        with self.__lock:
+            return dict(self.__counters.get(name, {}))
+
+    def histograms(self, name):
+        with self.__lock:
+            return dict(self.__histograms.get(name, {}))
+
+    def collect(self):
+        # (name, {label: value or Histogram}) for every recorded metric
+        with self.__lock:
+            collected = [(name, dict(values))
+                         for name, values in self.__counters.items()]
+            collected += [(name, dict(values))
+                          for name, values in self.__histograms.items()]
+        return sorted(collected, key=lambda item: item[0])
+
+    def stats(self):
+        result = {}
+        for name, values in self.collect():
+            values = {label: value.stats() if isinstance(value, Histogram)
+                      else value
+                      for label, value in values.items()}
+            # Unlabelled metrics are reported as a plain value
+            result[name] = values[None] if list(values) == [None] \
+                else values
+        return result
+
+    def reset(self):
+        with self.__lock:
+            self.__counters = {}
+            self.__histograms = {}
@@ -1,18 +1,27 @@
 # -*- coding: utf-8 -*-
 
-import time
 import logging
 import json
+import threading
+from collections import OrderedDict
+from concurrent import futures
 import paho.mqtt.client as mqtt
 
 from cloud4rpi import config
 from cloud4rpi import utils
 from cloud4rpi import __version__
 from cloud4rpi.errors import MqttConnectionError
+from cloud4rpi.network import ThreadedLoop
+from cloud4rpi.supervisor import Supervisor
+from cloud4rpi.window import SEND, DROPPED
+from cloud4rpi import handles
+from cloud4rpi.metrics import Metrics
+from cloud4rpi.serializer import Envelope, get_serializer
 
 KEEP_ALIVE_INTERVAL = 30  # sec
-RETRY_INTERVAL = 5  # sec
+CONNECT_TIMEOUT = 30  # sec
 CONNECT_RESULT_UNDEFINED = 255
+MAX_EARLY_ACKS = 1024  # mids
 
 log = logging.getLogger(config.loggerName)
 
@@ -26,12 +35,28 @@ class MqttApi(object):
                  device_token,
                  host=config.mqqtBrokerHost,
                  port=config.mqttBrokerPort,
-                 tls_config=None):
+                 tls_config=None,
+                 outbox=None,
+                 network=None,
+                 serializer=None,
+                 codec=None,
+                 reconnect_policy=None,
+                 window=None,
+                 metrics=None):
         utils.guard_against_invalid_token(device_token)
 
         def noop_on_command(cmd):
             pass
 
+        def noop_on_connected(rc):
+            pass
+
+        def noop_on_published(mid):
+            pass
+
+        def noop_on_sent(mid):
+            pass
+
         self.__device_token = device_token
         self.__client = mqtt.Client(device_token, clean_session=False)
         self.__host = host
@@ -41,10 +66,35 @@ class MqttApi(object):
             self.__client.tls_set(**tls_config)
 
         self.__qos = 1
-        self.__connect_result = None
+        self.__connecting = None
+        self.__connected = False
 
         self.on_command = noop_on_command
+        self.on_connected = noop_on_connected
+        self.on_published = noop_on_published
+        self.on_sent = noop_on_sent
         self.__outgoing_messages = {}
+        self.__acks_lock = threading.Lock()
+        self.__sending = 0
+        self.__early_acks = OrderedDict()
+        self.__metrics = Metrics() if metrics is None else metrics
+        self.__network = network or ThreadedLoop()
+        self.__supervisor = Supervisor(self.__network, self.__client,
+                                       reconnect_policy, self.__metrics)
+
+        self.__outbox = outbox
+        self.__outbox_messages = {}
+
+        self.__serializer = serializer or get_serializer()
+        self.__envelope = Envelope(self.__serializer)
+        self.__config_envelope = Envelope(self.__serializer, {
+            'v': __version__,
+            'l': 'py',
+        })
+        self.__codec = codec
+        self.__window = window
+        self.__topics = {}
+        self.__topic_prefix = len(self.__format_topic(''))
 
     @property
     def commands_topic(self):
@@ -62,22 +112,101 @@ class MqttApi(object):
     def diag_topic(self):
         return self.__format_topic('diagnostics')
 
+    @property
+    def connected(self):
+        return self.__connected
+
+    @property
+    def supervisor(self):
+        return self.__supervisor
+
+    @property
+    def window(self):
+        return self.__window
+
+    @property
+    def metrics(self):
+        return self.__metrics
+
+    @property
+    def ack_latency(self):
+        # Publish-to-PUBACK latency histograms by kind: config, data, diag,
+        # or the data type, such as cr
+        return self.__metrics.histograms('ack_latency_seconds')
+
+    @property
+    def in_flight(self):
+        # Messages sent and still waiting for their PUBACK
+        with self.__acks_lock:
+            return len(self.__outgoing_messages)
+
     def __format_topic(self, tail):
-        return 'devices/{0}/{1}'.format(self.__device_token, tail)
+        topic = self.__topics.get(tail, None)
+        if topic is None:
+            topic = 'devices/{0}/{1}'.format(self.__device_token, tail)
+            self.__topics[tail] = topic
+        return topic
+
+    def connect(self, timeout=None):
+        future = self.connect_async()
+        try:
+            return future.result(timeout)
+        except futures.TimeoutError:
+            log.error('No response from %s:%s in %s sec',
+                      self.__host, self.__port, timeout)
+            self.__abort_connect()
+            raise MqttConnectionError(CONNECT_RESULT_UNDEFINED)
+        except MqttConnectionError:
+            self.__abort_connect()
+            raise
+
+    def connect_async(self):
+        # Resolves with the CONNACK code. Messages published meanwhile are
+        # kept in the client's queue (or the outbox) until the connection
+        # is up.
+        future = self.__connecting = futures.Future()
+        try:
+            self.begin_connect()
+        except Exception as e:
+            self.__connecting = None
+            future.set_exception(e)
+        return future
+
+    def __abort_connect(self):
+        self.__connecting = None
+        self.__supervisor.close()
+        # Queuing DISCONNECT wakes the network thread from its select(), so
+        # stopping it does not wait out the loop timeout
+        self.__client.disconnect()
+        self.__network.stop(self.__client)
 
-    def connect(self):
+    def __resolve_connect(self, rc):
+        future, self.__connecting = self.__connecting, None
+        if future is None or future.done():
+            return
+        if is_success(rc):
+            future.set_result(rc)
+        else:
+            future.set_exception(MqttConnectionError(rc))
+
+    def begin_connect(self):
         def on_connect(client, userdata, flags, rc):
             if not is_success(rc):
                 log.error('Connection failed: %s', rc)
-                raise MqttConnectionError(rc)
+                self.on_connected(rc)
+                self.__resolve_connect(rc)
+                return
 
             log.info('Connected')
-            self.__connect_result = rc
-            self.__outgoing_messages = {}
+            self.__connected = True
 
             log.info('Subscribing %s with QoS %s',
                      self.commands_topic, str(self.__qos))
             self.__client.subscribe(self.commands_topic, qos=self.__qos)
+            self.__drain_outbox()
+            self.__supervisor.connected()
+            self.on_connected(rc)
+            self.__resolve_connect(rc)
 
         def on_message(client, userdata, msg):
             log.info('Command received %s: %s', msg.topic, msg.payload)
@@ -88,79 +217,206 @@ class MqttApi(object):
 
         def on_disconnect(client, userdata, rc):
             log.info('Disconnected with code: %s', rc)
+            self.__connected = False
             self.__on_disconnect(rc)
 
         def on_publish(client, packet, mid):
-            info = self.__outgoing_messages.pop(mid, None)
-            if info is not None:
-                log.info('Published %s: %s', info['topic'], info['msg'])
+            now = utils.monotonic()
+            with self.__acks_lock:
+                handle = self.__outgoing_messages.pop(mid, None)
+                if handle is None and self.__sending and \
+                        mid not in self.__outbox_messages:
+                    # Acked before __publish_now got the mid back
+                    self.__early_acks[mid] = now
+                    while len(self.__early_acks) > MAX_EARLY_ACKS:
+                        self.__early_acks.popitem(last=False)
+            if handle is not None:
+                self.__acked(handle, now)
+            key = self.__outbox_messages.pop(mid, None)
+            if key is not None:
+                self.__outbox.ack(key)
+                if not self.__outbox_messages:
+                    self.__drain_outbox()
+            self.on_published(mid)
 
         self.__client.on_connect = on_connect
         self.__client.on_message = on_message
         self.__client.on_disconnect = on_disconnect
         self.__client.on_publish = on_publish
+        self.__network.attach(self.__client)
 
         log.info('Connecting %s:%s', self.__host, self.__port)
-        self.__client.connect(self.__host, self.__port,
-                              keepalive=KEEP_ALIVE_INTERVAL)
-
-        self.__connect_result = CONNECT_RESULT_UNDEFINED
-        self.__client.loop_start()
-
-        while self.__connect_result == CONNECT_RESULT_UNDEFINED:
-            time.sleep(.01)
+        self.__supervisor.connecting()
+        try:
+            self.__client.connect(self.__host, self.__port,
+                                  keepalive=KEEP_ALIVE_INTERVAL)
+        except Exception:
+            self.__supervisor.close()
+            raise
+        self.__network.start(self.__client)
 
     def __on_disconnect(self, rc):
         if is_success(rc):
+            self.__supervisor.close()
+        else:
+            self.__supervisor.lost()
+
+    def disconnect(self):
+        self.__supervisor.close()
+        # Queuing DISCONNECT wakes the network thread from its select(), so
+        # stopping it does not wait out the loop timeout
+        self.__client.disconnect()
+        self.__network.stop(self.__client)
+        if self.__outbox is not None:
+            self.__outbox.close()
+
+    def __drain_outbox(self):
+        # Backlog goes out one batch at a time, so live messages published
+        # meanwhile are interleaved with it instead of queued behind it.
+        if self.__outbox is None or self.__outbox_messages:
             return
 
-        while True:
-            log.info('Reconnecting')
+        batch = self.__outbox.read_batch()
+        if not batch:
+            self.__outbox.compact()
+            return
 
-            try:
-                self.__client.reconnect()
-                return
-            except Exception as e:
-                log.info('Reconnection failed: %s', str(e))
+        log.info('Replaying %s stored messages', len(batch))
+        for key, topic, payload in batch:
+            (_, mid) = self.__client.publish(topic,
+                                             qos=self.__qos,
+                                             payload=payload)
+            self.__outbox_messages[mid] = key
+            self.__count_published(topic, payload)
 
-            time.sleep(RETRY_INTERVAL)
+    def publish_config(self, msg, **kwargs):
+        if self.__codec is not None and msg is not None:
+            self.__codec.set_config(msg)
+        return self.__publish('config', self.config_topic,
+                              self.__config_envelope, msg, **kwargs)
 
-    def disconnect(self):
-        self.__client.loop_stop()
-        self.__client.disconnect()
+    def publish_data(self, msg, **kwargs):
+        dt = kwargs.pop('data_type', None)
+        if dt:
+            return self.__publish(dt, self.__format_topic('data/' + dt),
+                                  self.__envelope, msg, **kwargs)
 
-    def publish_config(self, msg):
-        client = {
-            'v': __version__,
-            'l': 'py',
-        }
-        self.__publish(self.config_topic, payload=msg, client_info=client)
+        return self.__publish_encoded('data', 'data', msg, **kwargs)
 
-    def publish_data(self, msg, **kwargs):
-        dt = kwargs.get('data_type')
-        topic = '{0}/{1}'.format(self.data_topic, dt) if dt else self.data_topic
+    def publish_data_batch(self, samples, **kwargs):
+        if not samples:
+            return
+
+        started = utils.monotonic()
+        if self.__codec is not None:
+            suffix, message = self.__codec.encode_batch(self.__serializer,
+                                                        samples)
+            topic = self.__encoded_topic('data', suffix)
+        else:
+            msg = [{'ts': ts, 'payload': payload} for ts, payload in samples]
+            message = self.__serializer.dumps(msg)
+            topic = self.data_topic
+        self.__serialized('data', started)
+        return self.__send('data', topic, message, **kwargs)
+
+    def publish_diag(self, msg, **kwargs):
+        return self.__publish_encoded('diag', 'diagnostics', msg, **kwargs)
+
+    def __publish_encoded(self, kind, tail, payload, **kwargs):
+        if self.__codec is None:
+            return self.__publish(kind, self.__format_topic(tail),
+                                  self.__envelope, payload, **kwargs)
+        if payload is None:
+            return
 
-        self.__publish(topic, msg)
+        started = utils.monotonic()
+        suffix, message = self.__codec.encode(self.__serializer,
+                                              self.__envelope,
+                                              utils.utcnow(), payload)
+        self.__serialized(kind, started)
+        return self.__send(kind, self.__encoded_topic(tail, suffix),
+                           message, **kwargs)
 
-    def publish_diag(self, msg):
-        self.__publish(self.diag_topic, msg)
+    def __encoded_topic(self, tail, suffix):
+        return self.__format_topic(tail + '/' + suffix if suffix else tail)
 
-    def __publish(self, topic, payload=None, client_info=None):
+    def __publish(self, kind, topic, envelope, payload=None, **kwargs):
         if payload is None:
             return
 
-        msg = {
-            'ts': utils.utcnow(),
-            'payload': payload,
-        }
-        if client_info:
-            msg.update(client_info)
-
-        (_, mid) = self.__client.publish(topic,
-                                         qos=self.__qos,
-                                         payload=json.dumps(msg))
-
-        self.__outgoing_messages[mid] = {
-            'topic': topic,
-            'msg': msg,
-        }
+        started = utils.monotonic()
+        message = envelope.build(utils.utcnow(), payload)
+        self.__serialized(kind, started)
+        return self.__send(kind, topic, message, **kwargs)
+
+    def __serialized(self, kind, started):
+        self.__metrics.observe('serialize_seconds',
+                               utils.monotonic() - started, kind)
+
+    def __count_published(self, topic, message):
+        # Labelled by the topic tail: the device token stays out of metrics
+        tail = topic[self.__topic_prefix:]
+        self.__metrics.inc('published_messages', tail)
+        self.__metrics.inc('published_bytes', tail, len(message))
+
+    def __send(self, kind, topic, message, policy=None, timeout=None):
+        # policy and timeout override the window's own for this message
+        handle = handles.PublishHandle(kind, topic)
+        if self.__outbox is not None and not self.__connected:
+            self.__outbox.append(topic, message)
+            handle.resolve(handles.STORED)
+            return handle
+
+        if self.__window is not None:
+            admitted = self.__window.admit(topic, message, policy, timeout,
+                                           handle,
+                                           not self.__network.in_loop())
+            if admitted == DROPPED:
+                log.warning('In-flight window full, dropped %s', topic)
+                handle.resolve(handles.DROPPED)
+            if admitted != SEND:
+                return handle
+
+        self.__publish_now(topic, message, handle)
+        return handle
+
+    def __publish_now(self, topic, message, handle):
+        with self.__acks_lock:
+            self.__sending += 1
+        # Taken before publish(): its PUBACK may be stamped before it returns
+        sent_at = utils.monotonic()
+        try:
+            (_, mid) = self.__client.publish(topic,
+                                             qos=self.__qos,
+                                             payload=message)
+        except Exception:
+            with self.__acks_lock:
+                self.__sending -= 1
+            if self.__window is not None:
+                self.__window.release()
+            raise
+
+        handle.sent(mid, sent_at)
+        self.__count_published(topic, message)
+        with self.__acks_lock:
+            self.__sending -= 1
+            acked_at = self.__early_acks.pop(mid, None)
+            if acked_at is None:
+                self.__outgoing_messages[mid] = handle
+        self.on_sent(mid)
+        if self.__window is not None:
+            self.__window.sent(mid)
+        if acked_at is not None:
+            self.__acked(handle, acked_at)
+
+    def __acked(self, handle, now):
+        log.info('Published %s', handle.topic)
+        handle.resolve(handles.ACKED, now)
+        self.__metrics.inc('acks', handle.kind)
+        if handle.latency is not None:
+            self.__metrics.observe('ack_latency_seconds', handle.latency,
+                                   handle.kind)
+        if self.__window is not None:
+            held = self.__window.acked(handle.mid)
+            if held is not None:
+                self.__publish_now(*held)
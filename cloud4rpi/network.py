@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import random
+import logging
+import threading
+
+from cloud4rpi import config
+
+RETRY_INTERVAL = 5  # sec
+MAX_RETRY_INTERVAL = 60  # sec
+LOOP_TIMEOUT = 1  # sec
+
+log = logging.getLogger(config.loggerName)
+
+
+def backoff(attempt, interval=RETRY_INTERVAL, cap=MAX_RETRY_INTERVAL):
+    # Capped exponential backoff with full jitter, so clients dropped at
+    # the same moment do not come back in lockstep.
+    return random.uniform(0, min(cap, interval * 2 ** attempt))
+
+
+class ThreadedLoop(object):
+    # Runs each client's network I/O on a thread of its own. Reconnects are
+    # scheduled by the client's supervisor on timer threads, so this thread
+    # only ever waits on the socket.
+
+    def __init__(self):
+        self.__lock = threading.Condition()
+        self.__threads = {}
+        self.__timers = {}
+
+    def attach(self, client):
+        def on_socket_open(c, userdata, sock):
+            with self.__lock:
+                self.__lock.notify_all()
+
+        client.on_socket_open = on_socket_open
+
+    def start(self, client):
+        with self.__lock:
+            if client in self.__threads:
+                return
+            stopped = threading.Event()
+            thread = threading.Thread(target=self.__run,
+                                      args=(client, stopped),
+                                      name='cloud4rpi-network')
+            thread.daemon = True
+            self.__threads[client] = (thread, stopped)
+        thread.start()
+
+    def stop(self, client):
+        with self.__lock:
+            for timer in self.__timers.pop(client, []):
+                timer.cancel()
+            thread, stopped = self.__threads.pop(client, (None, None))
+            if stopped is not None:
+                stopped.set()
+                self.__lock.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def in_loop(self):
+        # Whether the current thread is one of the network threads
+        current = threading.current_thread()
+        with self.__lock:
+            return any(thread is current
+                       for thread, _ in self.__threads.values())
+
+    def call_later(self, delay, fn, client=None):
+        timer = threading.Timer(delay, fn)
+        timer.daemon = True
+        with self.__lock:
+            timers = [t for t in self.__timers.get(client, [])
+                      if t.is_alive()]
+            self.__timers[client] = timers + [timer]
+        timer.start()
+
+    def __run(self, client, stopped):
+        while not stopped.is_set():
+            if client.socket() is None:
+                with self.__lock:
+                    if not stopped.is_set() and client.socket() is None:
+                        self.__lock.wait(LOOP_TIMEOUT)
+                continue
+            try:
+                client.loop(LOOP_TIMEOUT)
+            except Exception as e:
+                log.exception('Network loop error: %s', str(e))
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import struct
+import zlib
+import logging
+import threading
+from collections import OrderedDict
+
+from cloud4rpi import config
+
+SEGMENT_SIZE = 1024 * 1024  # bytes
+MAX_SIZE = 64 * 1024 * 1024  # bytes
+BATCH_SIZE = 100  # messages
+
+SEGMENT_EXT = '.seg'
+CURSOR_FILE = 'cursor'
+
+# crc32, body length, expiration timestamp (0 - never), topic length
+RECORD_HEADER = struct.Struct('>IIdH')
+
+log = logging.getLogger(config.loggerName)
+
+
+def segment_name(segment):
+    return '{0:020d}{1}'.format(segment, SEGMENT_EXT)
+
+
+class Outbox(object):
+    def __init__(self,
+                 path,
+                 segment_size=SEGMENT_SIZE,
+                 max_size=MAX_SIZE,
+                 ttl=None,
+                 batch_size=BATCH_SIZE):
+        self.path = path
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.ttl = ttl
+        self.batch_size = batch_size
+
+        self.__lock = threading.Lock()
+        self.__sizes = OrderedDict()
+        self.__writer = None
+        self.__writer_segment = None
+        self.__reader = None
+        self.__reader_segment = None
+        self.__unacked = OrderedDict()
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self.__load()
+
+    def __segment_path(self, segment):
+        return os.path.join(self.path, segment_name(segment))
+
+    def __load(self):
+        segments = sorted(int(f[:-len(SEGMENT_EXT)])
+                          for f in os.listdir(self.path)
+                          if f.endswith(SEGMENT_EXT))
+        for segment in segments:
+            self.__sizes[segment] = \
+                os.path.getsize(self.__segment_path(segment))
+
+        if segments:
+            self.__recover(segments[-1])
+        else:
+            self.__sizes[1] = 0
+
+        self.__commit = self.__read_cursor()
+        first = next(iter(self.__sizes))
+        if self.__commit[0] < first:
+            self.__commit = (first, 0)
+        self.__position = self.__commit
+        self.__open_writer()
+
+    def __recover(self, segment):
+        # Drops a partially written record left by a power loss
+        valid = 0
+        with open(self.__segment_path(segment), 'rb') as f:
+            while True:
+                record = self.__read_record(f)
+                if record is None:
+                    break
+                valid = f.tell()
+
+        if valid != self.__sizes[segment]:
+            log.warning('Outbox: truncating damaged segment %s at %s',
+                        segment, valid)
+            with open(self.__segment_path(segment), 'r+b') as f:
+                f.truncate(valid)
+            self.__sizes[segment] = valid
+
+    def __read_cursor(self):
+        try:
+            with open(os.path.join(self.path, CURSOR_FILE)) as f:
+                segment, offset = f.read().split()
+                return int(segment), int(offset)
+        except (IOError, OSError, ValueError):
+            return 0, 0
+
+    def __write_cursor(self):
+        cursor = os.path.join(self.path, CURSOR_FILE)
+        tmp = cursor + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write('{0} {1}'.format(*self.__commit))
+        os.rename(tmp, cursor)
+
+    def __open_writer(self):
+        segment = next(reversed(self.__sizes))
+        self.__writer_segment = segment
+        self.__writer = open(self.__segment_path(segment), 'ab')
+
+    def __rotate(self):
+        self.__writer.close()
+        self.__sizes[self.__writer_segment + 1] = 0
+        self.__open_writer()
+
+    def __drop_oldest(self):
+        segment, size = self.__sizes.popitem(last=False)
+        log.warning('Outbox: size limit reached, dropping %s bytes', size)
+        if self.__reader_segment == segment:
+            self.__close_reader()
+        os.remove(self.__segment_path(segment))
+
+        first = next(iter(self.__sizes))
+        if self.__commit[0] <= segment:
+            self.__commit = (first, 0)
+            self.__write_cursor()
+        if self.__position[0] <= segment:
+            self.__position = (first, 0)
+        for key in [k for k in self.__unacked if k[0] <= segment]:
+            del self.__unacked[key]
+
+    def __pending_bytes(self):
+        segment, offset = self.__position
+        return sum(size for s, size in self.__sizes.items()
+                   if s >= segment) - offset
+
+    def __close_reader(self):
+        if self.__reader is not None:
+            self.__reader.close()
+        self.__reader = None
+        self.__reader_segment = None
+
+    @staticmethod
+    def __read_record(f):
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return None
+        crc, length, expires, topic_length = RECORD_HEADER.unpack(header)
+        body = f.read(length)
+        if len(body) < length or zlib.crc32(body) & 0xffffffff != crc:
+            return None
+        return (body[:topic_length].decode('utf-8'),
+                body[topic_length:],
+                expires)
+
+    def append(self, topic, payload, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.time() + ttl if ttl else 0
+        if not isinstance(payload, bytes):
+            payload = payload.encode('utf-8')
+        topic = topic.encode('utf-8')
+        body = topic + payload
+        record = RECORD_HEADER.pack(zlib.crc32(body) & 0xffffffff,
+                                    len(body),
+                                    expires,
+                                    len(topic)) + body
+
+        with self.__lock:
+            if self.__writer is None:
+                # Closed: reopened to keep storing after a disconnect
+                self.__open_writer()
+            if self.__sizes[self.__writer_segment] >= self.segment_size:
+                self.__rotate()
+            self.__writer.write(record)
+            self.__writer.flush()
+            self.__sizes[self.__writer_segment] += len(record)
+
+            while sum(self.__sizes.values()) > self.max_size \
+                    and len(self.__sizes) > 1:
+                self.__drop_oldest()
+
+    def read_batch(self, count=None):
+        count = self.batch_size if count is None else count
+        batch = []
+        now = time.time()
+        with self.__lock:
+            while len(batch) < count:
+                segment, offset = self.__position
+                if segment == self.__writer_segment and \
+                        offset >= self.__sizes[segment]:
+                    break
+                if offset >= self.__sizes.get(segment, 0):
+                    self.__close_reader()
+                    self.__position = (segment + 1, 0)
+                    continue
+
+                if self.__reader_segment != segment:
+                    self.__close_reader()
+                    self.__reader = open(self.__segment_path(segment), 'rb')
+                    self.__reader_segment = segment
+                if self.__reader.tell() != offset:
+                    self.__reader.seek(offset)
+                record = self.__read_record(self.__reader)
+                if record is None:
+                    log.error('Outbox: damaged record in segment %s at %s',
+                              segment, offset)
+                    self.__position = (segment, self.__sizes[segment])
+                    continue
+
+                key = (segment, self.__reader.tell())
+                self.__position = key
+                topic, payload, expires = record
+                if expires and expires < now:
+                    self.__unacked[key] = True
+                    continue
+                self.__unacked[key] = False
+                batch.append((key, topic, payload))
+
+            self.__advance_commit()
+        return batch
+
+    def ack(self, key):
+        with self.__lock:
+            if key in self.__unacked:
+                self.__unacked[key] = True
+                self.__advance_commit()
+
+    def __advance_commit(self):
+        commit = None
+        while self.__unacked:
+            key, acked = next(iter(self.__unacked.items()))
+            if not acked:
+                break
+            del self.__unacked[key]
+            commit = key
+        if commit is not None:
+            self.__commit = commit
+            # Persisting once per drained batch keeps replay off the disk
+            if not self.__unacked:
+                self.__write_cursor()
+
+    def is_empty(self):
+        with self.__lock:
+            return self.__pending_bytes() <= 0
+
+    def compact(self):
+        removed = 0
+        with self.__lock:
+            for segment, size in list(self.__sizes.items()):
+                if segment == self.__writer_segment:
+                    break
+                if (segment, size) > self.__commit:
+                    break
+                if self.__reader_segment == segment:
+                    self.__close_reader()
+                del self.__sizes[segment]
+                os.remove(self.__segment_path(segment))
+                removed += 1
+        return removed
+
+    def close(self):
+        with self.__lock:
+            self.__write_cursor()
+            self.__close_reader()
+            if self.__writer is not None:
+                self.__writer.close()
+                self.__writer = None
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+import json
+import zlib
+import struct
+
+from cloud4rpi import utils
+
+# Appended to the codec name when variable names are sent as indexes
+# into the last published config
+NAMES_SUFFIX = '-idx'
+
+
+def pack_msgpack(obj):
+    out = []
+    __pack(obj, out)
+    return b''.join(out)
+
+
+def __pack(obj, out):  # pylint: disable=R0912
+    if obj is None:
+        out.append(b'\xc0')
+    elif obj is True:
+        out.append(b'\xc3')
+    elif obj is False:
+        out.append(b'\xc2')
+    elif utils.is_integer(obj):
+        __pack_int(obj, out)
+    elif isinstance(obj, float):
+        out.append(struct.pack('>Bd', 0xcb, obj))
+    elif utils.is_string(obj):
+        data = obj.encode('utf-8')
+        __pack_header(len(data), 0xa0, 32, 0xd9, 0xda, 0xdb, out)
+        out.append(data)
+    elif isinstance(obj, (bytes, bytearray)):
+        __pack_header(len(obj), None, 0, 0xc4, 0xc5, 0xc6, out)
+        out.append(bytes(obj))
+    elif isinstance(obj, (list, tuple)):
+        __pack_header(len(obj), 0x90, 16, None, 0xdc, 0xdd, out)
+        for item in obj:
+            __pack(item, out)
+    elif isinstance(obj, dict):
+        __pack_header(len(obj), 0x80, 16, None, 0xde, 0xdf, out)
+        for key, value in obj.items():
+            __pack(key, out)
+            __pack(value, out)
+    else:
+        raise TypeError('Cannot pack {0!r}'.format(obj))
+
+
+def __pack_header(length, fix, fix_limit, code8, code16, code32, out):
+    if length < fix_limit:
+        out.append(struct.pack('>B', fix | length))
+    elif code8 is not None and length < 0x100:
+        out.append(struct.pack('>BB', code8, length))
+    elif length < 0x10000:
+        out.append(struct.pack('>BH', code16, length))
+    else:
+        out.append(struct.pack('>BI', code32, length))
+
+
+def __pack_int(value, out):
+    if 0 <= value < 0x80:
+        out.append(struct.pack('>B', value))
+    elif -0x20 <= value < 0:
+        out.append(struct.pack('>b', value))
+    elif 0 <= value < 0x100:
+        out.append(struct.pack('>BB', 0xcc, value))
+    elif 0 <= value < 0x10000:
+        out.append(struct.pack('>BH', 0xcd, value))
+    elif 0 <= value < 0x100000000:
+        out.append(struct.pack('>BI', 0xce, value))
+    elif 0 <= value:
+        out.append(struct.pack('>BQ', 0xcf, value))
+    elif -0x80 <= value:
+        out.append(struct.pack('>Bb', 0xd0, value))
+    elif -0x8000 <= value:
+        out.append(struct.pack('>Bh', 0xd1, value))
+    elif -0x80000000 <= value:
+        out.append(struct.pack('>Bi', 0xd2, value))
+    else:
+        out.append(struct.pack('>Bq', 0xd3, value))
+
+
+# code: (struct format, kind) for the fixed size and sized types
+UNPACK_TYPES = {
+    0xc0: (None, 'nil'),
+    0xc2: (None, 'false'),
+    0xc3: (None, 'true'),
+    0xc4: ('>B', 'bin'), 0xc5: ('>H', 'bin'), 0xc6: ('>I', 'bin'),
+    0xca: ('>f', 'value'), 0xcb: ('>d', 'value'),
+    0xcc: ('>B', 'value'), 0xcd: ('>H', 'value'),
+    0xce: ('>I', 'value'), 0xcf: ('>Q', 'value'),
+    0xd0: ('>b', 'value'), 0xd1: ('>h', 'value'),
+    0xd2: ('>i', 'value'), 0xd3: ('>q', 'value'),
+    0xd9: ('>B', 'str'), 0xda: ('>H', 'str'), 0xdb: ('>I', 'str'),
+    0xdc: ('>H', 'array'), 0xdd: ('>I', 'array'),
+    0xde: ('>H', 'map'), 0xdf: ('>I', 'map'),
+}
+
+
+def unpack_msgpack(data):
+    obj, offset = __unpack(bytearray(data), 0)
+    if offset != len(data):
+        raise ValueError('Extra data after MessagePack object')
+    return obj
+
+
+def __unpack(data, offset):  # pylint: disable=R0911
+    code = data[offset]
+    offset += 1
+    if code < 0x80:
+        return code, offset
+    if code >= 0xe0:
+        return code - 0x100, offset
+    if 0xa0 <= code < 0xc0:
+        return __unpack_str(data, offset, code & 0x1f)
+    if 0x90 <= code < 0xa0:
+        return __unpack_array(data, offset, code & 0x0f)
+    if 0x80 <= code < 0x90:
+        return __unpack_map(data, offset, code & 0x0f)
+
+    fmt, kind = UNPACK_TYPES[code]
+    if kind == 'nil':
+        return None, offset
+    if kind in ('true', 'false'):
+        return kind == 'true', offset
+    size = struct.calcsize(fmt)
+    (value,) = struct.unpack_from(fmt, bytes(data[offset:offset + size]))
+    offset += size
+    if kind == 'value':
+        return value, offset
+    if kind == 'str':
+        return __unpack_str(data, offset, value)
+    if kind == 'bin':
+        return bytes(data[offset:offset + value]), offset + value
+    if kind == 'array':
+        return __unpack_array(data, offset, value)
+    return __unpack_map(data, offset, value)
+
+
+def __unpack_str(data, offset, length):
+    return bytes(data[offset:offset + length]).decode('utf-8'), \
+        offset + length
+
+
+def __unpack_array(data, offset, length):
+    result = []
+    for _ in range(length):
+        item, offset = __unpack(data, offset)
+        result.append(item)
+    return result, offset
+
+
+def __unpack_map(data, offset, length):
+    result = {}
+    for _ in range(length):
+        key, offset = __unpack(data, offset)
+        value, offset = __unpack(data, offset)
+        result[key] = value
+    return result, offset
+
+
+def load_msgpack_packer():
+    try:
+        import msgpack  # pylint: disable=E0401
+    except ImportError:
+        return pack_msgpack
+
+    def packb(obj):
+        return msgpack.packb(obj, use_bin_type=True)
+    return packb
+
+
+class Codec(object):
+    name = 'json'
+    index_key = str
+
+    def __init__(self, names=False):
+        self.names = names
+        self.__index = {}
+
+    def set_config(self, cfg):
+        self.__index = {item['name']: self.index_key(i)
+                        for i, item in enumerate(cfg)}
+
+    def __map_names(self, payload):
+        index = self.__index
+        try:
+            return {index[name]: value for name, value in payload.items()}
+        except (KeyError, AttributeError):
+            return None
+
+    def suffix(self, mapped):
+        name = None if self.name == 'json' else self.name
+        if mapped:
+            return (name or 'json') + NAMES_SUFFIX
+        return name
+
+    def encode(self, serializer, envelope, ts, payload):
+        mapped = self.names and self.__map_names(payload)
+        if mapped:
+            payload = mapped
+        return self.suffix(bool(mapped)), \
+            self.pack(serializer, envelope, ts, payload)
+
+    def encode_batch(self, serializer, samples):
+        mapped = None
+        if self.names:
+            mapped = [self.__map_names(payload) for _, payload in samples]
+            if not all(mapped):
+                mapped = None
+        if mapped:
+            samples = [(ts, payload)
+                       for (ts, _), payload in zip(samples, mapped)]
+        msg = [{'ts': ts, 'payload': payload} for ts, payload in samples]
+        return self.suffix(bool(mapped)), self.pack_object(serializer, msg)
+
+    def pack(self, serializer, envelope, ts, payload):
+        return envelope.build(ts, payload)
+
+    def pack_object(self, serializer, obj):
+        return serializer.dumps(obj)
+
+
+class ZlibCodec(Codec):
+    name = 'zlib'
+
+    def __init__(self, names=False, level=6):
+        super(ZlibCodec, self).__init__(names)
+        self.level = level
+
+    def pack(self, serializer, envelope, ts, payload):
+        return zlib.compress(envelope.build(ts, payload), self.level)
+
+    def pack_object(self, serializer, obj):
+        return zlib.compress(serializer.dumps(obj), self.level)
+
+
+class MsgpackCodec(Codec):
+    name = 'msgpack'
+    index_key = int
+
+    def __init__(self, names=False):
+        super(MsgpackCodec, self).__init__(names)
+        self.packb = load_msgpack_packer()
+
+    def pack(self, serializer, envelope, ts, payload):
+        return self.packb({'ts': ts, 'payload': payload})
+
+    def pack_object(self, serializer, obj):
+        return self.packb(obj)
+
+
+CODECS = {
+    'json': Codec,
+    'zlib': ZlibCodec,
+    'msgpack': MsgpackCodec,
+}
+
+
+def get_codec(name, names=False):
+    return CODECS[name](names=names)
+
+
+def decode(suffix, data, names=None):
+    codec = suffix or 'json'
+    mapped = codec.endswith(NAMES_SUFFIX)
+    if mapped:
+        codec = codec[:-len(NAMES_SUFFIX)]
+
+    if codec == 'msgpack':
+        msg = unpack_msgpack(data)
+    else:
+        if codec == 'zlib':
+            data = zlib.decompress(data)
+        elif codec != 'json':
+            raise ValueError('Unknown codec: {0}'.format(codec))
+        msg = json.loads(data.decode('utf-8'))
+
+    if mapped:
+        for item in msg if isinstance(msg, list) else [msg]:
+            item['payload'] = {names[int(key)]: value
+                               for key, value in item['payload'].items()}
+    return msg
+
+
+class Consumer(object):
+    # A local stand-in for the service side of the device topics: keeps
+    # the variable names of each device config and decodes its messages.
+
+    def __init__(self):
+        self.names = {}
+
+    def receive(self, topic, data):
+        parts = topic.split('/')
+        token, kind, suffix = parts[1], parts[2], '/'.join(parts[3:])
+        if kind == 'config':
+            msg = json.loads(data.decode('utf-8'))
+            self.names[token] = [item['name'] for item in msg['payload']]
+            return kind, msg
+        if kind == 'data' and suffix == 'cr':
+            return 'cr', json.loads(data.decode('utf-8'))
+        return kind, decode(suffix, data, self.names.get(token, None))
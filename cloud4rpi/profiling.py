@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import signal
+import logging
+import threading
+from collections import deque
+
+from cloud4rpi import config
+
+ROLLING_WINDOW = 100  # last timings kept per binding
+
+log = logging.getLogger(config.loggerName)
+
+
+class BindingProfiler(object):
+    # Times of the last ROLLING_WINDOW invocations of every binding, from
+    # read_data, read_diag and command handlers. Each timing is also passed
+    # to on_binding_timed(name, duration, error), with error None unless the
+    # binding raised.
+
+    def __init__(self, budget=None, window=ROLLING_WINDOW):
+        def noop_on_binding_timed(name, duration, error):
+            pass
+
+        self.budget = budget
+        self.window = window
+        self.on_binding_timed = noop_on_binding_timed
+        self.__lock = threading.Lock()
+        self.__timings = {}
+        self.__calls = {}
+        self.__errors = {}
+        self.__over_budget = {}
+
+    def record(self, name, duration, error=None):
+        with self.__lock:
+            timings = self.__timings.get(name, None)
+            if timings is None:
+                timings = self.__timings[name] = deque(maxlen=self.window)
+            timings.append(duration)
+            self.__calls[name] = self.__calls.get(name, 0) + 1
+            if error is not None:
+                self.__errors[name] = self.__errors.get(name, 0) + 1
+            over = self.budget is not None and duration > self.budget
+            if over:
+                over = self.__over_budget[name] = \
+                    self.__over_budget.get(name, 0) + 1
+        if over == 1:
+            log.warning('Binding %s took %.3f sec, over the %.3f sec budget',
+                        name, duration, self.budget)
+        self.on_binding_timed(name, duration, error)
+
+    @property
+    def over_budget(self):
+        with self.__lock:
+            return sorted(self.__over_budget)
+
+    def percentile(self, name, q):
+        with self.__lock:
+            timings = sorted(self.__timings.get(name, ()))
+        if not timings:
+            return 0
+        return timings[min(len(timings) - 1, int(q * len(timings)))]
+
+    def report(self):
+        # One entry per binding, slowest (by p99 of the window) first
+        with self.__lock:
+            names = list(self.__timings)
+        rows = []
+        for name in names:
+            rows.append({
+                'name': name,
+                'calls': self.__calls.get(name, 0),
+                'errors': self.__errors.get(name, 0),
+                'over_budget': self.__over_budget.get(name, 0),
+                'p50': self.percentile(name, .5),
+                'p90': self.percentile(name, .9),
+                'p99': self.percentile(name, .99),
+            })
+        return sorted(rows, key=lambda row: row['p99'], reverse=True)
+
+    def format_report(self, limit=None):
+        lines = ['{0:<24} {1:>8} {2:>6} {3:>6} {4:>10} {5:>10} {6:>10}'
+                 .format('binding', 'calls', 'errors', 'over',
+                         'p50 ms', 'p90 ms', 'p99 ms')]
+        for row in self.report()[:limit]:
+            lines.append('{0:<24} {1:>8} {2:>6} {3:>6} {4:>10.3f} '
+                         '{5:>10.3f} {6:>10.3f}'
+                         .format(row['name'], row['calls'], row['errors'],
+                                 row['over_budget'], row['p50'] * 1e3,
+                                 row['p90'] * 1e3, row['p99'] * 1e3))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.__lock:
+            self.__timings = {}
+            self.__calls = {}
+            self.__errors = {}
+            self.__over_budget = {}
+
+
+def dump_on_signal(profiler, signum=None, stream=None):
+    # Writes the slowest bindings report on SIGUSR1 (by default). Signal
+    # handlers can only be installed from the main thread.
+    if signum is None:
+        signum = signal.SIGUSR1
+
+    def handler(received, frame):
+        out = stream or sys.stderr
+        out.write(profiler.format_report())
+        out.flush()
+
+    return signal.signal(signum, handler)
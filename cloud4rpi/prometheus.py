@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import os
+import logging
+import threading
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from cloud4rpi import config
+from cloud4rpi.metrics import METRICS, COUNTER, HISTOGRAM
+
+PREFIX = 'cloud4rpi_'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+log = logging.getLogger(config.loggerName)
+
+
+def __escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def __labels(label_name, label, extra=None):
+    pairs = []
+    if label_name is not None and label is not None:
+        pairs.append('{0}="{1}"'.format(label_name, __escape(label)))
+    if extra is not None:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def __number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_metrics(metrics, prefix=PREFIX):
+    # The Prometheus text exposition format, version 0.0.4
+    lines = []
+    for name, values in metrics.collect():
+        kind, label_name, help_text = METRICS.get(name,
+                                                  (COUNTER, 'label', name))
+        full_name = prefix + name
+        if kind == COUNTER:
+            full_name += '_total'
+        lines.append('# HELP {0} {1}'.format(full_name, help_text))
+        lines.append('# TYPE {0} {1}'.format(full_name, kind))
+        for label, value in sorted(values.items(), key=lambda x: str(x[0])):
+            if kind == HISTOGRAM:
+                lines.extend(__histogram_lines(full_name, label_name, label,
+                                               value))
+                continue
+            lines.append('{0}{1} {2}'.format(
+                full_name, __labels(label_name, label), __number(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def __histogram_lines(name, label_name, label, histogram):
+    seen = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        seen += count
+        yield '{0}_bucket{1} {2}'.format(
+            name, __labels(label_name, label, 'le="{0}"'.format(bound)), seen)
+    yield '{0}_bucket{1} {2}'.format(
+        name, __labels(label_name, label, 'le="+Inf"'), histogram.count)
+    yield '{0}_sum{1} {2}'.format(name, __labels(label_name, label),
+                                  __number(histogram.sum))
+    yield '{0}_count{1} {2}'.format(name, __labels(label_name, label),
+                                    histogram.count)
+
+
+def write_textfile(metrics, path, prefix=PREFIX):
+    # For node_exporter's textfile collector, which must never see a
+    # partially written file: write aside, then rename over.
+    tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        f.write(format_metrics(metrics, prefix))
+    os.rename(tmp_path, path)
+
+
+def serve(metrics, port, host='127.0.0.1', prefix=PREFIX):
+    # Serves the metrics over HTTP from a daemon thread; call shutdown() on
+    # the returned server to stop it.
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = format_metrics(metrics, prefix).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            log.debug('Metrics request: ' + fmt, *args)
+
+    server = HTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever,
+                              name='cloud4rpi-metrics')
+    thread.daemon = True
+    thread.start()
+    log.info('Serving metrics on %s:%s', host, server.server_port)
+    return server
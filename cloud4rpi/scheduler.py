@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import logging
+import threading
+from itertools import count
+
+from cloud4rpi import config
+from cloud4rpi import utils
+
+# What to do when a task is due again before the previous run finished
+OVERRUN_SKIP = 'skip'  # drop missed runs, stay on the original schedule
+OVERRUN_CATCH_UP = 'catch_up'  # run every missed slot back to back
+OVERRUN_COALESCE = 'coalesce'  # run once, then restart the schedule
+
+OVERRUN_POLICIES = [OVERRUN_SKIP, OVERRUN_CATCH_UP, OVERRUN_COALESCE]
+
+log = logging.getLogger(config.loggerName)
+
+
+class Task(object):
+    def __init__(self, name, fn, interval, overrun):
+        if overrun not in OVERRUN_POLICIES:
+            raise ValueError('Unknown overrun policy: {0}'.format(overrun))
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.overrun = overrun
+        self.runs = 0
+        self.missed = 0
+        self.max_lateness = 0
+        self.total_lateness = 0
+
+    def next_due(self, due, now):
+        due += self.interval
+        if due > now or self.overrun == OVERRUN_CATCH_UP:
+            return due
+        if self.overrun == OVERRUN_COALESCE:
+            self.missed += 1
+            return now
+        missed = int((now - due) // self.interval) + 1
+        self.missed += missed
+        return due + missed * self.interval
+
+    def stats(self):
+        return {
+            'runs': self.runs,
+            'missed': self.missed,
+            'max_lateness': self.max_lateness,
+            'mean_lateness': self.total_lateness / self.runs
+            if self.runs else 0,
+        }
+
+
+class Scheduler(object):
+    def __init__(self, clock=utils.monotonic, sleep=None):
+        self.__clock = clock
+        self.__stopped = threading.Event()
+        self.__sleep = sleep or self.__stopped.wait
+        self.__queue = []
+        self.__tasks = []
+        self.__sequence = count()
+        self.__started = None
+        self.wakeups = 0
+
+    def add(self, fn, interval, name=None, overrun=OVERRUN_SKIP, delay=0):
+        task = Task(name or getattr(fn, '__name__', repr(fn)),
+                    fn, interval, overrun)
+        self.__tasks.append(task)
+        self.__push(self.__clock() + delay, task)
+        return task
+
+    def __push(self, due, task):
+        heapq.heappush(self.__queue, (due, next(self.__sequence), task))
+
+    def run(self):
+        self.__stopped.clear()
+        self.__started = self.__clock()
+        while self.__queue and not self.__stopped.is_set():
+            due, _, task = self.__queue[0]
+            delay = due - self.__clock()
+            if delay > 0:
+                self.__sleep(delay)
+                self.wakeups += 1
+                continue
+
+            heapq.heappop(self.__queue)
+            started = self.__clock()
+            lateness = started - due
+            task.max_lateness = max(task.max_lateness, lateness)
+            task.total_lateness += lateness
+            task.runs += 1
+            task.fn()
+            self.__push(task.next_due(due, self.__clock()), task)
+
+    def stop(self):
+        self.__stopped.set()
+
+    def stats(self):
+        elapsed = self.__clock() - self.__started \
+            if self.__started is not None else 0
+        return {
+            'wakeups': self.wakeups,
+            'wakeups_per_minute': self.wakeups * 60.0 / elapsed
+            if elapsed else 0,
+            'tasks': {task.name: task.stats() for task in self.__tasks},
+        }
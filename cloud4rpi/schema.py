@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+from cloud4rpi import utils
+from cloud4rpi.changes import ChangeFilter
+from cloud4rpi.aggregate import Aggregator
+
+# How a binding is resolved on read
+CALL_NONE = 0  # no binding, the value is only set by commands
+CALL_STATIC = 1  # not callable, the current value is kept
+CALL_READ = 2  # an object with a read() method
+CALL_NO_ARGS = 3  # a callable without arguments
+CALL_CURRENT = 4  # a callable accepting the current value
+
+
+def compile_binding(binding):
+    if not binding:
+        return CALL_NONE
+    if hasattr(binding, 'read'):
+        return CALL_READ
+    if not callable(binding):
+        return CALL_STATIC
+    try:
+        return CALL_CURRENT if utils.has_args(binding) else CALL_NO_ARGS
+    except TypeError:
+        # builtins without a signature
+        return CALL_NO_ARGS
+
+
+def resolve(call, binding, current):
+    if call == CALL_READ:
+        return binding.read()
+    if call == CALL_NO_ARGS:
+        return binding()
+    if call == CALL_CURRENT:
+        return binding(current)
+    return current
+
+
+class Variable(object):
+    __slots__ = ('name', 'type', 'config', 'binding', 'call', 'convert',
+                 'change_filter', 'aggregator')
+
+    def __init__(self, name, config):
+        self.name = name
+        self.type = config.get('type', None)
+        self.config = config
+        self.binding = config.get('bind', None)
+        self.call = compile_binding(self.binding)
+        self.convert = utils.get_converter(self.type)
+        self.change_filter = ChangeFilter.create(config)
+        self.aggregator = Aggregator.create(name, config)
+
+    def resolve(self):
+        return resolve(self.call, self.binding, self.config.get('value'))
+
+    def store(self, value):
+        value = utils.convert_variable_value(self.name, self.convert, value)
+        self.config['value'] = value
+        return value
+
+    def read(self):
+        return self.store(self.resolve())
+
+
+def is_diag_config(value):
+    # {'bind': ..., 'static'/'ttl'/'on_change': ...} rather than a binding
+    return isinstance(value, dict) and 'bind' in value
+
+
+class Diag(object):
+    # A static diag is resolved once, one with a ttl (sec) at most once per
+    # ttl. Both are published only when changed, as with on_change.
+
+    __slots__ = ('name', 'binding', 'call', 'static', 'ttl', 'change_filter',
+                 'value', 'read_at')
+
+    def __init__(self, name, binding, config=None):
+        config = config or {}
+        self.name = name
+        self.binding = binding
+        self.call = compile_binding(binding)
+        self.static = config.get('static', False)
+        self.ttl = config.get('ttl', None)
+        self.change_filter = ChangeFilter.create(config)
+        if self.change_filter is None and (self.static or self.ttl):
+            self.change_filter = ChangeFilter()
+        self.value = None
+        self.read_at = None
+
+    def is_due(self, now=None):
+        # Whether read() resolves the binding instead of the cached value
+        if not self.static and self.ttl is None or self.read_at is None:
+            return True
+        now = utils.monotonic() if now is None else now
+        return not self.static and now - self.read_at >= self.ttl
+
+    def read(self):
+        if self.call == CALL_NONE or self.call == CALL_STATIC:
+            return self.binding
+        if not self.static and self.ttl is None:
+            return resolve(self.call, self.binding, None)
+
+        now = utils.monotonic()
+        if self.is_due(now):
+            self.value = resolve(self.call, self.binding, None)
+            self.read_at = now
+        return self.value
+
+
+def compile_variables(variables):
+    for name, value in variables.items():
+        utils.guard_against_invalid_variable_type(name,
+                                                  value.get('type', None))
+    return [Variable(name, value) for name, value in variables.items()]
+
+
+def compile_diag(diag):
+    return [Diag(name, value['bind'], value) if is_diag_config(value)
+            else Diag(name, value)
+            for name, value in diag.items()]
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import json
+from collections import OrderedDict
+
+TS_MARK = '__cloud4rpi_ts__'
+PAYLOAD_MARK = '__cloud4rpi_payload__'
+
+
+class Serializer(object):
+    def __init__(self, name, dumps):
+        self.name = name
+        self.dumps = dumps
+
+
+def json_serializer():
+    def dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+    return Serializer('json', dumps)
+
+
+def orjson_serializer():
+    import orjson  # pylint: disable=E0401
+    return Serializer('orjson', orjson.dumps)
+
+
+def rapidjson_serializer():
+    import rapidjson  # pylint: disable=E0401
+
+    def dumps(obj):
+        return rapidjson.dumps(obj, ensure_ascii=False).encode('utf-8')
+    return Serializer('rapidjson', dumps)
+
+
+def ujson_serializer():
+    import ujson  # pylint: disable=E0401
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+    return Serializer('ujson', dumps)
+
+
+SERIALIZERS = OrderedDict([
+    ('json', json_serializer),
+    ('orjson', orjson_serializer),
+    ('rapidjson', rapidjson_serializer),
+    ('ujson', ujson_serializer),
+])
+
+# Faster, but not byte-identical to json.dumps: separators differ, NaN and
+# Infinity become null or raise, ints past 64 bits raise. Only used when
+# asked for, by name or as 'fastest' (the first installed of these).
+FAST_SERIALIZERS = ['orjson', 'rapidjson', 'ujson']
+FASTEST = 'fastest'
+
+
+def get_serializer(name='json'):
+    if name != FASTEST:
+        return SERIALIZERS[name]()
+
+    for fast in FAST_SERIALIZERS:
+        try:
+            return SERIALIZERS[fast]()
+        except ImportError:
+            continue
+    return json_serializer()
+
+
+class Envelope(object):
+    # The {ts, payload, ...} message serialized once with placeholders and
+    # split around them, so a publish only serializes its payload and joins
+    # the pieces, with the same bytes the serializer gives for the dict.
+
+    def __init__(self, serializer, extra=None):
+        self.serializer = serializer
+        msg = OrderedDict([('ts', TS_MARK), ('payload', PAYLOAD_MARK)])
+        if extra:
+            msg.update(extra)
+        template = serializer.dumps(msg)
+        self.head, rest = template.split(serializer.dumps(TS_MARK))
+        self.middle, self.tail = rest.split(serializer.dumps(PAYLOAD_MARK))
+
+    def build(self, ts, payload):
+        return b''.join((self.head,
+                         b'"', ts.encode('ascii'), b'"',
+                         self.middle,
+                         self.serializer.dumps(payload),
+                         self.tail))
@@ -0,0 +1,428 @@
+# -*- coding: utf-8 -*-
+
+import zlib
+import logging
+import threading
+import multiprocessing
+from multiprocessing.connection import wait
+from collections import OrderedDict
+from functools import partial
+
+from cloud4rpi import config
+from cloud4rpi import utils
+from cloud4rpi.device import Device
+from cloud4rpi.fleet import DeviceFleet
+from cloud4rpi.mqtt_api import is_success
+from cloud4rpi.scheduler import Scheduler, OVERRUN_SKIP
+
+CONNECT_TIMEOUT = 30  # sec
+STATS_INTERVAL = 1  # sec
+STOP_TIMEOUT = 5  # sec
+
+log = logging.getLogger(config.loggerName)
+
+
+def shard_of(device_token, shards):
+    return (zlib.crc32(device_token.encode('utf-8')) & 0xffffffff) % shards
+
+
+class Worker(object):
+    # The part of a sharded fleet running in a worker process: a
+    # DeviceFleet for its share of the tokens, driven by the parent.
+
+    def __init__(self, shard, conn, options):
+        self.shard = shard
+        self.__conn = conn
+        self.__lock = threading.Lock()
+        self.__setup = options['setup']
+        self.__fleet = DeviceFleet(options['host'], options['port'],
+                                   options['tls_config'],
+                                   options['max_in_flight'])
+        self.__fleet.on_connected = self.__on_connected
+        self.__schedule = None
+        self.__schedulers = []
+        self.__joined = set()
+        self.__pending = []
+        self.__refused = set()
+        self.__stopped = threading.Event()
+
+    def send(self, *message):
+        with self.__lock:
+            self.__conn.send(message)
+
+    def add(self, tokens):
+        for token in tokens:
+            device = self.__fleet.add(token)
+            if self.__setup is not None:
+                self.__setup(device, token)
+            else:
+                # Bindings live in the parent, so do the commands
+                self.__fleet.api(token).on_command = \
+                    partial(self.send, 'command', token)
+        # Connecting here would hold up serve() and with it the publishes
+        # of every other device of the worker, so each new device joins
+        # once connected
+        self.__fleet.connect_async(tokens)
+
+    def __on_connected(self, token, rc):
+        accepted = is_success(rc)
+        with self.__lock:
+            if token in self.__joined or \
+                    not accepted and token in self.__refused:
+                return  # reconnected, or refused again
+            if accepted:
+                self.__joined.add(token)
+                self.__refused.discard(token)
+                self.__pending.append(token)
+            else:
+                self.__refused.add(token)
+        try:
+            if accepted:
+                self.send('ready', token, self.__fleet.stats())
+            else:
+                self.send('refused', token, rc, self.__fleet.stats())
+        except (OSError, EOFError):
+            pass  # the parent is gone
+
+    def schedule(self, *params):
+        with self.__lock:
+            self.__schedule = params
+        self.__schedule_joined()
+
+    def __schedule_joined(self):
+        # Devices that joined since the last call share a scheduler
+        with self.__lock:
+            if self.__schedule is None or not self.__pending:
+                return
+            tokens, self.__pending = self.__pending, []
+        self.__start_scheduler(tokens)
+
+    def __start_scheduler(self, tokens):
+        scheduler = self.__fleet.schedule(*self.__schedule, tokens=tokens)
+        with self.__lock:
+            if self.__stopped.is_set():
+                return
+            self.__schedulers.append(scheduler)
+        thread = threading.Thread(target=scheduler.run)
+        thread.daemon = True
+        thread.start()
+
+    def __report(self):
+        while not self.__stopped.wait(STATS_INTERVAL):
+            self.__schedule_joined()
+            try:
+                self.send('stats', self.__fleet.stats())
+            except (OSError, EOFError):
+                return
+
+    def __handle(self, command, args):
+        if command == 'publish':
+            token, method, args, kwargs = args
+            getattr(self.__fleet.api(token), method)(*args, **kwargs)
+        elif command == 'add':
+            self.add(*args)
+        elif command == 'schedule':
+            self.schedule(*args)
+
+    def serve(self):
+        reporter = threading.Thread(target=self.__report)
+        reporter.daemon = True
+        reporter.start()
+        try:
+            while True:
+                try:
+                    message = self.__conn.recv()
+                except EOFError:
+                    break  # the parent is gone
+                command, args = message[0], message[1:]
+                if command == 'stop':
+                    break
+                try:
+                    self.__handle(command, args)
+                except Exception as e:
+                    # One bad message must not take the whole shard down
+                    log.exception('Shard %s: %s failed: %s',
+                                  self.shard, command, str(e))
+        finally:
+            with self.__lock:
+                self.__stopped.set()
+                schedulers = list(self.__schedulers)
+            for scheduler in schedulers:
+                scheduler.stop()
+            self.__fleet.disconnect()
+
+
+def run_worker(shard, tokens, options, conn):
+    worker = Worker(shard, conn, options)
+    worker.add(tokens)
+    worker.serve()
+
+
+class ShardApi(object):
+    # Stands in for MqttApi in the parent: publishes are sent to the worker
+    # process that currently owns the token.
+
+    def __init__(self, fleet, device_token):
+        self.__fleet = fleet
+        self.__device_token = device_token
+        self.on_command = None
+
+    def __publish(self, method, *args, **kwargs):
+        self.__fleet.send(self.__device_token, method, args, kwargs)
+
+    def publish_config(self, msg):
+        self.__publish('publish_config', msg)
+
+    def publish_data(self, msg, **kwargs):
+        self.__publish('publish_data', msg, **kwargs)
+
+    def publish_data_batch(self, samples):
+        self.__publish('publish_data_batch', samples)
+
+    def publish_diag(self, msg):
+        self.__publish('publish_diag', msg)
+
+
+class Shard(object):
+    def __init__(self, index, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.lock = threading.Lock()
+        self.tokens = []
+        self.alive = True
+        self.ready = 0
+        self.refused = {}
+        self.stats = {}
+
+
+class ShardedFleet(object):
+    # Devices partitioned by token hash across worker processes, each
+    # running a DeviceFleet. Without a setup function the bindings stay in
+    # the parent: devices are read here and their payloads are encoded and
+    # sent by the workers, which forward commands back. With setup, a
+    # picklable setup(device, token), devices are declared, read and
+    # scheduled in the workers. Tokens of a worker that dies are moved to
+    # the remaining ones.
+
+    def __init__(self,
+                 host=config.mqqtBrokerHost,
+                 port=None,
+                 tls_config=None,
+                 workers=None,
+                 setup=None,
+                 max_in_flight=None,
+                 start_method='spawn'):
+        if port is None:
+            port = config.mqttsBrokerPort if isinstance(tls_config, dict) \
+                else config.mqttBrokerPort
+        self.__context = multiprocessing.get_context(start_method)
+        self.__workers = workers or multiprocessing.cpu_count()
+        self.__options = {
+            'host': host,
+            'port': port,
+            'tls_config': tls_config,
+            'setup': setup,
+            'max_in_flight': max_in_flight,
+        }
+        self.__owners = OrderedDict()
+        self.__apis = {}
+        self.__devices = OrderedDict()
+        self.__shards = []
+        self.__state = threading.Condition()
+        self.__schedule = None
+        self.__scheduler = None
+        self.__monitor = None
+        self.__stopping = threading.Event()
+        self.rebalanced = 0
+
+    def __len__(self):
+        return len(self.__owners)
+
+    @property
+    def devices(self):
+        return list(self.__devices.values())
+
+    def __getitem__(self, device_token):
+        return self.__devices[device_token]
+
+    def add(self, device_token):
+        utils.guard_against_invalid_token(device_token)
+        self.__owners[device_token] = shard_of(device_token, self.__workers)
+        device = None
+        if self.__options['setup'] is None:
+            api = self.__apis[device_token] = ShardApi(self, device_token)
+            device = self.__devices[device_token] = Device(api)
+        if self.__shards:
+            # Started already: the owning worker connects it
+            self.__assign([device_token])
+        return device
+
+    def __assign(self, tokens):
+        survivors = [s for s in self.__shards if s.alive]
+        if not survivors:
+            log.error('No shards left for %s devices', len(tokens))
+            return
+        moved = [[] for _ in survivors]
+        for token in tokens:
+            moved[shard_of(token, len(survivors))].append(token)
+        for target, moved_tokens in zip(survivors, moved):
+            if not moved_tokens:
+                continue
+            for token in moved_tokens:
+                self.__owners[token] = target.index
+            target.tokens.extend(moved_tokens)
+            self.__send(target, 'add', moved_tokens)
+
+    def start(self, timeout=CONNECT_TIMEOUT):
+        partitions = [[] for _ in range(self.__workers)]
+        for token, shard in self.__owners.items():
+            partitions[shard].append(token)
+
+        for index, tokens in enumerate(partitions):
+            conn, child = self.__context.Pipe()
+            process = self.__context.Process(
+                target=run_worker,
+                args=(index, tokens, self.__options, child),
+                name='cloud4rpi-shard-{0}'.format(index))
+            process.daemon = True
+            process.start()
+            child.close()
+            shard = Shard(index, process, conn)
+            shard.tokens = tokens
+            self.__shards.append(shard)
+
+        self.__monitor = threading.Thread(target=self.__watch)
+        self.__monitor.daemon = True
+        self.__monitor.start()
+
+        # Until every device is either connected or refused
+        with self.__state:
+            self.__state.wait_for(
+                lambda: all(s.ready + len(s.refused) >= len(s.tokens)
+                            for s in self.__shards),
+                timeout)
+        return self.stats()['connected']
+
+    def send(self, device_token, method, args, kwargs):
+        self.__send(self.__shards[self.__owners[device_token]],
+                    'publish', device_token, method, args, kwargs)
+
+    def __send(self, shard, *message):
+        try:
+            with shard.lock:
+                shard.conn.send(message)
+        except (OSError, EOFError) as e:
+            # The monitor moves the tokens of a dead worker elsewhere
+            log.debug('Shard %s unavailable: %s', shard.index, e)
+
+    def __watch(self):
+        while not self.__stopping.is_set():
+            shards = [s for s in self.__shards if s.alive]
+            if not shards:
+                return
+            waitables = {}
+            for shard in shards:
+                waitables[shard.conn] = shard
+                waitables[shard.process.sentinel] = shard
+            for ready in wait(list(waitables), STATS_INTERVAL):
+                shard = waitables[ready]
+                if ready is shard.conn:
+                    self.__receive(shard)
+                elif not self.__stopping.is_set():
+                    self.__rebalance(shard)
+
+    def __receive(self, shard):
+        try:
+            message = shard.conn.recv()
+        except (OSError, EOFError):
+            return  # the sentinel reports the exit
+        kind = message[0]
+        if kind == 'command':
+            _, token, cmd = message
+            self.__apis[token].on_command(cmd)
+        elif kind == 'stats':
+            shard.stats = message[1]
+        elif kind == 'ready':
+            _, token, shard.stats = message
+            with self.__state:
+                shard.ready += 1
+                shard.refused.pop(token, None)
+                self.__state.notify_all()
+        elif kind == 'refused':
+            _, token, rc, shard.stats = message
+            log.error('Connection of %s refused: %s', token, rc)
+            with self.__state:
+                shard.refused[token] = rc
+                self.__state.notify_all()
+
+    def __rebalance(self, shard):
+        shard.alive = False
+        log.error('Shard %s exited with code %s', shard.index,
+                  shard.process.exitcode)
+        if not any(s.alive for s in self.__shards):
+            log.error('No shards left for %s devices', len(shard.tokens))
+            return
+
+        self.__assign(shard.tokens)
+        self.rebalanced += len(shard.tokens)
+        shard.tokens = []
+        shard.refused = {}
+
+    def run(self,
+            data_interval=60,
+            diag_interval=650,
+            overrun=OVERRUN_SKIP):
+        self.__schedule = (data_interval, diag_interval, overrun)
+        if self.__options['setup'] is not None:
+            for shard in self.__shards:
+                self.__send(shard, 'schedule', *self.__schedule)
+            self.__stopping.wait()
+            return
+
+        self.__scheduler = Scheduler()
+        for i, (token, device) in enumerate(self.__devices.items()):
+            phase = float(i) / len(self.__devices)
+            self.__scheduler.add(device.publish_data, data_interval,
+                                 'data ' + token, overrun,
+                                 delay=phase * data_interval)
+            if diag_interval:
+                self.__scheduler.add(device.publish_diag, diag_interval,
+                                     'diag ' + token, overrun,
+                                     delay=phase * diag_interval)
+        self.__scheduler.run()
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        self.__stopping.set()
+        if self.__scheduler is not None:
+            self.__scheduler.stop()
+        for shard in self.__shards:
+            if shard.alive:
+                self.__send(shard, 'stop')
+        for shard in self.__shards:
+            shard.process.join(timeout)
+            if shard.process.is_alive():
+                shard.process.terminate()
+            shard.conn.close()
+
+    def stats(self):
+        shards = [{
+            'shard': shard.index,
+            'pid': shard.process.pid,
+            'alive': shard.alive,
+            'devices': len(shard.tokens),
+            'refused': len(shard.refused),
+            'connected': shard.stats.get('connected', 0),
+            'in_flight': shard.stats.get('in_flight', 0),
+            'throttled': shard.stats.get('throttled', 0),
+            'published': shard.stats.get('published', 0),
+        } for shard in self.__shards]
+        return {
+            'devices': len(self.__owners),
+            'connected': sum(s['connected'] for s in shards if s['alive']),
+            'published': sum(s['published'] for s in shards),
+            'refused': sorted(token for shard in self.__shards
+                              for token in shard.refused),
+            'rebalanced': self.rebalanced,
+            'shards': shards,
+        }
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+
+from cloud4rpi import config
+from cloud4rpi import utils
+from cloud4rpi.network import RETRY_INTERVAL, MAX_RETRY_INTERVAL, backoff
+
+# Connection states reported to Supervisor.on_state
+CONNECTING = 'connecting'  # CONNECT sent, waiting for the CONNACK
+CONNECTED = 'connected'
+BACKOFF = 'backoff'  # connection lost, waiting to retry
+CLOSED = 'closed'  # not connected and not retrying
+
+log = logging.getLogger(config.loggerName)
+
+
+def default_policy(attempt):
+    return backoff(attempt, RETRY_INTERVAL, MAX_RETRY_INTERVAL)
+
+
+class Supervisor(object):
+    # Owns the reconnect policy of one client. Retries are scheduled on the
+    # network strategy's timers instead of running inside paho callbacks,
+    # and every state change is reported to on_state(state).
+
+    def __init__(self, network, client, policy=None, metrics=None):
+        def noop_on_state(state):
+            pass
+
+        self.__network = network
+        self.__client = client
+        self.__policy = policy or default_policy
+        self.__metrics = metrics
+        self.__state = CLOSED
+        self.__attempt = 0
+        self.__changed = threading.Condition()
+        self.on_state = noop_on_state
+        self.reconnects = 0
+
+    @property
+    def state(self):
+        return self.__state
+
+    def wait_for(self, state, timeout=None):
+        deadline = None if timeout is None else utils.monotonic() + timeout
+        with self.__changed:
+            while self.__state != state:
+                remaining = None if deadline is None \
+                    else deadline - utils.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.__changed.wait(remaining)
+            return True
+
+    def __set_state(self, state):
+        with self.__changed:
+            if self.__state == state:
+                return
+            self.__state = state
+            self.__changed.notify_all()
+        self.on_state(state)
+
+    def connecting(self):
+        self.__set_state(CONNECTING)
+
+    def connected(self):
+        self.__attempt = 0
+        self.__set_state(CONNECTED)
+
+    def lost(self):
+        with self.__changed:
+            if self.__state == CLOSED:
+                return
+            delay = self.__policy(self.__attempt)
+            self.__attempt += 1
+        log.info('Reconnecting in %.1f sec', delay)
+        self.__set_state(BACKOFF)
+        self.__network.call_later(delay, self.__retry, self.__client)
+
+    def close(self):
+        self.__set_state(CLOSED)
+
+    def __retry(self):
+        if self.__state != BACKOFF:
+            return
+
+        self.__set_state(CONNECTING)
+        self.reconnects += 1
+        if self.__metrics is not None:
+            self.__metrics.inc('reconnects')
+        log.info('Reconnecting')
+        try:
+            self.__client.reconnect()
+        except Exception as e:
+            log.info('Reconnection failed: %s', str(e))
+            self.lost()
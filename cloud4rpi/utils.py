@@ -2,7 +2,6 @@
 
 import sys
 import re
-import inspect
 import logging
 import numbers
 from math import isnan, isinf
@@ -15,9 +14,21 @@ from cloud4rpi.errors import UnexpectedVariableValueTypeError
 from cloud4rpi.errors import TYPE_WARN_MSG
 
 if sys.version_info[0] > 2:
-    from cloud4rpi.utils_v3 import is_string
+    from cloud4rpi.utils_v3 import is_string, is_integer, monotonic
 else:
-    from cloud4rpi.utils_v2 import is_string
+    from cloud4rpi.utils_v2 import is_string, is_integer, monotonic
+
+# is_string, is_integer and monotonic come from utils_v2/utils_v3
+__all__ = [
+    'is_string', 'is_integer', 'monotonic',
+    'BOOL_TYPE', 'NUMERIC_TYPE', 'STRING_TYPE', 'LOCATION_TYPE',
+    'SUPPORTED_VARIABLE_TYPES', 'TOKEN_RE', 'CONVERTERS', 'UtcTzInfo',
+    'guard_against_invalid_token', 'to_bool', 'to_numeric', 'to_string',
+    'to_location', 'get_converter', 'convert_variable_value',
+    'validate_variable_value', 'validate_config',
+    'guard_against_invalid_variable_type', 'utcnow', 'args_count',
+    'has_args', 'resolve_callable',
+]
 
 log = logging.getLogger(config.loggerName)
 
@@ -28,6 +39,8 @@ LOCATION_TYPE = 'location'
 
 SUPPORTED_VARIABLE_TYPES = [BOOL_TYPE, NUMERIC_TYPE, STRING_TYPE, LOCATION_TYPE]
 
+TOKEN_RE = re.compile('[1-9a-km-zA-HJ-NP-Z]{23,}')
+
 
 class UtcTzInfo(tzinfo):
     # pylint: disable=W0223
@@ -39,8 +52,7 @@ class UtcTzInfo(tzinfo):
 
 
 def guard_against_invalid_token(token):
-    token_re = re.compile('[1-9a-km-zA-HJ-NP-Z]{23,}')
-    if not token_re.match(token):
+    if not TOKEN_RE.match(token):
         raise InvalidTokenError(token)
 
 
@@ -81,25 +93,31 @@ def to_location(value):
         raise Exception()
 
 
-def validate_variable_value(name, var_type, value):
-    if value is None:
-        return value
+CONVERTERS = {
+    BOOL_TYPE: to_bool,
+    NUMERIC_TYPE: to_numeric,
+    STRING_TYPE: to_string,
+    LOCATION_TYPE: to_location
+}
+
 
-    convert = {
-        BOOL_TYPE: to_bool,
-        NUMERIC_TYPE: to_numeric,
-        STRING_TYPE: to_string,
-        LOCATION_TYPE: to_location
-    }
-    c = convert.get(var_type, None)
-    if c is None:
+def get_converter(var_type):
+    return CONVERTERS.get(var_type, None)
+
+
+def convert_variable_value(name, convert, value):
+    if value is None or convert is None:
         return None
     try:
-        return c(value)
+        return convert(value)
     except Exception:
         raise UnexpectedVariableValueTypeError('"{0}"={1}'.format(name, value))
 
 
+def validate_variable_value(name, var_type, value):
+    return convert_variable_value(name, get_converter(var_type), value)
+
+
 def validate_config(cfg):
     if not isinstance(cfg, list):
         raise InvalidConfigError()
@@ -118,20 +136,23 @@ def guard_against_invalid_variable_type(name, var_type):
 
 
 def utcnow():
-    return datetime.utcnow().replace(tzinfo=UtcTzInfo()).isoformat()
+    # Same as an aware isoformat() in UTC, without a tzinfo per call
+    return datetime.utcnow().isoformat() + '+00:00'
 
 
 def args_count(binding):
     # pylint: disable=E1101, W1505
-    if inspect.getargspec is not None:
-        args = inspect.getargspec(binding).args
-    else:
+    import inspect  # slow to import, not needed until a binding is declared
+    if hasattr(inspect, 'getfullargspec'):
         args = inspect.getfullargspec(binding).args
+    else:
+        args = inspect.getargspec(binding).args
 
     return args.__len__()
 
 
 def has_args(binding):
+    import inspect
     if inspect.ismethod(binding):
         return args_count(binding) > 1
     else:
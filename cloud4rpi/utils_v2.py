@@ -1,2 +1,9 @@
+from time import time as monotonic  # pylint: disable=W0611
+
+
 def is_string(value):
     return isinstance(value, (str, unicode))
+
+
+def is_integer(value):
+    return isinstance(value, (int, long))
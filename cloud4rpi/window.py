@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import OrderedDict
+from itertools import count
+
+from cloud4rpi import utils
+from cloud4rpi import handles
+
+# What to do with a publish that finds the in-flight window full
+# Wait for a PUBACK, dropping the message on timeout. Called from the
+# network thread, which is the one to process that PUBACK, it holds the
+# message as drop_oldest does instead.
+WINDOW_BLOCK = 'block'
+WINDOW_DROP_NEWEST = 'drop_newest'  # drop the message
+WINDOW_DROP_OLDEST = 'drop_oldest'  # hold it, dropping the oldest held
+WINDOW_COALESCE = 'coalesce'  # hold only the latest message per topic
+
+WINDOW_POLICIES = [WINDOW_BLOCK, WINDOW_DROP_NEWEST,
+                   WINDOW_DROP_OLDEST, WINDOW_COALESCE]
+
+BLOCK_TIMEOUT = 5  # sec
+
+# What admit() tells the caller to do
+SEND = 'send'
+HELD = 'held'
+DROPPED = 'dropped'
+
+
+class InFlightWindow(object):
+    # Bounds the QoS 1 messages handed to the client and not yet
+    # acknowledged. Messages held back by a policy are sent, oldest first,
+    # as PUBACKs free the window.
+
+    def __init__(self,
+                 size,
+                 policy=WINDOW_BLOCK,
+                 timeout=BLOCK_TIMEOUT,
+                 max_held=None):
+        self.__check_policy(policy)
+        self.size = size
+        self.policy = policy
+        self.timeout = timeout
+        self.max_held = size if max_held is None else max_held
+
+        self.__lock = threading.Condition()
+        self.__in_flight = set()
+        self.__reserved = 0
+        self.__held = OrderedDict()
+        self.__keys = count()
+        self.dropped = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    @staticmethod
+    def __check_policy(policy):
+        if policy not in WINDOW_POLICIES:
+            raise ValueError('Unknown window policy: {0}'.format(policy))
+
+    def __len__(self):
+        return len(self.__in_flight) + self.__reserved
+
+    @property
+    def held(self):
+        return len(self.__held)
+
+    def __has_room(self):
+        return len(self) < self.size and not self.__held
+
+    def admit(self, topic, message, policy=None, timeout=None, handle=None,
+              block=True):
+        policy = self.policy if policy is None else policy
+        self.__check_policy(policy)
+        if policy == WINDOW_BLOCK and not block:
+            policy = WINDOW_DROP_OLDEST
+        with self.__lock:
+            if self.__has_room():
+                self.__reserved += 1
+                return SEND
+
+            if policy == WINDOW_BLOCK:
+                return self.__wait(self.timeout if timeout is None
+                                   else timeout)
+            if policy == WINDOW_DROP_NEWEST:
+                self.dropped += 1
+                return DROPPED
+
+            if policy == WINDOW_COALESCE and topic in self.__held:
+                self.coalesced += 1
+                self.__drop(self.__held[topic])
+                self.__held[topic] = (topic, message, handle)
+                return HELD
+
+            key = topic if policy == WINDOW_COALESCE else next(self.__keys)
+            self.__held[key] = (topic, message, handle)
+            while len(self.__held) > self.max_held:
+                self.__drop(self.__held.popitem(last=False)[1])
+                self.dropped += 1
+            return HELD
+
+    @staticmethod
+    def __drop(held):
+        handle = held[2]
+        if handle is not None:
+            handle.resolve(handles.DROPPED)
+
+    def __wait(self, timeout):
+        deadline = utils.monotonic() + timeout
+        while not self.__has_room():
+            remaining = deadline - utils.monotonic()
+            if remaining <= 0:
+                self.timeouts += 1
+                self.dropped += 1
+                return DROPPED
+            self.__lock.wait(remaining)
+        self.__reserved += 1
+        return SEND
+
+    def sent(self, mid):
+        with self.__lock:
+            self.__reserved -= 1
+            self.__in_flight.add(mid)
+
+    def release(self):
+        # For a reserved slot whose message was not sent after all
+        with self.__lock:
+            self.__reserved -= 1
+            self.__lock.notify_all()
+
+    def acked(self, mid):
+        # Returns the held message to send in the freed slot, if any
+        with self.__lock:
+            if mid not in self.__in_flight:
+                return None
+            self.__in_flight.discard(mid)
+            self.__lock.notify_all()
+            if not self.__held:
+                return None
+            _, held = self.__held.popitem(last=False)
+            self.__reserved += 1
+            return held
+
+    def stats(self):
+        with self.__lock:
+            return {
+                'size': self.size,
+                'in_flight': len(self),
+                'held': len(self.__held),
+                'dropped': self.dropped,
+                'coalesced': self.coalesced,
+                'timeouts': self.timeouts,
+            }
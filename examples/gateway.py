@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import cloud4rpi
+from cloud4rpi.fleet import DeviceFleet
+
+
+class Meter(object):
+    # e.g. a Modbus slave polled by the gateway
+    def __init__(self, address):
+        self.address = address
+
+    def read(self):
+        return 230.0
+
+
+# Put the tokens of your devices here. To get a token,
+# sign up at https://cloud4rpi.io and create a device.
+DEVICES = {
+    '__FIRST_DEVICE_TOKEN__': 1,
+    '__SECOND_DEVICE_TOKEN__': 2,
+}
+
+# Constants
+DATA_SENDING_INTERVAL = 60  # secs
+DIAG_SENDING_INTERVAL = 650  # secs
+MAX_IN_FLIGHT = 100  # messages awaiting delivery across all devices
+
+
+def main():
+    fleet = DeviceFleet(max_in_flight=MAX_IN_FLIGHT)
+    for token, address in DEVICES.items():
+        device = fleet.add(token)
+        device.declare({
+            'Voltage': {
+                'type': 'numeric',
+                'bind': Meter(address)
+            },
+        })
+        device.declare_diag({
+            'Modbus Address': address,
+        })
+
+    fleet.connect()
+    for device in fleet.devices:
+        device.publish_config()
+
+    try:
+        fleet.run(data_interval=DATA_SENDING_INTERVAL,
+                  diag_interval=DIAG_SENDING_INTERVAL)
+    finally:
+        fleet.disconnect()
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        cloud4rpi.log.info('Keyboard interrupt received. Stopping...')
+    except Exception as e:
+        error = cloud4rpi.get_error_message(e)
+        cloud4rpi.log.error("ERROR! %s %s", error, sys.exc_info()[0])
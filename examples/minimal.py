@@ -37,7 +37,6 @@ DEVICE_TOKEN = '__YOUR_DEVICE_TOKEN__'
 # Constants
 DATA_SENDING_INTERVAL = 60  # secs
 DIAG_SENDING_INTERVAL = 650  # secs
-POLL_INTERVAL = 0.5  # secs
 
 
 def main():
@@ -72,20 +71,9 @@ def main():
     sleep(1)
 
     try:
-        diag_timer = 0
-        data_timer = 0
-        while True:
-            if data_timer <= 0:
-                device.publish_data()
-                data_timer = DATA_SENDING_INTERVAL
-
-            if diag_timer <= 0:
-                device.publish_diag()
-                diag_timer = DIAG_SENDING_INTERVAL
-
-            diag_timer -= POLL_INTERVAL
-            data_timer -= POLL_INTERVAL
-            sleep(POLL_INTERVAL)
+        cloud4rpi.run(device,
+                      data_interval=DATA_SENDING_INTERVAL,
+                      diag_interval=DIAG_SENDING_INTERVAL)
 
     except KeyboardInterrupt:
         cloud4rpi.log.info('Keyboard interrupt received. Stopping...')
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import asyncio
+import cloud4rpi
+import cloud4rpi.aio
+
+
+# these coroutines will be awaited by device when sending data
+async def room_temp():
+    await asyncio.sleep(0.1)  # e.g. a non-blocking sensor request
+    return 25
+
+
+async def outside_temp():
+    await asyncio.sleep(0.1)
+    return 4
+
+
+def hostname():
+    return 'hostname'
+
+
+# Put your device token here. To get the token,
+# sign up at https://cloud4rpi.io and create a device.
+DEVICE_TOKEN = '__YOUR_DEVICE_TOKEN__'
+
+# Constants
+DATA_SENDING_INTERVAL = 60  # secs
+DIAG_SENDING_INTERVAL = 650  # secs
+
+
+async def send_data(device):
+    while True:
+        await device.publish_data()
+        await asyncio.sleep(DATA_SENDING_INTERVAL)
+
+
+async def send_diag(device):
+    while True:
+        await device.publish_diag()
+        await asyncio.sleep(DIAG_SENDING_INTERVAL)
+
+
+async def main():
+    device = await cloud4rpi.aio.connect(DEVICE_TOKEN)
+    device.declare({
+        'Room Temp': {
+            'type': 'numeric',
+            'bind': room_temp
+        },
+        'Outside Temp': {
+            'type': 'numeric',
+            'bind': outside_temp
+        }
+    })
+    device.declare_diag({
+        'Host Name': hostname,
+    })
+
+    await device.publish_config()
+    await asyncio.gather(send_data(device), send_diag(device))
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.get_event_loop().run_until_complete(main())
+    except KeyboardInterrupt:
+        cloud4rpi.log.info('Keyboard interrupt received. Stopping...')
+    except Exception as e:
+        error = cloud4rpi.get_error_message(e)
+        cloud4rpi.log.error("ERROR! %s %s", error, sys.exc_info()[0])
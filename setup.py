@@ -25,5 +25,6 @@ setup(name='cloud4rpi',
       license='MIT',
       packages=['cloud4rpi'],
       install_requires=[
-          'paho-mqtt'
+          'paho-mqtt',
+          'futures; python_version < "3.2"'
       ])
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+
+def sleeping(value, delay=0.1):
+    async def read():
+        await asyncio.sleep(delay)
+        return value
+    return read
+
+
+def echo(delay=0):
+    async def handle(value):
+        await asyncio.sleep(delay)
+        return value
+    return handle
+
+
+def counting(calls, value):
+    async def read():
+        calls.append(value)
+        return value
+    return read
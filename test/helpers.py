@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+import time
+from mock import Mock, patch
+
+from cloud4rpi.mqtt_api import MqttApi
+
+
+WAIT_TIMEOUT = 10  # sec
+
+
+def ignore(*args, **kwargs):
+    pass
+
+
+def wait_for(condition, timeout=WAIT_TIMEOUT):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(.01)
+    return True
+
+
+class FakeMqttClient(object):
+    # Connects at once and keeps what is published. PUBACKs arrive when
+    # the test calls ack(), or from publish() itself with ack_at_once.
+    def __init__(self, *args, **kwargs):
+        self.published = []
+        self.mid = 0
+        self.ack_at_once = False
+        self.on_connect = ignore
+        self.on_publish = ignore
+        self.on_disconnect = ignore
+        self.on_message = ignore
+        self.subscribe = Mock()
+        self.disconnect = Mock()
+
+    def connect(self, host, port, keepalive):
+        self.on_connect(self, None, None, 0)
+
+    def reconnect(self):
+        self.on_connect(self, None, None, 0)
+
+    def socket(self):
+        return None
+
+    def loop_misc(self):
+        pass
+
+    def publish(self, topic, qos, payload):
+        self.mid += 1
+        self.published.append((self.mid, topic, payload))
+        if self.ack_at_once:
+            self.ack(self.mid)
+        return 0, self.mid
+
+    def ack(self, mid):
+        self.on_publish(self, None, mid)
+
+    def ack_all(self):
+        published, self.published = self.published, []
+        for mid, _, _ in published:
+            self.ack(mid)
+        return published
+
+    def deliver(self, payload):
+        self.on_message(self, None, Mock(topic='commands', payload=payload))
+
+
+def create_api(client, *args, **kwargs):
+    # Connected through the given fake client instead of a broker
+    with patch('cloud4rpi.mqtt_api.mqtt.Client', return_value=client):
+        api = MqttApi(*args, **kwargs)
+    api.connect()
+    return api
+
+
+class ApiClientMock(object):
+    def __init__(self):
+        self.publish_config = Mock()
+        self.publish_data = Mock()
+        self.publish_data_batch = Mock()
+        self.publish_diag = Mock()
+        self.on_command = ignore
+
+    def assert_publish_data_called_with(self, expected):
+        return self.publish_data.assert_called_with(expected, data_type='cr')
+
+    def raise_on_command(self, cmd):
+        self.on_command(cmd)
+
+    def published(self):
+        return [c[0][0] for c in self.publish_data.call_args_list]
+
+
+class MockSensor(object):
+    def __init__(self, value=42):
+        self.read = Mock(return_value=value)
+        self.__innerValue__ = value
+
+    def get_state(self):
+        return self.__innerValue__
+
+    def get_updated_state(self, value):
+        self.__innerValue__ = value
+        return self.__innerValue__
+
+    def get_incremented_state(self, value):
+        return self.__innerValue__ + value
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
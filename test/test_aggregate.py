@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from mock import patch
+
+from helpers import ApiClientMock, FakeClock
+import cloud4rpi
+from cloud4rpi.aggregate import Aggregator
+
+
+class TestAggregator(unittest.TestCase):
+    def testAggregatesClosedWindows(self):
+        aggregator = Aggregator('Current', 'numeric',
+                                ['min', 'max', 'mean', 'last', 'count'], 10)
+        for now, value in enumerate([3, 1, 5, 7]):
+            aggregator.add(value, now)
+
+        self.assertEqual(aggregator.read(9), {
+            'Current.min': None, 'Current.max': None, 'Current.mean': None,
+            'Current.last': None, 'Current.count': None})
+        self.assertEqual(aggregator.read(10), {
+            'Current.min': 1, 'Current.max': 7, 'Current.mean': 4.0,
+            'Current.last': 7, 'Current.count': 4})
+
+        aggregator.add(2, 20)
+        aggregator.add(None, 25)
+        self.assertEqual(aggregator.read(30)['Current.mean'], 2.0)
+
+    def testAggregatesBoolsAsNumbers(self):
+        aggregator = Aggregator('Door', 'bool', ['min', 'mean', 'last'], 10)
+        for value in (True, False, True, True):
+            aggregator.add(value, 0)
+
+        self.assertEqual(aggregator.read(10), {
+            'Door.min': 0.0, 'Door.mean': .75, 'Door.last': True})
+        self.assertEqual(aggregator.config(), [
+            {'name': 'Door.min', 'type': 'numeric'},
+            {'name': 'Door.mean', 'type': 'numeric'},
+            {'name': 'Door.last', 'type': 'bool'},
+        ])
+
+    def testOnlyKeepsTheLastOfOtherTypes(self):
+        with self.assertRaises(ValueError):
+            Aggregator('State', 'string', ['max'])
+        with self.assertRaises(ValueError):
+            Aggregator('Current', 'numeric', ['median'])
+
+        aggregator = Aggregator('State', 'string', ['last'], 10)
+        aggregator.add('ok', 0)
+        self.assertEqual(aggregator.read(10), {'State.last': 'ok'})
+
+
+class TestDeviceAggregation(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch('cloud4rpi.utils.monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.api = ApiClientMock()
+        self.device = cloud4rpi.Device(self.api)
+        self.current = iter(range(100))
+        self.device.declare({
+            'Current': {
+                'type': 'numeric',
+                'bind': lambda: next(self.current),
+                'aggregate': ['min', 'max', 'mean', 'last'],
+                'window': 60,
+            },
+            'Temp': {'type': 'numeric', 'bind': lambda: 36.6},
+        })
+
+    def sample(self, seconds, rate):
+        for _ in range(int(seconds * rate)):
+            self.device.sample()
+            self.clock.now += 1.0 / rate
+
+    def testPublishesDerivedVariables(self):
+        cfg = sorted(self.device.read_config(), key=lambda v: v['name'])
+
+        self.assertTrue(self.device.sampling)
+        self.assertEqual(cfg, [
+            {'name': 'Current.last', 'type': 'numeric'},
+            {'name': 'Current.max', 'type': 'numeric'},
+            {'name': 'Current.mean', 'type': 'numeric'},
+            {'name': 'Current.min', 'type': 'numeric'},
+            {'name': 'Temp', 'type': 'numeric'},
+        ])
+
+    def testReadsWindowsSampledOnTheirOwnCadence(self):
+        self.sample(60, 1)
+        self.sample(1, 1)
+
+        self.assertEqual(self.device.read_data(), {
+            'Current.min': 0, 'Current.max': 59, 'Current.mean': 29.5,
+            'Current.last': 59, 'Temp': 36.6})
+
+    def testPublishesEachWindowOnce(self):
+        self.sample(61, 1)
+        self.device.publish_data()
+        self.device.publish_data()
+
+        first, second = [c[0][0] for c in
+                         self.api.publish_data.call_args_list]
+        self.assertEqual(first['Current.max'], 59)
+        self.assertEqual(second, {'Temp': 36.6})
+
+    def testReadingDataDoesNotConsumeTheWindow(self):
+        self.sample(61, 1)
+        self.device.read_data()
+        self.device.publish_data()
+
+        published = self.api.publish_data.call_args[0][0]
+        self.assertEqual(published['Current.max'], 59)
+
+    def testIgnoresCommandsForAggregatedVariables(self):
+        commands = []
+
+        def set_level(value):
+            commands.append(value)
+            return value
+
+        self.device.declare({
+            'Level': {'type': 'numeric', 'bind': set_level,
+                      'aggregate': ['mean']},
+        })
+        self.api.raise_on_command({'Level': 5, 'Level.mean': 5})
+
+        self.assertEqual(commands, [])
+        self.api.publish_data.assert_not_called()
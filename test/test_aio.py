@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import unittest
+from mock import Mock, patch
+
+if sys.version_info < (3, 5):
+    raise unittest.SkipTest('asyncio API requires Python 3.5+')
+
+import asyncio
+from aio_bindings import sleeping, echo, counting
+from helpers import FakeMqttClient
+from cloud4rpi.aio import AsyncDevice, AsyncMqttApi, AsyncioLoop
+
+
+class AsyncApiClientMock(object):
+    def __init__(self, loop):
+        def noop_on_command(cmd):
+            pass
+
+        def done(*args, **kwargs):
+            future = loop.create_future()
+            future.set_result(None)
+            return future
+
+        self.loop = loop
+        self.publish_config = Mock(side_effect=done)
+        self.publish_data = Mock(side_effect=done)
+        self.publish_data_batch = Mock(side_effect=done)
+        self.publish_diag = Mock(side_effect=done)
+        self.on_command = noop_on_command
+
+
+class AsyncTestCase(unittest.TestCase):
+    def setUp(self):
+        super(AsyncTestCase, self).setUp()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        super(AsyncTestCase, self).tearDown()
+        self.loop.close()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+
+class TestAsyncDevice(AsyncTestCase):
+    def setUp(self):
+        super(TestAsyncDevice, self).setUp()
+        self.api = AsyncApiClientMock(self.loop)
+        self.device = AsyncDevice(self.api)
+
+    def testAwaitsBindingsConcurrently(self):
+        self.device.declare({
+            'A': {'type': 'numeric', 'bind': sleeping(1, 0.2)},
+            'B': {'type': 'numeric', 'bind': sleeping(2, 0.2)},
+            'C': {'type': 'numeric', 'bind': lambda: 3},
+        })
+        started = self.loop.time()
+        data = self.run_async(self.device.read_data())
+        self.assertLess(self.loop.time() - started, 0.35)
+        self.assertEqual(data, {'A': 1, 'B': 2, 'C': 3})
+
+    def testPublishesData(self):
+        self.device.declare({
+            'Temp': {'type': 'numeric', 'bind': sleeping(36.6)},
+        })
+        self.run_async(self.device.publish_data())
+        self.api.publish_data.assert_called_with({'Temp': 36.6})
+
+    def testPublishesConfig(self):
+        self.device.declare({
+            'Temp': {'type': 'numeric', 'bind': sleeping(36.6)},
+        })
+        self.run_async(self.device.publish_config())
+        self.api.publish_config.assert_called_with(
+            [{'name': 'Temp', 'type': 'numeric'}])
+
+    def testPublishesDiag(self):
+        self.device.declare_diag({
+            'Host': sleeping('pi'),
+            'OS': 'Linux',
+        })
+        self.run_async(self.device.publish_diag())
+        self.api.publish_diag.assert_called_with({'Host': 'pi', 'OS': 'Linux'})
+
+    def testPublishesCachedDiag(self):
+        self.device.declare_diag({
+            'Host': {'bind': sleeping('pi'), 'on_change': True},
+        })
+        self.run_async(self.device.publish_diag())
+        self.api.publish_diag.assert_called_with({'Host': 'pi'})
+
+    @patch('cloud4rpi.utils.monotonic')
+    def testAwaitsStaticAndTtlDiagOnlyWhenDue(self, monotonic):
+        calls = []
+        self.device.declare_diag({
+            'Host': {'bind': counting(calls, 'pi'), 'static': True},
+            'IP': {'bind': counting(calls, '10.0.0.2'), 'ttl': 60},
+        })
+        for now in (0, 30, 59, 60, 200):
+            monotonic.return_value = now
+            self.run_async(self.device.read_diag())
+
+        self.assertEqual(calls, ['pi', '10.0.0.2', '10.0.0.2', '10.0.0.2'])
+
+    def testAwaitsCommandHandlers(self):
+        self.device.declare({
+            'LEDOn': {'type': 'bool', 'value': False, 'bind': echo(0.05)},
+        })
+        self.loop.call_soon(self.api.on_command, {'LEDOn': True})
+        self.run_async(asyncio.sleep(0.1))
+        self.api.publish_data.assert_called_with({'LEDOn': True},
+                                                 data_type='cr')
+
+
+class TestAsyncMqttApi(AsyncTestCase):
+    def setUp(self):
+        super(TestAsyncMqttApi, self).setUp()
+        asyncio.set_event_loop(self.loop)
+
+    def testPublishResolvesOnAck(self):
+        client = FakeMqttClient()
+        with patch('cloud4rpi.mqtt_api.mqtt.Client', return_value=client):
+            api = AsyncMqttApi('4GPZFMVuacadesU21dBw47zJi', loop=self.loop)
+        self.run_async(api.connect(timeout=1))
+        self.assertTrue(api.connected)
+
+        future = api.publish_data({'Temp': 1})
+        self.assertFalse(future.done())
+        self.loop.call_later(.05, client.ack, 1)
+        self.run_async(asyncio.wait_for(future, 1))
+
+    @patch('cloud4rpi.aio.MISC_INTERVAL', .01)
+    def testAbortsTheAttemptOnTimeout(self):
+        with patch('cloud4rpi.mqtt_api.mqtt.Client') as client_class:
+            client = client_class.return_value
+            api = AsyncMqttApi('4GPZFMVuacadesU21dBw47zJi', loop=self.loop)
+            with self.assertRaises(asyncio.TimeoutError):
+                self.run_async(api.connect(timeout=.05))
+
+        client.disconnect.assert_called_once_with()
+        client.loop_misc.reset_mock()
+        self.run_async(asyncio.sleep(.05))
+        client.loop_misc.assert_not_called()
+
+
+class TestAsyncioLoop(AsyncTestCase):
+    def testKnowsItsOwnThread(self):
+        network = AsyncioLoop(self.loop)
+
+        async def in_loop():
+            return network.in_loop()
+
+        self.assertTrue(self.run_async(in_loop()))
+        self.assertFalse(network.in_loop())
+
+    @patch('cloud4rpi.aio.MISC_INTERVAL', .01)
+    def testKeepsOneTimerPerClient(self):
+        network = AsyncioLoop(self.loop)
+        client = Mock()
+        network.start(client)
+        network.start(client)
+        network.stop(client)
+
+        self.run_async(asyncio.sleep(.05))
+        client.loop_misc.assert_not_called()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from mock import patch
+from helpers import ApiClientMock
+import cloud4rpi
+
+
+class Batching(unittest.TestCase):
+    def setUp(self):
+        super(Batching, self).setUp()
+        self.api = ApiClientMock()
+        self.device = cloud4rpi.Device(self.api)
+        self.device.declare({'Temp': {'type': 'numeric'}})
+
+    def published_samples(self):
+        samples = self.api.publish_data_batch.call_args[0][0]
+        return [payload for _, payload in samples]
+
+    def testCollectsSamplesUntilSizeReached(self):
+        self.device.set_batching(size=3)
+        self.device.publish_data({'Temp': 1})
+        self.device.publish_data({'Temp': 2})
+        self.api.publish_data_batch.assert_not_called()
+
+        self.device.publish_data({'Temp': 3})
+        self.assertEqual(self.published_samples(),
+                         [{'Temp': 1}, {'Temp': 2}, {'Temp': 3}])
+        self.api.publish_data.assert_not_called()
+
+    def testEachSampleHasItsOwnTimestamp(self):
+        self.device.set_batching(size=2)
+        with patch('cloud4rpi.batch.utils.utcnow', side_effect=['t1', 't2']):
+            self.device.publish_data({'Temp': 1})
+            self.device.publish_data({'Temp': 2})
+        samples = self.api.publish_data_batch.call_args[0][0]
+        self.assertEqual([ts for ts, _ in samples], ['t1', 't2'])
+
+    @patch('cloud4rpi.batch.utils.monotonic')
+    def testFlushesByAge(self, monotonic):
+        self.device.set_batching(window=60)
+        monotonic.return_value = 100
+        self.device.publish_data({'Temp': 1})
+        monotonic.return_value = 159
+        self.device.publish_data({'Temp': 2})
+        self.api.publish_data_batch.assert_not_called()
+
+        monotonic.return_value = 160
+        self.device.publish_data({'Temp': 3})
+        self.assertEqual(len(self.published_samples()), 3)
+
+    @patch('cloud4rpi.batch.utils.monotonic')
+    def testFlushesByAgeWhenNothingChanged(self, monotonic):
+        self.device.declare({'Temp': {'type': 'numeric', 'bind': lambda: 1,
+                                      'on_change': True}})
+        self.device.set_batching(window=60)
+        monotonic.return_value = 100
+        self.device.publish_data()
+        monotonic.return_value = 159
+        self.device.publish_data()
+        self.api.publish_data_batch.assert_not_called()
+
+        monotonic.return_value = 160
+        self.device.publish_data()
+        self.assertEqual(self.published_samples(), [{'Temp': 1}])
+
+    def testExplicitFlush(self):
+        self.device.set_batching(size=10)
+        self.device.publish_data({'Temp': 1})
+        self.device.flush()
+        self.assertEqual(self.published_samples(), [{'Temp': 1}])
+
+        self.api.publish_data_batch.reset_mock()
+        self.device.flush()
+        self.api.publish_data_batch.assert_not_called()
+
+    def testDisablingFlushesPendingSamples(self):
+        self.device.set_batching(size=10)
+        self.device.publish_data({'Temp': 1})
+        self.device.set_batching()
+        self.assertEqual(self.published_samples(), [{'Temp': 1}])
+
+        self.device.publish_data({'Temp': 2})
+        self.api.publish_data.assert_called_with({'Temp': 2})
+
+    def testCommandResultsAreNotBatched(self):
+        self.device.declare({'LEDOn': {'type': 'bool', 'bind': lambda x: x}})
+        self.device.set_batching(size=10)
+        self.api.raise_on_command({'LEDOn': True})
+        self.api.assert_publish_data_called_with({'LEDOn': True})
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+import unittest
+from mock import Mock
+
+from helpers import ApiClientMock
+import cloud4rpi
+from cloud4rpi.commands import CommandExecutor
+from cloud4rpi.metrics import Metrics
+
+TIMEOUT = 5  # sec
+
+
+class TestCommandExecutor(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        self.executor = CommandExecutor(4, max_pending=4,
+                                        metrics=self.metrics)
+        self.addCleanup(self.executor.shutdown)
+        self.runs = []
+
+    def record(self, key, value, delay=0):
+        time.sleep(delay)
+        self.runs.append((key, value))
+
+    def testKeepsTheOrderPerKey(self):
+        for value in range(4):
+            self.executor.submit('Relay', self.record, 'Relay', value,
+                                 .01 if value == 0 else 0)
+
+        self.assertTrue(self.executor.join(TIMEOUT))
+        self.assertEqual(self.runs, [('Relay', v) for v in range(4)])
+
+    def testRunsKeysInParallel(self):
+        release = threading.Event()
+        self.executor.submit('Slow', release.wait, TIMEOUT)
+        self.executor.submit('Fast', self.record, 'Fast', 1)
+
+        deadline = time.time() + TIMEOUT
+        while not self.runs and time.time() < deadline:
+            time.sleep(.01)
+        self.assertEqual(self.runs, [('Fast', 1)])
+        release.set()
+        self.assertTrue(self.executor.join(TIMEOUT))
+
+    def testDropsCommandsBeyondTheQueueDepth(self):
+        release = threading.Event()
+        for _ in range(4):
+            self.assertTrue(self.executor.submit('Relay', release.wait))
+        self.assertFalse(self.executor.submit('Relay', release.wait))
+
+        release.set()
+        self.assertTrue(self.executor.join(TIMEOUT))
+        self.assertEqual(self.executor.stats(),
+                         {'pending': 0, 'executed': 4, 'dropped': 1,
+                          'coalesced': 0})
+
+    def testReportsQueueingLatency(self):
+        self.executor.submit('Relay', self.record, 'Relay', 0, .05)
+        self.executor.submit('Relay', self.record, 'Relay', 1)
+        self.assertTrue(self.executor.join(TIMEOUT))
+
+        latency = self.metrics.histograms('command_queue_seconds')['Relay']
+        self.assertEqual(latency.count, 2)
+        self.assertGreaterEqual(latency.max, .04)
+
+    def testKeepsRunningAfterAFailure(self):
+        self.executor.submit('Relay', Mock(side_effect=IOError('serial')))
+        self.executor.submit('Relay', self.record, 'Relay', 1)
+
+        self.assertTrue(self.executor.join(TIMEOUT))
+        self.assertEqual(self.runs, [('Relay', 1)])
+
+
+class TestCoalescing(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        self.intervals = {}
+        self.executor = CommandExecutor(2, metrics=self.metrics,
+                                        coalesce=True,
+                                        min_interval=self.intervals.get)
+        self.addCleanup(self.executor.shutdown)
+        self.release = threading.Event()
+        self.runs = []
+
+    def slider(self, value):
+        self.release.wait(TIMEOUT)
+        self.runs.append(value)
+
+    def testRunsTheLatestValueOfABurst(self):
+        for value in range(10):
+            self.executor.submit('Slider', self.slider, value)
+        self.release.set()
+
+        self.assertTrue(self.executor.join(TIMEOUT))
+        self.assertEqual(self.runs, [0, 9])
+        self.assertEqual(self.executor.coalesced, 8)
+        self.assertEqual(self.metrics.counters('commands_coalesced'),
+                         {'Slider': 8})
+
+    def testSpacesOutRunsByTheMinimumInterval(self):
+        self.release.set()
+        self.intervals['Slider'] = .2
+        self.executor.submit('Slider', self.slider, 0)
+        self.assertTrue(self.executor.join(TIMEOUT))
+        start = time.time()
+        for value in range(1, 4):
+            self.executor.submit('Slider', self.slider, value)
+
+        self.assertTrue(self.executor.join(TIMEOUT))
+        self.assertGreaterEqual(time.time() - start, .15)
+        self.assertEqual(self.runs, [0, 3])
+
+
+class TestDeviceCommands(unittest.TestCase):
+    def setUp(self):
+        self.api = ApiClientMock()
+        self.device = cloud4rpi.Device(self.api)
+        self.release = threading.Event()
+        self.device.declare({
+            'Relay': {'type': 'bool', 'bind': self.slow_relay},
+            'LED': {'type': 'bool', 'bind': lambda value: value},
+        })
+        self.executor = self.device.set_command_concurrency(workers=2)
+        self.addCleanup(self.device.set_command_concurrency, None)
+
+    def slow_relay(self, value):
+        self.release.wait(TIMEOUT)
+        return value
+
+    def testRunsHandlersOffTheCallingThread(self):
+        start = time.time()
+        self.api.on_command({'Relay': True, 'LED': True})
+        self.assertLess(time.time() - start, .5)
+
+        deadline = time.time() + TIMEOUT
+        while not self.api.publish_data.called and time.time() < deadline:
+            time.sleep(.01)
+        self.api.publish_data.assert_called_once_with({'LED': True},
+                                                      data_type='cr')
+
+        self.release.set()
+        self.assertTrue(self.executor.join(TIMEOUT))
+        self.api.publish_data.assert_called_with({'Relay': True},
+                                                 data_type='cr')
+
+    def testSkipsUnknownVariables(self):
+        self.api.on_command({'Unknown': 1})
+
+        self.assertEqual(self.executor.pending, 0)
+        self.api.publish_data.assert_not_called()
+
+
+class TestDeviceCoalescing(unittest.TestCase):
+    def testPublishesOneResultPerBurst(self):
+        api = ApiClientMock()
+        device = cloud4rpi.Device(api)
+        handler = Mock(side_effect=lambda value: value)
+        device.declare({
+            'Dimmer': {'type': 'numeric', 'bind': handler,
+                       'min_interval': .1},
+        })
+        executor = device.set_command_concurrency(coalesce=True)
+        self.addCleanup(device.set_command_concurrency, None)
+
+        api.on_command({'Dimmer': 0})
+        self.assertTrue(executor.join(TIMEOUT))
+        for value in range(1, 20):
+            api.on_command({'Dimmer': value})
+        self.assertTrue(executor.join(TIMEOUT))
+
+        self.assertEqual(handler.call_count, 2)
+        self.assertEqual([c[0][0] for c in api.publish_data.call_args_list],
+                         [{'Dimmer': 0}, {'Dimmer': 19}])
+        self.assertEqual(device.stats()['commands_coalesced'],
+                         {'Dimmer': 18})
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import socket
+import unittest
+from mock import patch
+
+if sys.version_info < (3, 4):
+    raise unittest.SkipTest('The stand-in broker requires Python 3.4+')
+
+from helpers import wait_for
+import cloud4rpi
+from benchmarks.broker import Broker
+from cloud4rpi.errors import MqttConnectionError
+from cloud4rpi.mqtt_api import MqttApi, CONNECT_RESULT_UNDEFINED
+from cloud4rpi.network import backoff
+from cloud4rpi.handles import PENDING
+from cloud4rpi.window import InFlightWindow, WINDOW_BLOCK
+
+TOKEN = '4GPZFMVuacadesU21dBw47zJi'
+TIMEOUT = 10  # sec
+
+
+class TestBackoff(unittest.TestCase):
+    def testGrowsExponentiallyUpToTheCap(self):
+        for attempt in range(10):
+            delays = [backoff(attempt, 1, 30) for _ in range(100)]
+            self.assertTrue(all(0 <= d <= min(30, 2 ** attempt)
+                                for d in delays))
+        self.assertGreater(max(backoff(10, 1, 30) for _ in range(100)), 15)
+
+    def testSpreadsTheDelays(self):
+        delays = [backoff(0, 1, 30) for _ in range(100)]
+        self.assertGreater(len(set(delays)), 90)
+
+
+class TestConnect(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker().start()
+        self.received = []
+        self.broker.on_message = \
+            lambda client, topic, payload: \
+            self.received.append((time.time(), topic))
+        self.api = MqttApi(TOKEN, '127.0.0.1', self.broker.port)
+
+    def tearDown(self):
+        self.api.disconnect()
+        self.broker.stop()
+
+    def testReturnsOnConnack(self):
+        self.assertEqual(self.api.connect(TIMEOUT), 0)
+        self.assertTrue(self.api.connected)
+
+    def testRaisesWhenRefused(self):
+        self.broker.refuse = True
+        with self.assertRaises(MqttConnectionError) as context:
+            self.api.connect(TIMEOUT)
+        self.assertEqual(context.exception.code, 5)
+        self.assertFalse(self.api.connected)
+
+    def testConnectAsyncReturnsAFuture(self):
+        self.broker.connack_delay = .3
+        future = self.api.connect_async()
+        self.assertFalse(future.done())
+        self.assertEqual(future.result(TIMEOUT), 0)
+        self.assertTrue(self.api.connected)
+
+    def testPublishesQueuedBeforeConnack(self):
+        self.broker.connack_delay = .3
+        start = time.time()
+        with patch('cloud4rpi.mqtt_api.MqttApi', return_value=self.api):
+            device, future = cloud4rpi.connect_async(TOKEN, '127.0.0.1',
+                                                     self.broker.port)
+        device.declare({'Temp': {'type': 'numeric', 'bind': lambda: 36.6}})
+        device.publish_config()
+        device.publish_data()
+        self.assertFalse(future.done())
+
+        self.assertEqual(future.result(TIMEOUT), 0)
+        self.assertTrue(wait_for(lambda: len(self.received) == 2))
+        self.assertEqual([topic for _, topic in self.received],
+                         [self.api.config_topic, self.api.data_topic])
+        time_to_first_publish = self.received[0][0] - start
+        self.assertLess(time_to_first_publish, 1.3)
+
+    def testDisconnectsWithoutWaitingForTheNetworkLoop(self):
+        self.api.connect(TIMEOUT)
+        start = time.time()
+        self.api.disconnect()
+        self.assertLess(time.time() - start, .5)
+
+
+class TestWindowOnTheNetworkThread(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker().start()
+        self.broker.puback = False
+        self.api = MqttApi(TOKEN, '127.0.0.1', self.broker.port,
+                           window=InFlightWindow(1, WINDOW_BLOCK))
+
+    def tearDown(self):
+        self.api.disconnect()
+        self.broker.stop()
+
+    def testHoldsInsteadOfBlocking(self):
+        results = []
+
+        def on_command(cmd):
+            start = time.time()
+            handle = self.api.publish_data(cmd, data_type='cr')
+            results.append((time.time() - start, handle))
+
+        self.api.on_command = on_command
+        self.api.connect(TIMEOUT)
+        self.api.publish_data({'Temp': 36.6})
+        self.assertTrue(wait_for(
+            lambda: self.broker.subscribers(self.api.commands_topic)))
+        self.broker.publish(self.api.commands_topic, b'{"LED": true}')
+
+        self.assertTrue(wait_for(lambda: results))
+        elapsed, handle = results[0]
+        self.assertLess(elapsed, .5)
+        self.assertEqual(handle.state, PENDING)
+        self.assertEqual(self.api.window.held, 1)
+
+
+class TestPublishOnce(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker().start()
+        self.received = []
+        self.broker.on_message = \
+            lambda client, topic, payload: self.received.append(topic)
+
+    def tearDown(self):
+        self.broker.stop()
+
+    def publish_once(self, *args, **kwargs):
+        return cloud4rpi.publish_once(TOKEN, *args, host='127.0.0.1',
+                                      port=self.broker.port, **kwargs)
+
+    def testPublishesAndWaitsForAcks(self):
+        start = time.time()
+        acked = self.publish_once({'Temp': 36.6},
+                                  diag={'Uptime': 1},
+                                  config=[{'name': 'Temp',
+                                           'type': 'numeric'}])
+        self.assertTrue(acked)
+        self.assertLess(time.time() - start, 1)
+        prefix = 'devices/{0}/'.format(TOKEN)
+        self.assertEqual(self.received, [prefix + 'config',
+                                         prefix + 'data',
+                                         prefix + 'diagnostics'])
+        self.assertTrue(wait_for(lambda: not self.broker.clients))
+
+    def testSkipsMessagesNotGiven(self):
+        self.assertTrue(self.publish_once({'Temp': 36.6}))
+        self.assertEqual(self.received, ['devices/{0}/data'.format(TOKEN)])
+
+    def testRaisesWhenRefused(self):
+        self.broker.refuse = True
+        with self.assertRaises(MqttConnectionError):
+            self.publish_once({'Temp': 36.6})
+
+
+class TestConnectTimeout(unittest.TestCase):
+    def setUp(self):
+        # Accepts connections but never answers
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+
+    def tearDown(self):
+        self.server.close()
+
+    def testGivesUpWithoutConnack(self):
+        api = MqttApi(TOKEN, '127.0.0.1', self.server.getsockname()[1])
+        start = time.time()
+        with self.assertRaises(MqttConnectionError) as context:
+            api.connect(.5)
+        self.assertEqual(context.exception.code, CONNECT_RESULT_UNDEFINED)
+        self.assertLess(time.time() - start, 2)
+        self.assertFalse(api.connected)
@@ -1,46 +1,16 @@
 # -*- coding: utf-8 -*-
 
+import time
 import unittest
-from mock import Mock
+from threading import Event
+from mock import Mock, patch
+from helpers import ApiClientMock, MockSensor
 import cloud4rpi
 from cloud4rpi.errors import InvalidConfigError
 from cloud4rpi.errors import UnexpectedVariableTypeError
 from cloud4rpi.errors import UnexpectedVariableValueTypeError
 
 
-class ApiClientMock(object):
-    def __init__(self):
-        def noop_on_command(cmd):
-            pass
-
-        self.publish_config = Mock()
-        self.publish_data = Mock()
-        self.publish_diag = Mock()
-        self.on_command = noop_on_command
-
-    def assert_publish_data_called_with(self, expected):
-        return self.publish_data.assert_called_with(expected, data_type='cr')
-
-    def raise_on_command(self, cmd):
-        self.on_command(cmd)
-
-
-class MockSensor(object):
-    def __init__(self, value=42):
-        self.read = Mock(return_value=value)
-        self.__innerValue__ = value
-
-    def get_state(self):
-        return self.__innerValue__
-
-    def get_updated_state(self, value):
-        self.__innerValue__ = value
-        return self.__innerValue__
-
-    def get_incremented_state(self, value):
-        return self.__innerValue__ + value
-
-
 class TestDevice(unittest.TestCase):
     def testDeclareVariables(self):
         api = ApiClientMock()
@@ -536,6 +506,171 @@ class CommandHandling(unittest.TestCase):
         self.api.assert_publish_data_called_with({'Actuator': 'ON'})
 
 
+class ChangeOnlyPublishing(unittest.TestCase):
+    def setUp(self):
+        super(ChangeOnlyPublishing, self).setUp()
+        self.api = ApiClientMock()
+        self.device = cloud4rpi.Device(self.api)
+        self.sensor = MockSensor()
+
+    def publish(self, value):
+        self.sensor.read.return_value = value
+        self.api.publish_data.reset_mock()
+        self.device.publish_data()
+
+    def testAbsoluteDeadband(self):
+        self.device.declare({
+            'Temp': {'type': 'numeric', 'bind': self.sensor, 'deadband': 0.5}
+        })
+        self.publish(20.0)
+        self.api.publish_data.assert_called_with({'Temp': 20.0})
+        self.publish(20.4)
+        self.api.publish_data.assert_not_called()
+        self.publish(20.6)
+        self.api.publish_data.assert_called_with({'Temp': 20.6})
+
+    def testPercentDeadband(self):
+        self.device.declare({
+            'Flow': {'type': 'numeric', 'bind': self.sensor,
+                     'deadband_percent': 10}
+        })
+        self.publish(200)
+        self.publish(219)
+        self.api.publish_data.assert_not_called()
+        self.publish(179)
+        self.api.publish_data.assert_called_with({'Flow': 179})
+
+    def testExactChange(self):
+        self.device.declare({
+            'Status': {'type': 'string', 'bind': self.sensor,
+                       'on_change': True}
+        })
+        self.publish('idle')
+        self.publish('idle')
+        self.api.publish_data.assert_not_called()
+        self.publish('busy')
+        self.api.publish_data.assert_called_with({'Status': 'busy'})
+
+    def testEmitsOnlyChangedSubset(self):
+        self.device.declare({
+            'Temp': {'type': 'numeric', 'bind': self.sensor, 'deadband': 1},
+            'Door': {'type': 'bool', 'bind': lambda: True, 'on_change': True},
+            'Uptime': {'type': 'numeric', 'bind': lambda: 5},
+        })
+        self.publish(20)
+        self.publish(25)
+        self.api.publish_data.assert_called_with({'Temp': 25, 'Uptime': 5})
+
+    @patch('cloud4rpi.device.utils.monotonic')
+    def testKeyframeSendsFullState(self, monotonic):
+        self.device.declare({
+            'Temp': {'type': 'numeric', 'bind': self.sensor, 'deadband': 1}
+        })
+        self.device.set_keyframe_interval(600)
+        monotonic.return_value = 0
+        self.publish(20)
+        monotonic.return_value = 599
+        self.publish(20)
+        self.api.publish_data.assert_not_called()
+        monotonic.return_value = 600
+        self.publish(20)
+        self.api.publish_data.assert_called_with({'Temp': 20})
+
+    def testCommandResultUpdatesLastPublishedValue(self):
+        self.device.declare({
+            'LEDOn': {'type': 'bool', 'value': False,
+                      'bind': lambda x: x, 'on_change': True}
+        })
+        self.api.raise_on_command({'LEDOn': True})
+        self.api.publish_data.reset_mock()
+        self.device.publish_data()
+        self.api.publish_data.assert_not_called()
+
+
+class ConcurrentReading(unittest.TestCase):
+    def setUp(self):
+        super(ConcurrentReading, self).setUp()
+        self.api = ApiClientMock()
+        self.device = cloud4rpi.Device(self.api)
+        self.release = Event()
+
+    def tearDown(self):
+        super(ConcurrentReading, self).tearDown()
+        self.release.set()
+        self.device.set_concurrency()
+
+    def slow(self, value, delay=0.2):
+        def read():
+            time.sleep(delay)
+            return value
+        return read
+
+    def hung(self, value):
+        def read():
+            self.release.wait()
+            return value
+        return read
+
+    def testResolvesBindingsConcurrently(self):
+        self.device.set_concurrency(workers=3)
+        self.device.declare({
+            'A': {'type': 'numeric', 'bind': self.slow(1)},
+            'B': {'type': 'numeric', 'bind': self.slow(2)},
+            'C': {'type': 'string', 'bind': self.slow(3)},
+        })
+        started = time.time()
+        data = self.device.read_data()
+        self.assertLess(time.time() - started, 0.5)
+        self.assertEqual(data, {'A': 1, 'B': 2, 'C': '3'})
+
+    def testFallsBackToLastValueOnTimeout(self):
+        self.device.set_concurrency(workers=2, timeout=0.1)
+        self.device.declare({
+            'Fast': {'type': 'numeric', 'bind': lambda: 1},
+            'Hung': {'type': 'numeric', 'value': 42, 'bind': self.hung(7)},
+        })
+        data = self.device.read_data()
+        self.assertEqual(data, {'Fast': 1, 'Hung': 42})
+        self.assertEqual(self.device.timed_out_bindings, ['Hung'])
+
+    def testPerVariableTimeout(self):
+        self.device.set_concurrency(workers=2, timeout=5)
+        self.device.declare({
+            'Hung': {'type': 'numeric', 'bind': self.hung(7),
+                     'timeout': 0.1},
+        })
+        started = time.time()
+        self.assertEqual(self.device.read_data(), {'Hung': None})
+        self.assertLess(time.time() - started, 1)
+
+    def testDoesNotResubmitHungBinding(self):
+        calls = []
+
+        def read():
+            calls.append(1)
+            self.release.wait()
+            return 7
+
+        self.device.set_concurrency(workers=2, timeout=0.05)
+        self.device.declare({'Hung': {'type': 'numeric', 'bind': read}})
+        self.device.read_data()
+        self.device.read_data()
+        self.assertEqual(len(calls), 1)
+
+        self.release.set()
+        time.sleep(0.05)
+        self.assertEqual(self.device.read_data(), {'Hung': 7})
+        self.assertEqual(self.device.timed_out_bindings, [])
+
+    def testValidatesValues(self):
+        self.device.set_concurrency(workers=2)
+        self.device.declare({
+            'On': {'type': 'bool', 'bind': lambda: 'yes'},
+        })
+        with self.assertRaises(UnexpectedVariableValueTypeError):
+            self.device.read_data()
+
+
 class PayloadValidation(unittest.TestCase):
     def setUp(self):
         super(PayloadValidation, self).setUp()
@@ -722,3 +857,60 @@ class PayloadValidation(unittest.TestCase):
         self.device.declare({'Pos': {'type': 'location'}})
         with self.assertRaises(UnexpectedVariableValueTypeError):
             self.device.publish_data({'Pos': location})
+
+
+class CachedDiagnostics(unittest.TestCase):
+    def setUp(self):
+        super(CachedDiagnostics, self).setUp()
+        self.api = ApiClientMock()
+        self.device = cloud4rpi.Device(self.api)
+        self.sensor = MockSensor('host')
+        self.now = 0.0
+        patcher = patch('cloud4rpi.utils.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def publish(self):
+        self.api.publish_diag.reset_mock()
+        self.device.publish_diag()
+
+    def testResolvesStaticDiagOnce(self):
+        self.device.declare_diag({
+            'Host': {'bind': self.sensor, 'static': True},
+            'Uptime': lambda: self.now,
+        })
+        self.publish()
+        self.api.publish_diag.assert_called_with({'Host': 'host',
+                                                  'Uptime': 0.0})
+        self.now = 10.0
+        self.publish()
+        self.api.publish_diag.assert_called_with({'Uptime': 10.0})
+        self.assertEqual(self.device.read_diag()['Host'], 'host')
+        self.assertEqual(self.sensor.read.call_count, 1)
+
+    def testRefreshesDiagAfterTtl(self):
+        self.device.declare_diag({
+            'IP': {'bind': self.sensor, 'ttl': 60},
+        })
+        self.publish()
+        self.sensor.read.return_value = '10.0.0.2'
+        self.now = 59.0
+        self.publish()
+        self.api.publish_diag.assert_not_called()
+        self.now = 60.0
+        self.publish()
+        self.api.publish_diag.assert_called_with({'IP': '10.0.0.2'})
+        self.assertEqual(self.sensor.read.call_count, 2)
+
+    def testSkipsUnchangedDiag(self):
+        self.device.declare_diag({
+            'Throttled': {'bind': self.sensor, 'on_change': True},
+        })
+        self.publish()
+        self.publish()
+        self.api.publish_diag.assert_not_called()
+        self.assertEqual(self.sensor.read.call_count, 2)
+
+        self.sensor.read.return_value = '0x50000'
+        self.publish()
+        self.api.publish_diag.assert_called_with({'Throttled': '0x50000'})
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+import time
+import threading
+import unittest
+from mock import patch
+
+if sys.version_info < (3, 4):
+    raise unittest.SkipTest('DeviceFleet requires Python 3.4+')
+
+from helpers import wait_for
+from benchmarks.broker import Broker
+from benchmarks.common import device_token
+from cloud4rpi.fleet import DeviceFleet
+from cloud4rpi.scheduler import Scheduler
+
+DEVICES = 20
+TIMEOUT = 10  # sec
+
+
+class TestDeviceFleet(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker().start()
+        self.received = []
+        self.broker.on_message = \
+            lambda client, topic, payload: self.received.append(topic)
+        self.fleet = DeviceFleet('127.0.0.1', self.broker.port)
+        self.tokens = [device_token(i) for i in range(DEVICES)]
+        for token in self.tokens:
+            self.fleet.add(token).declare({
+                'Temp': {'type': 'numeric', 'bind': lambda: 36.6},
+                'LED': {'type': 'bool', 'bind': lambda value: value},
+            })
+
+    def tearDown(self):
+        self.fleet.disconnect()
+        self.broker.stop()
+
+    def testConnectsAllDevicesOverOneThread(self):
+        threads = threading.active_count()
+        self.assertEqual(self.fleet.connect(TIMEOUT), DEVICES)
+        self.assertEqual(self.fleet.connected, DEVICES)
+        self.assertEqual(threading.active_count(), threads + 1)
+
+    def testConnectAsyncResolvesOnceTheGivenDevicesAreUp(self):
+        self.broker.connack_delay = .3
+        future = self.fleet.connect_async(self.tokens[:2])
+        self.assertFalse(future.done())
+        self.assertEqual(future.result(TIMEOUT), 2)
+        self.assertTrue(self.fleet.connect_async(self.tokens[:2]).done())
+
+    def testConnectReturnsOnceEveryDeviceIsAnswered(self):
+        self.broker.refuse = {self.tokens[0]}
+        start = time.time()
+        self.assertEqual(self.fleet.connect(TIMEOUT), DEVICES - 1)
+        self.assertLess(time.time() - start, TIMEOUT / 2)
+        self.assertEqual(self.fleet.refused, {self.tokens[0]: 5})
+
+        future = self.fleet.connect_async(self.tokens[:2])
+        self.assertEqual(future.result(TIMEOUT), 1)
+
+    def testKnowsItsOwnThread(self):
+        self.fleet.connect(TIMEOUT)
+        seen = []
+        self.fleet.network.call_later(
+            0, lambda: seen.append(self.fleet.network.in_loop()))
+        self.assertTrue(wait_for(lambda: seen))
+        self.assertEqual(seen, [True])
+        self.assertFalse(self.fleet.network.in_loop())
+
+    def testPublishesForEachDevice(self):
+        self.fleet.connect(TIMEOUT)
+        for device in self.fleet.devices:
+            device.publish_data()
+
+        self.assertTrue(wait_for(lambda: self.fleet.in_flight == 0))
+        self.assertEqual(
+            sorted(topic for topic in self.received
+                   if topic.endswith('/data')),
+            sorted('devices/{0}/data'.format(token)
+                   for token in self.tokens))
+
+    def testRoutesCommandsToTheirDevice(self):
+        self.fleet.connect(TIMEOUT)
+        token = self.tokens[3]
+        topic = 'devices/{0}/commands'.format(token)
+        self.assertTrue(wait_for(lambda: self.broker.subscribers(topic)))
+        self.broker.publish(topic, json.dumps({'LED': True}).encode())
+
+        self.assertTrue(wait_for(lambda: self.received))
+        self.assertEqual(self.received,
+                         ['devices/{0}/data/cr'.format(token)])
+        self.assertEqual(self.fleet[token].read_data()['LED'], True)
+
+    @patch('cloud4rpi.supervisor.RETRY_INTERVAL', .2)
+    def testReconnectsAfterConnectionsDrop(self):
+        self.fleet.connect(TIMEOUT)
+        self.broker.drop_connections()
+
+        self.assertTrue(wait_for(lambda: self.fleet.connected < DEVICES))
+        self.assertTrue(wait_for(lambda: self.fleet.connected == DEVICES))
+        self.assertEqual(self.broker.connects, 2 * DEVICES)
+
+    @patch('cloud4rpi.supervisor.RETRY_INTERVAL', 1)
+    def testSpreadsReconnectsOverTheRetryInterval(self):
+        self.fleet.connect(TIMEOUT)
+        reconnects = []
+        self.broker.on_connect = lambda client: reconnects.append(time.time())
+        dropped = time.time()
+        self.broker.drop_connections()
+
+        self.assertTrue(wait_for(lambda: len(reconnects) == DEVICES))
+        delays = [t - dropped for t in reconnects]
+        busiest = max(sum(1 for d in delays if start <= d < start + .1)
+                      for start in delays)
+        self.assertLess(busiest, DEVICES / 2)
+        self.assertLess(max(delays), 2)
+
+    def testSchedulesDevicesAcrossTheInterval(self):
+        scheduler = Scheduler()
+        self.fleet.connect(TIMEOUT)
+        self.fleet.schedule(data_interval=1, diag_interval=None,
+                            scheduler=scheduler)
+        timer = threading.Timer(.5, scheduler.stop)
+        timer.start()
+        scheduler.run()
+
+        published = [t for t in self.received if t.endswith('/data')]
+        self.assertGreater(len(published), 1)
+        self.assertLess(len(published), DEVICES)
+
+
+class TestBackpressure(unittest.TestCase):
+    def setUp(self):
+        self.fleet = DeviceFleet('127.0.0.1', 1883, max_in_flight=2)
+        self.fleet.add(device_token(0))
+
+    def testThrottlesWhenSaturated(self):
+        api = self.fleet.api(device_token(0))
+        on_sent, on_published = api.on_sent, api.on_published
+
+        on_sent(1)
+        self.assertTrue(self.fleet.acquire(0))
+        on_sent(2)
+        self.assertTrue(self.fleet.saturated)
+        self.assertFalse(self.fleet.acquire(0))
+        self.assertEqual(self.fleet.throttled, 1)
+
+        threading.Timer(.05, on_published, (1,)).start()
+        self.assertTrue(self.fleet.acquire(TIMEOUT))
+        self.assertEqual(self.fleet.stats()['in_flight'], 1)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+from itertools import count
+from mock import patch
+
+from helpers import FakeMqttClient, create_api
+from cloud4rpi.device import Device
+from cloud4rpi.handles import PublishHandle, PENDING, ACKED, DROPPED
+from cloud4rpi.histogram import Histogram
+
+
+class TestPublishHandle(unittest.TestCase):
+    def testWaitsForResolution(self):
+        handle = PublishHandle('data', 'topic')
+        handle.sent(1)
+        self.assertFalse(handle.wait(.01))
+
+        threading.Timer(.05, handle.resolve, (ACKED,)).start()
+        self.assertTrue(handle.wait(1))
+        self.assertTrue(handle.acked)
+        self.assertGreater(handle.latency, 0)
+
+    def testCallsBackOnceDone(self):
+        handle = PublishHandle('data', 'topic')
+        done = []
+        handle.add_done_callback(done.append)
+        self.assertEqual(done, [])
+
+        handle.resolve(DROPPED)
+        handle.resolve(ACKED)
+        handle.add_done_callback(done.append)
+        self.assertEqual(done, [handle, handle])
+        self.assertEqual(handle.state, DROPPED)
+        self.assertIsNone(handle.latency)
+
+
+class TestHistogram(unittest.TestCase):
+    def testReportsBucketPercentiles(self):
+        histogram = Histogram(buckets=(1, 2, 5, 10))
+        for value in [.5] * 50 + [1.5] * 40 + [4] * 9 + [20]:
+            histogram.record(value)
+
+        stats = histogram.stats()
+        self.assertEqual(stats['count'], 100)
+        self.assertEqual(stats['p50'], 1)
+        self.assertEqual(stats['p90'], 2)
+        self.assertEqual(stats['p99'], 5)
+        self.assertEqual(stats['max'], 20)
+        self.assertEqual(histogram.percentile(1), 20)
+
+    def testIsEmptyAtFirst(self):
+        self.assertEqual(Histogram().stats(), {
+            'count': 0, 'mean': 0, 'max': 0, 'p50': 0, 'p90': 0, 'p99': 0})
+
+
+class TestPublishHandles(unittest.TestCase):
+    token = '4GPZFMVuacadesU21dBw47zJi'
+
+    def setUp(self):
+        self.client = FakeMqttClient()
+        self.api = create_api(self.client, self.token)
+        self.device = Device(self.api)
+        self.device.declare({
+            'LED': {'type': 'bool', 'bind': lambda value: value},
+        })
+
+    def testDeviceReturnsHandlesResolvedOnPuback(self):
+        handle = self.device.publish_data()
+        self.assertEqual(handle.state, PENDING)
+        self.assertEqual(handle.kind, 'data')
+
+        self.client.ack(handle.mid)
+        self.assertTrue(handle.done())
+        self.assertTrue(handle.wait(0))
+        self.assertEqual(self.api.in_flight, 0)
+
+    def testRecordsAckLatencyByKind(self):
+        handles = [self.device.publish_config(),
+                   self.device.publish_data(),
+                   self.device.publish_diag(),
+                   self.api.publish_data({'LED': True}, data_type='cr')]
+        for handle in handles:
+            self.client.ack(handle.mid)
+
+        latency = self.api.ack_latency
+        self.assertEqual(sorted(latency), ['config', 'cr', 'data', 'diag'])
+        self.assertEqual([latency[kind].count for kind in sorted(latency)],
+                         [1, 1, 1, 1])
+
+    def testHandlesAPubackBeforeTheMidIsKnown(self):
+        self.client.ack_at_once = True
+        with patch('cloud4rpi.utils.monotonic', side_effect=count()):
+            handle = self.device.publish_data()
+
+        self.assertTrue(handle.acked)
+        self.assertGreaterEqual(handle.latency, 0)
+        self.assertEqual(self.api.in_flight, 0)
+        self.assertEqual(self.api.ack_latency['data'].count, 1)
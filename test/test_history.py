@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import threading
+from array import array
+from mock import patch
+
+from helpers import ApiClientMock
+import cloud4rpi
+from cloud4rpi.history import History, RingBuffer, downsample, get_numpy, \
+    SAMPLE_SIZE
+
+
+class TestRingBuffer(unittest.TestCase):
+    def testKeepsTheLastSamplesInOrder(self):
+        buf = RingBuffer(3)
+        for i in range(5):
+            buf.append(i, i * 10)
+
+        timestamps, values = buf.range()
+        self.assertEqual(list(timestamps), [2, 3, 4])
+        self.assertEqual(list(values), [20, 30, 40])
+        self.assertEqual(len(buf), 3)
+
+    def testQueriesARange(self):
+        buf = RingBuffer(10)
+        for i in range(10):
+            buf.append(i, i)
+
+        self.assertEqual(list(buf.range(3, 5)[1]), [3, 4, 5])
+        self.assertEqual(list(buf.range(start=8)[1]), [8, 9])
+        self.assertEqual(list(buf.range(end=-1)[1]), [])
+
+    def testKeepsTimestampsInOrderWhenTheClockGoesBack(self):
+        buf = RingBuffer(3)
+        for ts in (10, 20, 15, 30, 5):
+            buf.append(ts, ts)
+
+        timestamps, values = buf.range()
+        self.assertEqual(list(timestamps), [20, 30, 30])
+        self.assertEqual(list(values), [15, 30, 5])
+        self.assertEqual(list(buf.range(25, 30)[1]), [30, 5])
+
+    def testHasAFixedSize(self):
+        buf = RingBuffer(1000)
+        self.assertEqual(buf.nbytes, 1000 * SAMPLE_SIZE)
+        self.assertEqual(SAMPLE_SIZE, 16)
+
+
+class TestHistory(unittest.TestCase):
+    def testRecordsFromManyThreads(self):
+        history = History(1000)
+
+        def record(value):
+            for _ in range(200):
+                history.record('Temp', value)
+
+        threads = [threading.Thread(target=record, args=(i,))
+                   for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        samples = history.query('Temp')
+        self.assertEqual(len(samples), 1000)
+        timestamps = [ts for ts, _ in samples]
+        self.assertEqual(timestamps, sorted(timestamps))
+        self.assertEqual(sorted(set(value for _, value in samples)),
+                         [0, 1, 2, 3, 4])
+
+
+class TestDownsample(unittest.TestCase):
+    def check(self):
+        timestamps = array('d', [0, 1, 2, 3, 10, 11])
+        values = array('d', [1, 5, 3, 7, 2, 4])
+
+        self.assertEqual(downsample(timestamps, values, 5), [
+            (0, 1, 7, 4.0),
+            (10, 2, 4, 3.0),
+        ])
+        self.assertEqual(downsample(array('d'), array('d'), 5), [])
+
+    def testComputesMinMaxMeanPerBucket(self):
+        with patch('cloud4rpi.history.get_numpy', return_value=None):
+            self.check()
+
+    @unittest.skipIf(get_numpy() is None, 'requires NumPy')
+    def testIsVectorizedWithNumpy(self):
+        self.check()
+
+
+class TestDeviceHistory(unittest.TestCase):
+    def setUp(self):
+        self.api = ApiClientMock()
+        self.device = cloud4rpi.Device(self.api)
+        self.temp = iter([20, 21, 22, 23])
+        self.device.declare({
+            'Temp': {'type': 'numeric', 'bind': lambda: next(self.temp)},
+            'LED': {'type': 'bool', 'bind': lambda value: value},
+            'State': {'type': 'string', 'bind': lambda: 'ok'},
+        })
+        self.history = self.device.set_history(capacity=3)
+
+    def values(self, name):
+        return [value for _, value in self.history.query(name)]
+
+    def testRecordsReadings(self):
+        for _ in range(4):
+            self.device.read_data()
+
+        self.assertEqual(self.values('Temp'), [21, 22, 23])
+        self.assertNotIn('State', self.history)
+        self.assertNotIn('LED', self.history)
+
+    def testRecordsCommands(self):
+        self.api.on_command({'LED': True})
+        self.api.on_command({'LED': False})
+
+        self.assertEqual(self.values('LED'), [1, 0])
+
+    def testRecordsPublishedReadings(self):
+        self.device.publish_data()
+
+        self.assertEqual(self.values('Temp'), [20])
+
+    def testCanBeTurnedOff(self):
+        self.device.set_history(None)
+        self.device.read_data()
+
+        self.assertIsNone(self.device.history)
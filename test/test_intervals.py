@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from mock import patch
+
+from helpers import ApiClientMock, FakeClock
+import cloud4rpi
+from cloud4rpi.scheduler import Scheduler
+
+
+class TestIntervals(unittest.TestCase):
+    def setUp(self):
+        self.api = ApiClientMock()
+        self.device = cloud4rpi.Device(self.api)
+        self.reads = {'Flow': 0, 'Location': 0, 'Uptime': 0}
+        self.device_config = {
+            'Flow': {'type': 'numeric', 'bind': self.binding('Flow'),
+                     'interval': 1},
+            'Location': {'type': 'numeric', 'bind': self.binding('Location'),
+                         'interval': 60, 'phase': 30},
+            'Uptime': {'type': 'numeric', 'bind': self.binding('Uptime')},
+        }
+        self.device.declare(self.device_config)
+        self.clock = FakeClock()
+        self.scheduler = Scheduler(clock=self.clock, sleep=self.clock.sleep)
+
+    def binding(self, name):
+        def read():
+            self.reads[name] += 1
+            return self.reads[name]
+        return read
+
+    def run_for(self, seconds, **kwargs):
+        self.scheduler.add(self.scheduler.stop, seconds, 'stop', delay=seconds)
+        cloud4rpi.run(self.device, data_interval=60, diag_interval=0,
+                      scheduler=self.scheduler, **kwargs)
+
+    def testGroupsVariablesByInterval(self):
+        self.assertEqual(sorted(self.device.intervals), [(1, 0), (60, 30)])
+
+    def testReadsOnlyDueVariables(self):
+        self.run_for(119.5)
+
+        self.assertEqual(self.reads, {'Flow': 120, 'Location': 2,
+                                      'Uptime': 2})
+
+    def testPublishesEachGroupOnItsOwn(self):
+        self.run_for(30.5)
+
+        published = self.api.published()
+        self.assertEqual(published[0], {'Flow': 1})
+        self.assertIn({'Location': 1}, published)
+        self.assertEqual(len(published), 31 + 1 + 1)
+
+    def testLeavesPublishedGroupsOutOfDataMessages(self):
+        self.run_for(60.5)
+
+        data = [p for p in self.api.published() if 'Uptime' in p]
+        self.assertEqual(data, [{'Uptime': 1}, {'Uptime': 2}])
+        self.assertEqual(self.reads['Flow'], 61)
+
+    def testPublishesOnlyChangedScheduledValues(self):
+        self.device_config['Flow'] = {'type': 'numeric', 'bind': lambda: 1,
+                                      'interval': 1, 'on_change': True}
+        self.device.declare(self.device_config)
+        self.device.publish_scheduled(1)
+        self.device.publish_scheduled(1)
+
+        self.assertEqual(self.api.published(), [{'Flow': 1}])
+
+    def testMergesIntoTheNextDataMessage(self):
+        self.run_for(60.5, publish_scheduled=False)
+
+        self.assertEqual(self.api.published(), [
+            {'Flow': 1, 'Location': None, 'Uptime': 1},
+            {'Flow': 60, 'Location': 1, 'Uptime': 2},
+        ])
+
+    def testReadDataUsesTheLastScheduledValues(self):
+        self.device.read_scheduled(1)
+        self.device.read_data()
+
+        self.assertEqual(self.device.read_data(),
+                         {'Flow': 1, 'Location': None, 'Uptime': 2})
+
+    def testReadsDueGroupsWithoutRun(self):
+        self.clock.now = 100.0
+        with patch('cloud4rpi.utils.monotonic', self.clock):
+            self.device.declare(self.device_config)
+            published = []
+            for now in (100, 100.5, 101, 130, 131):
+                self.clock.now = now
+                published.append(self.device.read_data())
+
+        self.assertEqual([(p['Flow'], p['Location']) for p in published],
+                         [(1, None), (1, None), (2, None), (3, 1), (4, 1)])
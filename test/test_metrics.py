@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+from mock import Mock
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    from urllib2 import urlopen
+
+from helpers import FakeMqttClient, create_api
+from cloud4rpi.device import Device
+from cloud4rpi.metrics import Metrics
+from cloud4rpi.supervisor import Supervisor
+from cloud4rpi.errors import UnexpectedVariableValueTypeError
+from cloud4rpi import prometheus
+
+
+class TestMetrics(unittest.TestCase):
+    def testCountsByLabel(self):
+        metrics = Metrics()
+        metrics.inc('published_messages', 'data')
+        metrics.inc('published_messages', 'data')
+        metrics.inc('published_bytes', 'data', 100)
+        metrics.inc('reconnects')
+
+        self.assertEqual(metrics.stats(), {
+            'published_messages': {'data': 2},
+            'published_bytes': {'data': 100},
+            'reconnects': 1,
+        })
+
+    def testSummarizesHistograms(self):
+        metrics = Metrics()
+        for _ in range(10):
+            metrics.observe('ack_latency_seconds', .02, 'data')
+
+        stats = metrics.stats()['ack_latency_seconds']['data']
+        self.assertEqual(stats['count'], 10)
+        self.assertEqual(stats['p99'], .02)
+
+    def testRecordsNothingWhenDisabled(self):
+        metrics = Metrics(enabled=False)
+        metrics.inc('acks', 'data')
+        metrics.observe('ack_latency_seconds', .02, 'data')
+
+        self.assertEqual(metrics.stats(), {})
+
+
+class TestPrometheus(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        self.metrics.inc('published_messages', 'data/cr', 3)
+        self.metrics.inc('reconnects')
+        self.metrics.observe('ack_latency_seconds', .003, 'data')
+        self.metrics.observe('ack_latency_seconds', 20, 'data')
+
+    def testFormatsTheTextExposition(self):
+        lines = prometheus.format_metrics(self.metrics).splitlines()
+
+        self.assertIn('# TYPE cloud4rpi_published_messages_total counter',
+                      lines)
+        self.assertIn('cloud4rpi_published_messages_total{topic="data/cr"} 3',
+                      lines)
+        self.assertIn('cloud4rpi_reconnects_total 1', lines)
+        self.assertIn('# TYPE cloud4rpi_ack_latency_seconds histogram', lines)
+        self.assertIn('cloud4rpi_ack_latency_seconds_bucket'
+                      '{kind="data",le="0.001"} 0', lines)
+        self.assertIn('cloud4rpi_ack_latency_seconds_bucket'
+                      '{kind="data",le="0.005"} 1', lines)
+        self.assertIn('cloud4rpi_ack_latency_seconds_bucket'
+                      '{kind="data",le="+Inf"} 2', lines)
+        self.assertIn('cloud4rpi_ack_latency_seconds_count{kind="data"} 2',
+                      lines)
+
+    def testWritesATextfile(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'cloud4rpi.prom')
+
+        prometheus.write_textfile(self.metrics, path)
+        with open(path) as f:
+            self.assertEqual(f.read(),
+                             prometheus.format_metrics(self.metrics))
+        self.assertEqual(os.listdir(directory), ['cloud4rpi.prom'])
+
+    def testServesOverHttp(self):
+        server = prometheus.serve(self.metrics, 0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        url = 'http://127.0.0.1:{0}/metrics'.format(server.server_port)
+        response = urlopen(url, timeout=5)
+        self.assertEqual(response.read().decode('utf-8'),
+                         prometheus.format_metrics(self.metrics))
+
+
+class TestDeviceStats(unittest.TestCase):
+    token = '4GPZFMVuacadesU21dBw47zJi'
+
+    def setUp(self):
+        self.client = FakeMqttClient()
+        self.api = create_api(self.client, self.token)
+        self.device = Device(self.api)
+        self.temp = Mock(return_value=36.6)
+        self.device.declare({
+            'Temp': {'type': 'numeric', 'bind': lambda: self.temp()},
+            'LED': {'type': 'bool', 'bind': lambda value: value},
+        })
+
+    def testCountsPublishesAndAcks(self):
+        handle = self.device.publish_data()
+        self.client.ack(handle.mid)
+
+        stats = self.device.stats()
+        self.assertEqual(stats['published_messages'], {'data': 1})
+        self.assertGreater(stats['published_bytes']['data'], 0)
+        self.assertEqual(stats['acks'], {'data': 1})
+        self.assertEqual(stats['ack_latency_seconds']['data']['count'], 1)
+        self.assertEqual(stats['serialize_seconds']['data']['count'], 1)
+        self.assertEqual(stats['read_seconds']['count'], 1)
+        self.assertNotIn('binding_read_seconds', stats)
+
+    def testCountsCommands(self):
+        self.client.deliver(b'{"LED": true}')
+
+        stats = self.device.stats()
+        self.assertEqual(stats['commands'], {'LED': 1})
+        self.assertEqual(stats['published_messages'], {'data/cr': 1})
+
+    def testCountsBindingAndValidationErrors(self):
+        self.temp.side_effect = IOError('sensor unplugged')
+        with self.assertRaises(IOError):
+            self.device.read_data()
+
+        self.temp.side_effect = None
+        self.temp.return_value = 'hot'
+        with self.assertRaises(UnexpectedVariableValueTypeError):
+            self.device.read_data()
+
+        stats = self.device.stats()
+        self.assertEqual(stats['binding_errors'], {'Temp': 1})
+        self.assertEqual(stats['validation_errors'], {'Temp': 1})
+
+    def testTimesBindingsOneByOneWhenProfiled(self):
+        self.device.set_profiling()
+        self.device.read_data()
+
+        stats = self.device.stats()
+        self.assertEqual(stats['read_seconds']['count'], 1)
+        self.assertEqual(
+            stats['binding_read_seconds']['Temp']['count'], 1)
+
+    def testCanBeDisabled(self):
+        self.device.metrics.enabled = False
+        self.device.publish_data()
+
+        self.assertEqual(self.device.stats(), {})
+        self.assertIs(self.device.metrics, self.api.metrics)
+
+
+class TestReconnectMetrics(unittest.TestCase):
+    def testCountsReconnects(self):
+        network = Mock()
+        network.call_later.side_effect = \
+            lambda delay, fn, client=None: fn()
+        metrics = Metrics()
+        supervisor = Supervisor(network, Mock(), lambda attempt: 0, metrics)
+        supervisor.connecting()
+        supervisor.lost()
+
+        self.assertEqual(metrics.stats(), {'reconnects': 1})
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from helpers import FakeMqttClient, create_api
+from cloud4rpi.outbox import Outbox
+from cloud4rpi.handles import STORED, PENDING
+
+
+class OutboxTestCase(unittest.TestCase):
+    def setUp(self):
+        super(OutboxTestCase, self).setUp()
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super(OutboxTestCase, self).tearDown()
+        shutil.rmtree(self.path)
+
+    def segments(self):
+        return sorted(f for f in os.listdir(self.path) if f.endswith('.seg'))
+
+
+class TestOutbox(OutboxTestCase):
+    def testReadsInOrder(self):
+        outbox = Outbox(self.path)
+        for i in range(5):
+            outbox.append('topic', str(i))
+
+        batch = outbox.read_batch()
+        self.assertEqual([p for _, _, p in batch],
+                         [b'0', b'1', b'2', b'3', b'4'])
+        self.assertEqual(batch[0][1], 'topic')
+        self.assertTrue(outbox.is_empty())
+
+    def testReadsInBatches(self):
+        outbox = Outbox(self.path, batch_size=2)
+        for i in range(5):
+            outbox.append('topic', str(i))
+
+        self.assertEqual(len(outbox.read_batch()), 2)
+        self.assertEqual(len(outbox.read_batch()), 2)
+        self.assertEqual(len(outbox.read_batch()), 1)
+        self.assertEqual(outbox.read_batch(), [])
+
+    def testRotatesSegments(self):
+        outbox = Outbox(self.path, segment_size=64)
+        for _ in range(10):
+            outbox.append('topic', 'x' * 50)
+
+        self.assertEqual(len(self.segments()), 10)
+        self.assertEqual(len(outbox.read_batch(100)), 10)
+
+    def testBoundsDiskUsage(self):
+        outbox = Outbox(self.path, segment_size=64, max_size=256)
+        for i in range(10):
+            outbox.append('topic', str(i) * 50)
+
+        self.assertLessEqual(len(self.segments()), 4)
+        batch = outbox.read_batch(100)
+        self.assertEqual(batch[-1][2], b'9' * 50)
+
+    def testSkipsExpiredMessages(self):
+        outbox = Outbox(self.path)
+        outbox.append('topic', 'expired', ttl=-1)
+        outbox.append('topic', 'alive', ttl=60)
+        outbox.append('topic', 'forever')
+
+        batch = outbox.read_batch()
+        self.assertEqual([p for _, _, p in batch], [b'alive', b'forever'])
+
+    def testResumesAfterAcknowledgedMessages(self):
+        outbox = Outbox(self.path)
+        for i in range(3):
+            outbox.append('topic', str(i))
+        batch = outbox.read_batch(2)
+        for key, _, _ in batch:
+            outbox.ack(key)
+        outbox.close()
+
+        outbox = Outbox(self.path)
+        self.assertEqual([p for _, _, p in outbox.read_batch()], [b'2'])
+
+    def testCompactRemovesAcknowledgedSegments(self):
+        outbox = Outbox(self.path, segment_size=64)
+        for _ in range(4):
+            outbox.append('topic', 'x' * 50)
+        batch = outbox.read_batch(3)
+        outbox.compact()
+        self.assertEqual(len(self.segments()), 4)
+
+        for key, _, _ in batch:
+            outbox.ack(key)
+        self.assertEqual(outbox.compact(), 3)
+        self.assertEqual(len(self.segments()), 1)
+        self.assertEqual(len(outbox.read_batch()), 1)
+
+    def testRecoversFromTornWrite(self):
+        outbox = Outbox(self.path)
+        outbox.append('topic', 'complete')
+        outbox.close()
+        with open(os.path.join(self.path, self.segments()[-1]), 'ab') as f:
+            f.write(b'\x00\x01\x02')
+
+        outbox = Outbox(self.path)
+        outbox.append('topic', 'next')
+        self.assertEqual([p for _, _, p in outbox.read_batch()],
+                         [b'complete', b'next'])
+
+    def testKeepsStoringAfterClose(self):
+        outbox = Outbox(self.path)
+        outbox.append('topic', 'before')
+        outbox.close()
+        outbox.append('topic', 'after')
+        self.assertEqual([p for _, _, p in outbox.read_batch()],
+                         [b'before', b'after'])
+
+
+class TestMqttApiOutbox(OutboxTestCase):
+    token = '4GPZFMVuacadesU21dBw47zJi'
+
+    def create_api(self, **kwargs):
+        client = FakeMqttClient()
+        api = create_api(client, self.token,
+                         outbox=Outbox(self.path, **kwargs))
+        return api, client
+
+    def testPublishesDirectlyWhenConnected(self):
+        client, outbox = FakeMqttClient(), Outbox(self.path)
+        api = create_api(client, self.token, outbox=outbox)
+        api.publish_data({'Temp': 1})
+        self.assertEqual(len(client.published), 1)
+        self.assertTrue(outbox.is_empty())
+
+    def testStoresAndReplaysMessagesWhileDisconnected(self):
+        api, client = self.create_api(batch_size=2)
+        client.on_disconnect(client, None, 0)
+
+        for i in range(3):
+            api.publish_data({'Temp': i})
+        api.publish_diag({'Host': 'pi'})
+        self.assertEqual(client.published, [])
+
+        client.reconnect()
+        first = client.ack_all()
+        second = client.ack_all()
+        self.assertEqual(client.ack_all(), [])
+
+        replayed = [json.loads(payload)['payload']
+                    for _, _, payload in first + second]
+        self.assertEqual(replayed, [{'Temp': 0}, {'Temp': 1},
+                                    {'Temp': 2}, {'Host': 'pi'}])
+        self.assertEqual(second[-1][1], api.diag_topic)
+
+    def testStoresMessagesPublishedAfterDisconnect(self):
+        api, client = self.create_api()
+        api.disconnect()
+        client.on_disconnect(client, None, 0)
+        self.assertEqual(api.publish_data({'Temp': 1}).state, STORED)
+
+        api.connect()
+        replayed = [json.loads(payload)['payload']
+                    for _, _, payload in client.ack_all()]
+        self.assertEqual(replayed, [{'Temp': 1}])
+
+    def testKeepsReplayPubacksApartFromLiveOnes(self):
+        api, client = self.create_api()
+        client.on_disconnect(client, None, 0)
+        api.publish_data({'Temp': 0})
+        client.reconnect()
+        publish = client.publish
+
+        def publish_acking_the_replay(*args, **kwargs):
+            client.ack(1)
+            return publish(*args, **kwargs)
+
+        client.publish = publish_acking_the_replay
+        api.publish_data({'Temp': 1})
+        client.publish = publish
+        # paho hands out the same mid again once its counter wraps
+        client.mid = 0
+        handle = api.publish_data({'Temp': 2})
+        self.assertEqual((handle.mid, handle.state), (1, PENDING))
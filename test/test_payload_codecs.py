@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from mock import patch
+
+from cloud4rpi.device import Device
+from cloud4rpi.mqtt_api import MqttApi
+from cloud4rpi.serializer import get_serializer
+from cloud4rpi.payload_codecs import CODECS, Consumer, get_codec
+from cloud4rpi.payload_codecs import pack_msgpack, unpack_msgpack
+
+VALUES = [
+    None, True, False, 0, 1, 127, 128, 255, 256, 65535, 65536, 2 ** 32,
+    2 ** 63, -1, -32, -33, -128, -129, -32768, -32769, -2 ** 31 - 1,
+    -2 ** 63, 36.6, -1e-7, '', 'idle', u'Привет', 'x' * 31, 'x' * 32,
+    'x' * 256, 'x' * 65536, b'\x00\x01', [], [1, 'a', None],
+    list(range(16)), list(range(70000)), {}, {'a': {'b': [1.5]}},
+    {str(i): i for i in range(16)},
+]
+
+
+class TestMsgpack(unittest.TestCase):
+    def testRoundTrip(self):
+        for value in VALUES:
+            self.assertEqual(unpack_msgpack(pack_msgpack(value)), value)
+
+    def testCompactEncoding(self):
+        self.assertEqual(pack_msgpack({'On': True}), b'\x81\xa2On\xc3')
+        self.assertEqual(pack_msgpack(-1), b'\xff')
+        self.assertEqual(pack_msgpack(200), b'\xcc\xc8')
+
+    def testRejectsTrailingData(self):
+        with self.assertRaises(ValueError):
+            unpack_msgpack(pack_msgpack(1) + b'\x00')
+
+
+@patch('cloud4rpi.mqtt_api.mqtt.Client')
+class TestEncodedPublishing(unittest.TestCase):
+    token = '4GPZFMVuacadesU21dBw47zJi'
+
+    def setUp(self):
+        self.consumer = Consumer()
+
+    def create_device(self, codec):
+        api = MqttApi(self.token, serializer=get_serializer('json'),
+                      codec=codec)
+        device = Device(api)
+        device.declare({
+            'Temp': {'type': 'numeric', 'bind': lambda: 36.6},
+            'On': {'type': 'bool', 'bind': lambda: True},
+            'Status': {'type': 'string', 'bind': lambda: u'Ок'},
+        })
+        device.declare_diag({'Host': 'pi', 'Uptime': 42})
+        return device
+
+    def received(self, client):
+        calls = client.return_value.publish.call_args_list
+        return [self.consumer.receive(c[0][0], c[1]['payload'])
+                for c in calls]
+
+    def testRoundTripsThroughConsumer(self, client):
+        client.return_value.publish.return_value = (0, 1)
+        for name in CODECS:
+            for names in (False, True):
+                client.reset_mock()
+                device = self.create_device(get_codec(name, names=names))
+                device.publish_config()
+                device.publish_data()
+                device.publish_diag()
+
+                kinds = [kind for kind, _ in self.received(client)]
+                messages = [msg for _, msg in self.received(client)]
+                self.assertEqual(kinds, ['config', 'data', 'diagnostics'])
+                self.assertEqual(messages[1]['payload'], {
+                    'Temp': 36.6, 'On': True, 'Status': u'Ок'})
+                self.assertEqual(messages[2]['payload'],
+                                 {'Host': 'pi', 'Uptime': 42})
+
+    def testSignalsCodecInTopic(self, client):
+        client.return_value.publish.return_value = (0, 1)
+        device = self.create_device(get_codec('zlib', names=True))
+        device.publish_config()
+        device.publish_data()
+        device.publish_diag()
+
+        topics = [c[0][0] for c in client.return_value.publish.call_args_list]
+        self.assertEqual(topics, [
+            'devices/{0}/config'.format(self.token),
+            'devices/{0}/data/zlib-idx'.format(self.token),
+            'devices/{0}/diagnostics/zlib'.format(self.token),
+        ])
+
+    def testDefaultCodecKeepsPlainTopics(self, client):
+        client.return_value.publish.return_value = (0, 1)
+        device = self.create_device(get_codec('json'))
+        device.publish_data()
+
+        topic = client.return_value.publish.call_args[0][0]
+        self.assertEqual(topic, 'devices/{0}/data'.format(self.token))
+
+    def testSendsNamesUntilConfigIsPublished(self, client):
+        client.return_value.publish.return_value = (0, 1)
+        device = self.create_device(get_codec('msgpack', names=True))
+        device.publish_data()
+
+        topic = client.return_value.publish.call_args[0][0]
+        self.assertEqual(topic, 'devices/{0}/data/msgpack'.format(self.token))
+
+    def testEncodesBatches(self, client):
+        client.return_value.publish.return_value = (0, 1)
+        device = self.create_device(get_codec('msgpack', names=True))
+        device.publish_config()
+        device.set_batching(size=2)
+        device.publish_data()
+        device.publish_data({'Temp': 1})
+
+        _, batch = self.received(client)[-1]
+        self.assertEqual([sample['payload'] for sample in batch], [
+            {'Temp': 36.6, 'On': True, 'Status': u'Ок'}, {'Temp': 1}])
+
+    def testCommandResultsAreNotEncoded(self, client):
+        client.return_value.publish.return_value = (0, 1)
+        api = MqttApi(self.token, codec=get_codec('msgpack'))
+        api.publish_data({'On': True}, data_type='cr')
+
+        topic = client.return_value.publish.call_args[0][0]
+        self.assertEqual(topic, 'devices/{0}/data/cr'.format(self.token))
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import os
+import signal
+import unittest
+from mock import Mock
+
+from helpers import ApiClientMock
+import cloud4rpi
+from cloud4rpi.profiling import BindingProfiler, dump_on_signal
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class TestBindingProfiler(unittest.TestCase):
+    def testKeepsRollingPercentiles(self):
+        profiler = BindingProfiler(window=10)
+        for i in range(100):
+            profiler.record('Temp', i / 1000.0)
+
+        self.assertEqual(profiler.percentile('Temp', .5), .095)
+        self.assertEqual(profiler.percentile('Temp', .99), .099)
+        self.assertEqual(profiler.percentile('Unknown', .5), 0)
+
+    def testReportsTheSlowestFirst(self):
+        profiler = BindingProfiler(budget=.05)
+        profiler.record('Fast', .001)
+        profiler.record('Slow', .1)
+        profiler.record('Slow', .2, IOError('timeout'))
+
+        report = profiler.report()
+        self.assertEqual([row['name'] for row in report], ['Slow', 'Fast'])
+        self.assertEqual(report[0]['calls'], 2)
+        self.assertEqual(report[0]['errors'], 1)
+        self.assertEqual(report[0]['over_budget'], 2)
+        self.assertEqual(profiler.over_budget, ['Slow'])
+
+    def testCallsTheHook(self):
+        profiler = BindingProfiler()
+        profiler.on_binding_timed = Mock()
+        error = IOError('timeout')
+        profiler.record('Temp', .01, error)
+
+        profiler.on_binding_timed.assert_called_once_with('Temp', .01, error)
+
+    @unittest.skipUnless(hasattr(signal, 'SIGUSR1'), 'requires SIGUSR1')
+    def testDumpsTheReportOnSigusr1(self):
+        profiler = BindingProfiler()
+        profiler.record('Temp', .01)
+        stream = StringIO()
+        previous = dump_on_signal(profiler, stream=stream)
+        self.addCleanup(signal.signal, signal.SIGUSR1, previous)
+
+        os.kill(os.getpid(), signal.SIGUSR1)
+        self.assertEqual(stream.getvalue(), profiler.format_report())
+        self.assertIn('Temp', stream.getvalue())
+
+
+class TestDeviceProfiling(unittest.TestCase):
+    def setUp(self):
+        self.api = ApiClientMock()
+        self.device = cloud4rpi.Device(self.api)
+        self.timed = []
+        self.profiler = self.device.set_profiling(budget=1)
+        self.profiler.on_binding_timed = \
+            lambda name, duration, error: self.timed.append((name, error))
+
+    def testTimesEveryKindOfBinding(self):
+        self.device.declare({
+            'Temp': {'type': 'numeric', 'bind': lambda: 36.6},
+            'LED': {'type': 'bool', 'bind': lambda value: value},
+        })
+        self.device.declare_diag({'IP': lambda: '127.0.0.1', 'Host': 'pi'})
+        self.device.read_data()
+        self.device.read_diag()
+        self.api.on_command({'LED': True})
+
+        self.assertEqual(sorted(name for name, _ in self.timed),
+                         ['Host', 'IP', 'LED', 'LED', 'Temp'])
+
+    def testTimesFailingBindings(self):
+        error = IOError('sensor unplugged')
+
+        def read_temp():
+            raise error
+
+        self.device.declare({
+            'Temp': {'type': 'numeric', 'bind': read_temp},
+        })
+        with self.assertRaises(IOError):
+            self.device.read_data()
+
+        self.assertEqual(self.timed, [('Temp', error)])
+
+    def testTimesConcurrentReads(self):
+        self.device.declare({
+            'Temp': {'type': 'numeric', 'bind': lambda: 36.6},
+        })
+        self.device.set_concurrency(workers=2)
+        self.device.read_data()
+
+        self.assertEqual(self.timed, [('Temp', None)])
+
+    def testCanBeTurnedOff(self):
+        self.device.set_profiling(False)
+        self.device.declare({
+            'Temp': {'type': 'numeric', 'bind': lambda: 36.6},
+        })
+        self.device.read_data()
+
+        self.assertIsNone(self.device.profiler)
+        self.assertEqual(self.timed, [])
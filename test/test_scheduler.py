@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from mock import Mock
+
+from helpers import FakeClock
+import cloud4rpi
+from cloud4rpi.scheduler import Scheduler
+from cloud4rpi.scheduler import OVERRUN_SKIP, OVERRUN_CATCH_UP
+from cloud4rpi.scheduler import OVERRUN_COALESCE
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        super(TestScheduler, self).setUp()
+        self.clock = FakeClock()
+        self.scheduler = Scheduler(clock=self.clock, sleep=self.clock.sleep)
+        self.runs = []
+
+    def task(self, name, duration=0, until=None):
+        def fn():
+            self.runs.append((name, self.clock.now))
+            self.clock.now += duration
+            if until is not None and self.clock.now >= until:
+                self.scheduler.stop()
+        return fn
+
+    def testSleepsUntilNextDueTask(self):
+        self.scheduler.add(self.task('data', until=120), 60)
+        self.scheduler.add(self.task('diag'), 90)
+        self.scheduler.run()
+        self.assertEqual(self.runs, [('data', 0), ('diag', 0),
+                                     ('data', 60), ('diag', 90),
+                                     ('data', 120)])
+        self.assertEqual(self.clock.sleeps, [60, 30, 30])
+
+    def testCompensatesForTaskDuration(self):
+        self.scheduler.add(self.task('data', duration=2.5, until=120), 60)
+        self.scheduler.run()
+        self.assertEqual([t for _, t in self.runs], [0, 60, 120])
+
+    def testSkipsMissedRuns(self):
+        self.scheduler.add(self.task('data', duration=25, until=60), 10,
+                           overrun=OVERRUN_SKIP)
+        self.scheduler.run()
+        self.assertEqual([t for _, t in self.runs], [0, 30, 60])
+
+    def testCatchesUpMissedRuns(self):
+        self.scheduler.add(self.task('data', duration=25, until=60), 10,
+                           overrun=OVERRUN_CATCH_UP)
+        self.scheduler.run()
+        self.assertEqual([t for _, t in self.runs], [0, 25, 50])
+
+    def testCoalescesMissedRuns(self):
+        durations = iter([25, 1, 1])
+
+        def fn():
+            self.runs.append(self.clock.now)
+            self.clock.now += next(durations)
+            if len(self.runs) == 3:
+                self.scheduler.stop()
+
+        self.scheduler.add(fn, 10, overrun=OVERRUN_COALESCE)
+        self.scheduler.run()
+        self.assertEqual(self.runs, [0, 25, 35])
+
+    def testRejectsUnknownPolicy(self):
+        with self.assertRaises(ValueError):
+            self.scheduler.add(self.task('data'), 10, overrun='whatever')
+
+    def testReportsStats(self):
+        self.scheduler.add(self.task('data', duration=1, until=120), 60,
+                           name='data')
+        self.scheduler.run()
+        stats = self.scheduler.stats()
+        self.assertEqual(stats['wakeups'], 2)
+        self.assertEqual(stats['tasks']['data']['runs'], 3)
+        self.assertEqual(stats['tasks']['data']['max_lateness'], 0)
+
+    def testRunPublishesDeviceData(self):
+        device = Mock(intervals=[])
+        device.publish_diag.side_effect = self.scheduler.stop
+        cloud4rpi.run(device, data_interval=60, diag_interval=600,
+                      scheduler=self.scheduler)
+        device.publish_data.assert_called_once_with()
+        device.publish_diag.assert_called_once_with()
+
+    def testRunSamplesAggregatedVariables(self):
+        device = Mock(intervals=[])
+        device.publish_data.side_effect = self.scheduler.stop
+        cloud4rpi.run(device, data_interval=60, diag_interval=0,
+                      scheduler=self.scheduler, sample_interval=.1)
+        self.assertEqual(
+            self.scheduler.stats()['tasks']['sample']['runs'], 1)
+
+        device.sampling = False
+        scheduler = Scheduler(clock=self.clock, sleep=self.clock.sleep)
+        device.publish_data.side_effect = scheduler.stop
+        cloud4rpi.run(device, scheduler=scheduler)
+        self.assertNotIn('sample', scheduler.stats()['tasks'])
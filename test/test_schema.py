@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+from mock import Mock, patch
+
+import cloud4rpi
+from cloud4rpi import schema
+
+
+class Sensor(object):
+    def read(self):
+        return 1
+
+    def get(self):
+        return 2
+
+    def update(self, value):
+        return value
+
+
+class TestCompileBinding(unittest.TestCase):
+    def testStrategies(self):
+        sensor = Sensor()
+        self.assertEqual(schema.compile_binding(None), schema.CALL_NONE)
+        self.assertEqual(schema.compile_binding({}), schema.CALL_NONE)
+        self.assertEqual(schema.compile_binding('text'), schema.CALL_STATIC)
+        self.assertEqual(schema.compile_binding(sensor), schema.CALL_READ)
+        self.assertEqual(schema.compile_binding(sensor.get),
+                         schema.CALL_NO_ARGS)
+        self.assertEqual(schema.compile_binding(sensor.update),
+                         schema.CALL_CURRENT)
+        self.assertEqual(schema.compile_binding(lambda: 1),
+                         schema.CALL_NO_ARGS)
+        self.assertEqual(schema.compile_binding(lambda x: x),
+                         schema.CALL_CURRENT)
+
+    def testBuiltinWithoutSignature(self):
+        with patch('cloud4rpi.schema.utils.has_args', side_effect=TypeError):
+            self.assertEqual(schema.compile_binding(time.time),
+                             schema.CALL_NO_ARGS)
+
+
+class TestCompiledDevice(unittest.TestCase):
+    def testIntrospectsBindingsOnlyOnDeclare(self):
+        device = cloud4rpi.Device(Mock())
+        with patch('cloud4rpi.schema.utils.has_args',
+                   return_value=False) as has_args:
+            device.declare({
+                'A': {'type': 'numeric', 'bind': lambda: 1},
+                'B': {'type': 'bool', 'bind': lambda: 0},
+            })
+            for _ in range(3):
+                self.assertEqual(device.read_data(), {'A': 1, 'B': False})
+
+        self.assertEqual(has_args.call_count, 2)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import re
+import json
+import unittest
+from collections import OrderedDict
+from datetime import datetime
+from mock import patch
+
+from cloud4rpi import utils
+from cloud4rpi.serializer import Envelope, SERIALIZERS, FASTEST, \
+    Serializer, get_serializer
+
+PAYLOADS = [
+    {'Temp': 36.6, 'On': True, 'Status': 'idle', 'Nothing': None},
+    {'Pos': {'lat': 37.89, 'lng': 75.43}, 'Big': 1e16, 'Small': 1e-7},
+    {u'Темп': u'Привет', 'Quote': '"\\\n'},
+    [{'name': 'Temp', 'type': 'numeric'}],
+    {},
+]
+
+
+def available_serializers():
+    for name in SERIALIZERS:
+        try:
+            yield get_serializer(name)
+        except ImportError:
+            continue
+
+
+class TestEnvelope(unittest.TestCase):
+    ts = '2020-01-02T03:04:05.678901+00:00'
+
+    def testMatchesSerializedDict(self):
+        for serializer in available_serializers():
+            envelope = Envelope(serializer, OrderedDict([('v', '1.0'),
+                                                         ('l', 'py')]))
+            for payload in PAYLOADS:
+                msg = OrderedDict([('ts', self.ts), ('payload', payload),
+                                   ('v', '1.0'), ('l', 'py')])
+                self.assertEqual(envelope.build(self.ts, payload),
+                                 serializer.dumps(msg),
+                                 serializer.name)
+
+    def testStdlibOutputIsUnchanged(self):
+        envelope = Envelope(get_serializer('json'))
+        for payload in PAYLOADS:
+            msg = {'ts': self.ts, 'payload': payload}
+            self.assertEqual(envelope.build(self.ts, payload),
+                             json.dumps(msg).encode('utf-8'))
+
+    def testStdlibIsTheDefault(self):
+        self.assertEqual(get_serializer().name, 'json')
+
+    def testFastestFallsBackToStdlib(self):
+        def missing():
+            raise ImportError()
+
+        with patch.dict(SERIALIZERS, {'orjson': missing,
+                                      'rapidjson': missing,
+                                      'ujson': missing}):
+            self.assertEqual(get_serializer(FASTEST).name, 'json')
+
+    def testFastestPicksAnInstalledBackend(self):
+        with patch.dict(SERIALIZERS, {
+                'orjson': lambda: Serializer('orjson', None)}):
+            self.assertEqual(get_serializer(FASTEST).name, 'orjson')
+
+
+class TestUtcNow(unittest.TestCase):
+    def testIsoFormatInUtc(self):
+        ts = utils.utcnow()
+        self.assertTrue(re.match(
+            r'^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(\.\d{6})?\+00:00$', ts))
+
+    def testMatchesAwareIsoFormat(self):
+        moments = [datetime(2020, 1, 2, 3, 4, 5, 678901),
+                   datetime(2020, 1, 2, 3, 4, 5)]
+        for moment in moments:
+            with patch('cloud4rpi.utils.datetime') as dt:
+                dt.utcnow.return_value = moment
+                self.assertEqual(
+                    utils.utcnow(),
+                    moment.replace(tzinfo=utils.UtcTzInfo()).isoformat())
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import signal
+import threading
+import unittest
+import multiprocessing
+
+if sys.version_info < (3, 4):
+    raise unittest.SkipTest('ShardedFleet requires Python 3.4+')
+
+from helpers import wait_for
+from benchmarks.broker import Broker
+from benchmarks.common import device_token
+from cloud4rpi.sharding import ShardedFleet, Worker, shard_of
+from cloud4rpi.scheduler import OVERRUN_SKIP
+
+DEVICES = 8
+WORKERS = 2
+TIMEOUT = 20  # sec
+
+
+def setup_device(device, token):
+    device.declare({'Temp': {'type': 'numeric', 'bind': lambda: 36.6}})
+
+
+class TestShardOf(unittest.TestCase):
+    def testIsStableAndSpread(self):
+        tokens = [device_token(i) for i in range(1000)]
+        shards = [shard_of(token, 4) for token in tokens]
+        self.assertEqual(shards, [shard_of(token, 4) for token in tokens])
+        for shard in range(4):
+            self.assertGreater(shards.count(shard), 150)
+
+
+class TestWorker(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker().start()
+        self.parent, child = multiprocessing.Pipe()
+        self.worker = Worker(0, child, {
+            'host': '127.0.0.1',
+            'port': self.broker.port,
+            'tls_config': None,
+            'setup': setup_device,
+            'max_in_flight': None,
+        })
+        self.serving = threading.Thread(target=self.worker.serve)
+
+    def tearDown(self):
+        self.parent.send(('stop',))
+        self.serving.join(TIMEOUT)
+        self.broker.stop()
+
+    def serve(self):
+        self.serving.start()
+
+    def received(self, count):
+        # Messages end with the worker stats, left out here
+        return sorted(self.parent.recv()[:-1] for _ in range(count))
+
+    def testAddingDevicesDoesNotHoldUpTheWorker(self):
+        self.worker.add([device_token(0)])
+        self.serve()
+        self.assertEqual(self.received(1), [('ready', device_token(0))])
+
+        # The new device cannot connect, the others keep publishing
+        self.broker.refuse = True
+        self.broker.connack_delay = .5
+        self.parent.send(('add', [device_token(1)]))
+        self.parent.send(('publish', device_token(0), 'publish_diag',
+                          ({'Host': 'pi'},), {}))
+        self.assertTrue(wait_for(lambda: self.broker.messages, .4))
+        self.assertEqual(self.received(1),
+                         [('refused', device_token(1), 5)])
+
+    def testDevicesJoinOneByOne(self):
+        tokens = [device_token(i) for i in range(3)]
+        self.broker.refuse = {tokens[1]}
+        self.worker.add(tokens)
+        self.serve()
+        self.assertEqual(self.received(3), [('ready', tokens[0]),
+                                            ('ready', tokens[2]),
+                                            ('refused', tokens[1], 5)])
+
+        self.parent.send(('schedule', .1, None, OVERRUN_SKIP))
+        self.assertTrue(wait_for(lambda: self.broker.messages >= 2))
+
+    def testSurvivesABadMessage(self):
+        self.worker.add([device_token(0)])
+        self.serve()
+        self.received(1)
+
+        self.parent.send(('publish', device_token(1), 'publish_diag',
+                          ({'Host': 'pi'},), {}))
+        self.parent.send(('publish', device_token(0), 'publish_diag',
+                          ({'Host': 'pi'},), {}))
+        self.assertTrue(wait_for(lambda: self.broker.messages))
+        self.assertTrue(self.serving.is_alive())
+
+
+class ShardedFleetTestCase(unittest.TestCase):
+    setup = None
+
+    def setUp(self):
+        self.broker = Broker().start()
+        self.received = []
+        self.broker.on_message = \
+            lambda client, topic, payload: self.received.append(topic)
+        self.tokens = [device_token(i) for i in range(DEVICES)]
+        self.fleet = ShardedFleet('127.0.0.1', self.broker.port,
+                                  workers=WORKERS, setup=self.setup)
+
+    def tearDown(self):
+        self.fleet.stop()
+        self.broker.stop()
+
+    def published(self, kind='data'):
+        return set(topic.split('/')[1] for topic in self.received
+                   if topic.split('/')[2] == kind)
+
+
+class TestBindingsInParent(ShardedFleetTestCase):
+    def setUp(self):
+        super(TestBindingsInParent, self).setUp()
+        self.commands = []
+        for token in self.tokens:
+            self.fleet.add(token).declare({
+                'Temp': {'type': 'numeric', 'bind': lambda: 36.6},
+                'LED': {'type': 'bool', 'bind': self.commands.append},
+            })
+
+    def testPublishesThroughWorkers(self):
+        self.assertEqual(self.fleet.start(TIMEOUT), DEVICES)
+        for device in self.fleet.devices:
+            device.publish_data()
+
+        self.assertTrue(wait_for(
+            lambda: self.published() == set(self.tokens)))
+
+    def testPublishesDevicesAddedAfterStart(self):
+        self.fleet.start(TIMEOUT)
+        token = device_token(DEVICES)
+        self.fleet.add(token).declare({
+            'Temp': {'type': 'numeric', 'bind': lambda: 36.6},
+        })
+        self.assertTrue(wait_for(
+            lambda: self.fleet.stats()['connected'] == DEVICES + 1))
+        self.fleet[token].publish_data()
+
+        self.assertTrue(wait_for(lambda: self.published() == {token}))
+
+    def testRoutesCommandsBackToTheParent(self):
+        self.fleet.start(TIMEOUT)
+        token = self.tokens[5]
+        topic = 'devices/{0}/commands'.format(token)
+        self.assertTrue(wait_for(lambda: self.broker.subscribers(topic)))
+        self.broker.publish(topic, json.dumps({'LED': True}).encode())
+
+        self.assertTrue(wait_for(lambda: self.commands == [True]))
+        self.assertTrue(wait_for(lambda: self.received))
+        self.assertEqual(self.received,
+                         ['devices/{0}/data/cr'.format(token)])
+
+
+class TestBindingsInWorkers(ShardedFleetTestCase):
+    setup = staticmethod(setup_device)
+
+    def setUp(self):
+        super(TestBindingsInWorkers, self).setUp()
+        for token in self.tokens:
+            self.fleet.add(token)
+
+    def run_fleet(self):
+        thread = threading.Thread(target=self.fleet.run,
+                                  kwargs={'data_interval': .2,
+                                          'diag_interval': None})
+        thread.daemon = True
+        thread.start()
+
+    def testStartsWithoutWaitingForRefusedDevices(self):
+        self.broker.refuse = {self.tokens[0]}
+        start = time.time()
+        self.assertEqual(self.fleet.start(TIMEOUT), DEVICES - 1)
+        self.assertLess(time.time() - start, TIMEOUT / 2)
+        self.assertEqual(self.fleet.stats()['refused'], [self.tokens[0]])
+
+    def testSchedulesDevicesInWorkers(self):
+        self.assertEqual(self.fleet.start(TIMEOUT), DEVICES)
+        self.run_fleet()
+
+        self.assertTrue(wait_for(
+            lambda: self.published() == set(self.tokens)))
+        self.assertTrue(wait_for(
+            lambda: self.fleet.stats()['published'] >= DEVICES))
+
+    def testMovesDevicesOfADeadWorker(self):
+        self.fleet.start(TIMEOUT)
+        self.run_fleet()
+        shards = self.fleet.stats()['shards']
+        victim = max(shards, key=lambda s: s['devices'])
+        os.kill(victim['pid'], signal.SIGTERM)
+
+        self.assertTrue(wait_for(
+            lambda: self.fleet.rebalanced == victim['devices']))
+        self.assertTrue(wait_for(
+            lambda: self.fleet.stats()['connected'] == DEVICES))
+        del self.received[:]
+        self.assertTrue(wait_for(
+            lambda: self.published() == set(self.tokens)))
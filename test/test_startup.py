@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import json
+import logging
+import unittest
+import subprocess
+from mock import Mock
+
+import cloud4rpi
+from cloud4rpi import utils
+from cloud4rpi import mqtt_api
+from cloud4rpi.errors import get_error_message, InvalidTokenError
+
+DEFERRED_MODULES = [
+    'paho.mqtt.client',
+    'ssl',
+    'logging.handlers',
+    'subprocess',
+    'inspect',
+    'cloud4rpi.mqtt_api',
+]
+
+
+def loaded_on_import(modules):
+    script = 'import sys, json; import cloud4rpi; ' \
+             'print(json.dumps([m for m in {0!r} if m in sys.modules]))' \
+             .format(modules)
+    out = subprocess.check_output([sys.executable, '-c', script])
+    return json.loads(out.decode('utf-8'))
+
+
+def handlers_on_import():
+    script = 'import logging; import cloud4rpi; ' \
+             'print(len(logging.getLogger("{0}").handlers))' \
+             .format(cloud4rpi.loggerName)
+    return int(subprocess.check_output([sys.executable, '-c', script]))
+
+
+class TestLazyImports(unittest.TestCase):
+    def testImportDefersTheTransport(self):
+        self.assertEqual(loaded_on_import(DEFERRED_MODULES), [])
+
+    def testNoLogHandlerIsAddedOnImport(self):
+        self.assertEqual(handlers_on_import(), 0)
+
+    def testLoadsAttributesOnFirstUse(self):
+        self.assertIs(cloud4rpi.MqttApi, mqtt_api.MqttApi)
+        self.assertEqual(cloud4rpi.CONNECT_TIMEOUT, mqtt_api.CONNECT_TIMEOUT)
+
+    def testRaisesOnUnknownAttributes(self):
+        with self.assertRaises(AttributeError):
+            cloud4rpi.NoSuchAttribute  # pylint: disable=W0104
+
+    def testAddsTheConsoleHandlerOnFirstUse(self):
+        log = logging.getLogger(cloud4rpi.loggerName)
+        root = logging.getLogger()
+        for logger in (log, root):
+            self.addCleanup(setattr, logger, 'handlers',
+                            list(logger.handlers))
+            logger.handlers = []
+        device = Mock(sampling=False, intervals=[])
+        cloud4rpi.run(device, scheduler=Mock())
+        self.assertEqual(len(log.handlers), 1)
+        # Not twice, nor when the application configured logging itself
+        cloud4rpi.run(device, scheduler=Mock())
+        self.assertEqual(len(log.handlers), 1)
+
+
+class TestErrorMessages(unittest.TestCase):
+    def testCalledProcessError(self):
+        e = subprocess.CalledProcessError(1, 'cmd')
+        self.assertEqual(get_error_message(e), 'Try run with sudo')
+
+    def testUnexpectedError(self):
+        self.assertEqual(get_error_message(ValueError('x')),
+                         "Unexpected error: ValueError('x')")
+
+
+class TestTokenValidation(unittest.TestCase):
+    def testAcceptsValidTokens(self):
+        utils.guard_against_invalid_token('4GPZFMVuacadesU21dBw47zJi')
+
+    def testRejectsInvalidTokens(self):
+        for token in ['', '4GPZFMVuacadesU21dBw4',
+                      '0GPZFMVuacadesU21dBw47zJi']:
+            with self.assertRaises(InvalidTokenError):
+                utils.guard_against_invalid_token(token)
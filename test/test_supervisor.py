@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import unittest
+from mock import Mock
+
+if sys.version_info < (3, 4):
+    raise unittest.SkipTest('The stand-in broker requires Python 3.4+')
+
+from benchmarks.broker import Broker
+from cloud4rpi.mqtt_api import MqttApi
+from cloud4rpi.supervisor import Supervisor, \
+    CONNECTING, CONNECTED, BACKOFF, CLOSED
+
+TOKEN = '4GPZFMVuacadesU21dBw47zJi'
+TIMEOUT = 10  # sec
+
+
+class FakeNetwork(object):
+    def __init__(self):
+        self.calls = []
+
+    def call_later(self, delay, fn, client=None):
+        self.calls.append((delay, fn))
+
+    def run_next(self):
+        _, fn = self.calls.pop(0)
+        fn()
+
+
+class TestSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.network = FakeNetwork()
+        self.client = Mock()
+        self.states = []
+        self.supervisor = Supervisor(self.network, self.client,
+                                     policy=lambda attempt: attempt + 1)
+        self.supervisor.on_state = self.states.append
+
+    def testSchedulesRetriesWithThePolicy(self):
+        self.supervisor.connecting()
+        self.supervisor.connected()
+        self.supervisor.lost()
+
+        self.assertEqual(self.supervisor.state, BACKOFF)
+        self.assertEqual([d for d, _ in self.network.calls], [1])
+        self.client.reconnect.assert_not_called()
+
+        self.network.run_next()
+        self.client.reconnect.assert_called_once_with()
+        self.assertEqual(self.states,
+                         [CONNECTING, CONNECTED, BACKOFF, CONNECTING])
+        self.assertEqual(self.supervisor.reconnects, 1)
+
+    def testBacksOffFurtherAfterFailedAttempts(self):
+        self.client.reconnect.side_effect = IOError('refused')
+        self.supervisor.connecting()
+        self.supervisor.lost()
+        self.network.run_next()
+        self.network.run_next()
+
+        self.assertEqual([d for d, _ in self.network.calls], [3])
+        self.assertEqual(self.supervisor.state, BACKOFF)
+
+    def testResetsTheBackoffOnceConnected(self):
+        self.supervisor.connecting()
+        self.supervisor.lost()
+        self.network.run_next()
+        self.supervisor.connected()
+        self.supervisor.lost()
+
+        self.assertEqual([d for d, _ in self.network.calls], [1])
+
+    def testDoesNotRetryOnceClosed(self):
+        self.supervisor.connecting()
+        self.supervisor.lost()
+        self.supervisor.close()
+        self.network.run_next()
+        self.supervisor.lost()
+
+        self.client.reconnect.assert_not_called()
+        self.assertEqual(self.network.calls, [])
+        self.assertEqual(self.supervisor.state, CLOSED)
+
+
+class TestBrokerBounce(unittest.TestCase):
+    def setUp(self):
+        self.broker = Broker().start()
+        self.port = self.broker.port
+        self.received = []
+        self.api = MqttApi(TOKEN, '127.0.0.1', self.port,
+                           reconnect_policy=lambda attempt: .1)
+        self.states = []
+        self.api.supervisor.on_state = \
+            lambda state: self.states.append((time.time(), state))
+        self.api.connect(TIMEOUT)
+
+    def tearDown(self):
+        self.api.disconnect()
+        self.broker.stop()
+
+    def bounce(self, downtime):
+        self.broker.stop()
+        time.sleep(downtime)
+        self.broker = Broker(port=self.port).start()
+        self.broker.on_message = \
+            lambda client, topic, payload: self.received.append(topic)
+        return time.time()
+
+    def testRecoversAfterABrokerBounce(self):
+        restarted = self.bounce(.3)
+
+        self.assertTrue(self.api.supervisor.wait_for(CONNECTED, TIMEOUT))
+        recovered = [t for t, s in self.states if s == CONNECTED][-1]
+        self.assertLess(recovered - restarted, 1)
+        self.assertIn(BACKOFF, [s for _, s in self.states])
+        self.assertGreater(self.api.supervisor.reconnects, 1)
+
+    def testQueuesPublishesWhileDisconnected(self):
+        self.broker.stop()
+        self.assertTrue(self.api.supervisor.wait_for(BACKOFF, TIMEOUT))
+        start = time.time()
+        self.api.publish_data({'Temp': 36.6})
+        self.assertLess(time.time() - start, .1)
+
+        self.bounce(0)
+        self.assertTrue(self.api.supervisor.wait_for(CONNECTED, TIMEOUT))
+        deadline = time.time() + TIMEOUT
+        while not self.received and time.time() < deadline:
+            time.sleep(.01)
+        self.assertEqual(self.received, [self.api.data_topic])
+
+    def testDisconnectsCleanlyWhileBackingOff(self):
+        self.api.disconnect()
+        self.api = MqttApi(TOKEN, '127.0.0.1', self.port,
+                           reconnect_policy=lambda attempt: 60)
+        self.api.connect(TIMEOUT)
+        self.broker.drop_connections()
+        self.assertTrue(self.api.supervisor.wait_for(BACKOFF, TIMEOUT))
+
+        start = time.time()
+        self.api.disconnect()
+        self.assertLess(time.time() - start, 2)
+        self.assertEqual(self.api.supervisor.state, CLOSED)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import threading
+import unittest
+
+from helpers import FakeMqttClient, create_api
+from cloud4rpi.window import InFlightWindow, SEND, HELD, DROPPED, \
+    WINDOW_BLOCK, WINDOW_DROP_NEWEST, WINDOW_DROP_OLDEST, WINDOW_COALESCE
+
+
+class TestInFlightWindow(unittest.TestCase):
+    def fill(self, window):
+        for mid in range(window.size):
+            self.assertEqual(window.admit('t', mid), SEND)
+            window.sent(mid)
+
+    def testBlocksUntilAPubackFreesASlot(self):
+        window = InFlightWindow(2)
+        self.fill(window)
+        threading.Timer(.05, window.acked, (0,)).start()
+
+        self.assertEqual(window.admit('t', 'm', timeout=1), SEND)
+        self.assertEqual(len(window), 2)
+
+    def testDropsOnBlockTimeout(self):
+        window = InFlightWindow(1, timeout=.05)
+        self.fill(window)
+
+        self.assertEqual(window.admit('t', 'm'), DROPPED)
+        self.assertEqual(window.stats()['timeouts'], 1)
+        self.assertEqual(window.stats()['dropped'], 1)
+
+    def testDropsNewest(self):
+        window = InFlightWindow(1, WINDOW_DROP_NEWEST)
+        self.fill(window)
+
+        self.assertEqual(window.admit('t', 'm'), DROPPED)
+        self.assertEqual(window.acked(0), None)
+        self.assertEqual(window.admit('t', 'm'), SEND)
+
+    def testDropsOldestHeld(self):
+        window = InFlightWindow(1, WINDOW_DROP_OLDEST, max_held=2)
+        self.fill(window)
+        for message in ('a', 'b', 'c'):
+            self.assertEqual(window.admit('t', message), HELD)
+
+        self.assertEqual(window.stats()['dropped'], 1)
+        self.assertEqual(window.acked(0), ('t', 'b', None))
+        window.sent(1)
+        self.assertEqual(window.acked(1), ('t', 'c', None))
+
+    def testCoalescesByTopic(self):
+        window = InFlightWindow(1, WINDOW_COALESCE, max_held=2)
+        self.fill(window)
+        window.admit('a', 1)
+        window.admit('b', 1)
+        window.admit('a', 2)
+
+        self.assertEqual(window.stats()['coalesced'], 1)
+        self.assertEqual(window.held, 2)
+        self.assertEqual(window.acked(0), ('a', 2, None))
+
+    def testHoldsWhenItMustNotBlock(self):
+        window = InFlightWindow(1, timeout=5)
+        self.fill(window)
+
+        self.assertEqual(window.admit('t', 'm', block=False), HELD)
+        self.assertEqual(window.acked(0), ('t', 'm', None))
+
+    def testChoosesThePolicyPerCall(self):
+        window = InFlightWindow(1)
+        self.fill(window)
+
+        self.assertEqual(window.admit('t', 'm', WINDOW_DROP_OLDEST), HELD)
+        self.assertEqual(window.admit('t', 'm', timeout=0), DROPPED)
+
+    def testRejectsUnknownPolicies(self):
+        with self.assertRaises(ValueError):
+            InFlightWindow(1, 'unknown')
+
+
+class TestMqttApiWindow(unittest.TestCase):
+    token = '4GPZFMVuacadesU21dBw47zJi'
+
+    def create_api(self, policy):
+        client = FakeMqttClient()
+        api = create_api(client, self.token,
+                         window=InFlightWindow(2, policy))
+        return api, client
+
+    def values(self, client):
+        return [json.loads(payload)['payload']['Temp']
+                for _, _, payload in client.published]
+
+    def testSendsHeldMessagesAsPubacksArrive(self):
+        api, client = self.create_api(WINDOW_COALESCE)
+        for i in range(5):
+            api.publish_data({'Temp': i})
+        self.assertEqual(self.values(client), [0, 1])
+
+        client.ack(1)
+        self.assertEqual(self.values(client), [0, 1, 4])
+        self.assertEqual(api.window.stats()['coalesced'], 2)
+
+    def testPolicyCanBeChosenPerPublish(self):
+        api, client = self.create_api(WINDOW_COALESCE)
+        for i in range(3):
+            api.publish_data({'Temp': i}, policy=WINDOW_DROP_NEWEST)
+
+        self.assertEqual(self.values(client), [0, 1])
+        self.assertEqual(api.window.stats(), {
+            'size': 2, 'in_flight': 2, 'held': 0,
+            'dropped': 1, 'coalesced': 0, 'timeouts': 0})
+
+    def testKeepsOnlyAHandlePerInFlightMessage(self):
+        api = self.create_api(WINDOW_DROP_NEWEST)[0]
+        handle = api.publish_data({'Temp': 1})
+
+        self.assertEqual((api.in_flight, handle.mid), (1, 1))
+        self.assertFalse(hasattr(handle, '__dict__'))
+
+    def testResolvesHandlesOfDroppedMessages(self):
+        api = self.create_api(WINDOW_COALESCE)[0]
+        handles = [api.publish_data({'Temp': i}) for i in range(4)]
+
+        self.assertEqual([h.state for h in handles],
+                         ['pending', 'pending', 'dropped', 'pending'])
+
+    def testBlockedPublishWaitsForAPuback(self):
+        api, client = self.create_api(WINDOW_BLOCK)
+        api.publish_data({'Temp': 0})
+        api.publish_data({'Temp': 1})
+        threading.Timer(.05, client.ack, (1,)).start()
+
+        start = time.time()
+        api.publish_data({'Temp': 2}, timeout=1)
+        self.assertGreaterEqual(time.time() - start, .04)
+        self.assertEqual(self.values(client), [0, 1, 2])